@@ -9,6 +9,7 @@ except DistributionNotFound:
 
 __license__ = 'Apache 2.0'
 
+import collections
 import diskcache
 import errno
 import getpass
@@ -22,8 +23,10 @@ import requests
 import shutil
 import six
 import tempfile
+import threading
 
 from contextlib import contextmanager
+from .transfer import TransferEngine, downloadKey, uploadKey
 
 DEFAULT_PAGE_LIMIT = 20000  # Number of results to fetch per request
 REQ_BUFFER_SIZE = 65536  # Chunk size when iterating a download body
@@ -136,6 +139,8 @@ class GirderClient(object):
 
     # The current maximum chunk size for uploading file chunks
     MAX_CHUNK_SIZE = 1024 * 1024 * 64
+    # Size of the parts sent concurrently by uploads inside transfers()
+    PART_SIZE = 1024 * 1024 * 16
 
     DEFAULT_API_ROOT = 'api/v1'
     DEFAULT_HOST = 'localhost'
@@ -235,7 +240,18 @@ class GirderClient(object):
             progressReporterCls = _NoopProgressReporter
 
         self.progressReporterCls = progressReporterCls
-        self._session = None
+        self._local = threading.local()
+        self._engine = None
+
+    @property
+    def _session(self):
+        # Each thread has its own session, so that transfers running
+        # concurrently do not share a connection.
+        return getattr(self._local, 'session', None)
+
+    @_session.setter
+    def _session(self, session):
+        self._local.session = session
 
     @contextmanager
     def session(self, session=None):
@@ -269,6 +285,50 @@ class GirderClient(object):
         self._session.close()
         self._session = None
 
+    @contextmanager
+    def transfers(self, jobs=None, journal=None):
+        """
+        Run the uploads and downloads started in the block concurrently, and
+        wait for them at its end.
+
+        .. code-block:: python
+
+            with gc.transfers(jobs=8, journal='export.journal'):
+                gc.downloadResource(collectionId, 'export', 'collection')
+
+        Folders are listed on the calling thread, a page ahead, while up to
+        ``jobs`` files are transferred. Large files are uploaded in parts
+        sent concurrently if the server supports it. With a ``journal``,
+        running the same transfer again after an interruption skips the
+        files it completed, finishes the uploads it started from the parts
+        the server received, and resumes partial downloads.
+
+        :param jobs: Number of files transferred at once.
+        :type jobs: int
+        :param journal: Path of the file recording the transfers' progress.
+        :type journal: str
+        :returns: the :py:class:`girder_client.transfer.TransferEngine`, or
+            None if there is a single job and no journal, in which case
+            transfers run as they do outside the block.
+        """
+        if (jobs or 1) <= 1 and not journal:
+            yield None
+            return
+
+        engine = TransferEngine(self, jobs or 1, journal)
+        progressReporterCls = self.progressReporterCls
+        if engine.jobs > 1:
+            # Progress bars of concurrent transfers would overwrite each other.
+            self.progressReporterCls = _NoopProgressReporter
+        self._engine = engine
+        try:
+            yield engine
+            engine.wait()
+        finally:
+            self._engine = None
+            self.progressReporterCls = progressReporterCls
+            engine.shutdown()
+
     def authenticate(self, username=None, password=None, interactive=False, apiKey=None):
         """
         Authenticate to Girder, storing the token that comes back to be used in
@@ -470,7 +530,7 @@ class GirderClient(object):
             **kwargs)
 
         # If success, return the json object. Otherwise throw an exception.
-        if result.status_code in (200, 201):
+        if result.status_code in (200, 201, 206):
             if jsonResp:
                 return result.json()
             else:
@@ -851,6 +911,11 @@ class GirderClient(object):
         filepath = os.path.abspath(filepath)
         filesize = os.path.getsize(filepath)
 
+        journalKey = self._uploadJournalKey(filepath, 'item', itemId)
+        resumed = self._resumeUpload(journalKey, filepath, filesize, progressCallback)
+        if resumed is not None:
+            return resumed
+
         # Check if the file already exists by name and size in the file.
         fileId, current = self.isFileCurrent(itemId, filename, filepath)
         if fileId is not None and current:
@@ -884,6 +949,8 @@ class GirderClient(object):
             }
             if reference:
                 params['reference'] = reference
+            if self._sendsParts(filesize):
+                params['partSize'] = self.PART_SIZE
             obj = self.post('file', params)
             if '_id' not in obj:
                 raise Exception(
@@ -891,7 +958,8 @@ class GirderClient(object):
                     'an object with an id. Got instead: ' + json.dumps(obj))
 
         with open(filepath, 'rb') as f:
-            return self._uploadContents(obj, f, filesize, progressCallback=progressCallback)
+            return self._uploadContents(
+                obj, f, filesize, progressCallback=progressCallback, journalKey=journalKey)
 
     def uploadStreamToFolder(self, folderId, stream, filename, size, reference=None, mimeType=None,
                              progressCallback=None):
@@ -912,6 +980,11 @@ class GirderClient(object):
             with progress information. It passes a single positional argument
             to the callable which is a dict of information about progress.
         """
+        return self._uploadStreamToFolder(
+            folderId, stream, filename, size, reference, mimeType, progressCallback)
+
+    def _uploadStreamToFolder(self, folderId, stream, filename, size, reference=None,
+                              mimeType=None, progressCallback=None, journalKey=None):
         params = {
             'parentType': 'folder',
             'parentId': folderId,
@@ -923,13 +996,18 @@ class GirderClient(object):
         if reference:
             params['reference'] = reference
 
-        if size <= self.MAX_CHUNK_SIZE and self.getServerVersion() >= ['2', '3']:
+        if self._sendsParts(size):
+            params['partSize'] = self.PART_SIZE
+        elif size <= self.MAX_CHUNK_SIZE and self.getServerVersion() >= ['2', '3']:
             chunk = stream.read(size)
             if isinstance(chunk, six.text_type):
                 chunk = chunk.encode('utf8')
             with self.progressReporterCls(label=filename, length=size) as reporter:
-                return self.post(
+                file = self.post(
                     'file', params, data=_ProgressBytesIO(chunk, reporter=reporter))
+            if journalKey is not None:
+                self._engine.journal.set(journalKey, fileId=file['_id'])
+            return file
 
         obj = self.post('file', params)
 
@@ -938,7 +1016,8 @@ class GirderClient(object):
                 'After creating an upload token for a new file, expected '
                 'an object with an id. Got instead: ' + json.dumps(obj))
 
-        return self._uploadContents(obj, stream, size, progressCallback=progressCallback)
+        return self._uploadContents(
+            obj, stream, size, progressCallback=progressCallback, journalKey=journalKey)
 
     def uploadFileToFolder(self, folderId, filepath, reference=None, mimeType=None, filename=None,
                            progressCallback=None):
@@ -970,11 +1049,101 @@ class GirderClient(object):
             # Attempt to guess MIME type if not passed explicitly
             mimeType, _ = mimetypes.guess_type(filepath)
 
+        journalKey = self._uploadJournalKey(filepath, 'folder', folderId)
+        resumed = self._resumeUpload(journalKey, filepath, filesize, progressCallback)
+        if resumed is not None:
+            return resumed
+
+        with open(filepath, 'rb') as f:
+            return self._uploadStreamToFolder(
+                folderId, f, filename, filesize, reference, mimeType, progressCallback,
+                journalKey=journalKey)
+
+    def _sendsParts(self, size):
+        """
+        Whether a file of this size is uploaded in parts sent concurrently.
+        """
+        return self._engine is not None and size > self.PART_SIZE
+
+    def _uploadJournalKey(self, filepath, parentType, parentId):
+        if self._engine is None or self._engine.journal is None:
+            return None
+        return uploadKey(filepath, parentType, parentId)
+
+    def _resumeUpload(self, journalKey, filepath, size, progressCallback=None):
+        """
+        Finish the upload of a local file that the journal of the current
+        transfers records as started.
+
+        :returns: the uploaded file, or None if it was neither completed nor
+            started in parts, or the server no longer has its upload.
+        """
+        record = self._engine.journal.get(journalKey) if journalKey is not None else None
+        if record is None:
+            return None
+        if record.get('fileId'):
+            return self.getFile(record['fileId'])
+        try:
+            received = self.get('file/offset', {'uploadId': record['uploadId']})['parts']
+        except (requests.HTTPError, KeyError):
+            return None
+        uploadObj = {'_id': record['uploadId'], 'partSize': record['partSize'],
+                     'name': os.path.basename(filepath)}
         with open(filepath, 'rb') as f:
-            return self.uploadStreamToFolder(folderId, f, filename, filesize, reference, mimeType,
-                                             progressCallback)
+            return self._uploadParts(
+                uploadObj, f, size, progressCallback=progressCallback,
+                journalKey=journalKey, received=received)
+
+    def _uploadParts(self, uploadObj, stream, size, progressCallback=None, journalKey=None,
+                     received=()):
+        """
+        Uploads the contents of a file in parts sent concurrently, then
+        completes the upload.
 
-    def _uploadContents(self, uploadObj, stream, size, progressCallback=None):
+        :param received: Numbers of the parts the server already has.
+        """
+        uploadId = uploadObj['_id']
+        partSize = uploadObj['partSize']
+        journal = self._engine.journal if journalKey is not None else None
+        if journal is not None:
+            journal.set(journalKey, uploadId=uploadId, partSize=partSize)
+
+        received = set(received)
+        lock = threading.Lock()
+        progress = {'current': min(len(received) * partSize, size), 'total': size}
+
+        def parts():
+            for part in range((size + partSize - 1) // partSize):
+                if part in received:
+                    if getattr(stream, 'seekable', lambda: False)():
+                        stream.seek((part + 1) * partSize)
+                    else:
+                        stream.read(partSize)
+                    continue
+                data = stream.read(partSize)
+                if isinstance(data, six.text_type):
+                    data = data.encode('utf8')
+                yield part, data
+
+        def sendPart(part, data):
+            self.post('file/chunk', parameters={'uploadId': uploadId, 'part': part}, data=data)
+            if callable(progressCallback):
+                with lock:
+                    progress['current'] += len(data)
+                    progressCallback(dict(progress))
+
+        try:
+            self._engine.sendParts(sendPart, parts())
+            file = self.post('file/completion', parameters={'uploadId': uploadId})
+        except Exception:
+            if journal is None:
+                self.delete('file/upload/' + uploadId)
+            raise
+        if journal is not None:
+            journal.set(journalKey, fileId=file['_id'])
+        return file
+
+    def _uploadContents(self, uploadObj, stream, size, progressCallback=None, journalKey=None):
         """
         Uploads contents of a file.
 
@@ -990,7 +1159,15 @@ class GirderClient(object):
             with progress information. It passes a single positional argument
             to the callable which is a dict of information about progress.
         :type progressCallback: callable
+        :param journalKey: Key of the upload in the journal of the current
+            transfers.
+        :type journalKey: str
         """
+        if uploadObj.get('partSize'):
+            return self._uploadParts(
+                uploadObj, stream, size, progressCallback=progressCallback,
+                journalKey=journalKey)
+
         offset = 0
         uploadId = uploadObj['_id']
 
@@ -1028,6 +1205,8 @@ class GirderClient(object):
                 'Expected upload to be %d bytes, but received %d.' % (size, offset),
                 upload=uploadObj)
 
+        if journalKey is not None:
+            self._engine.journal.set(journalKey, fileId=uploadObj['_id'])
         return uploadObj
 
     def uploadFile(self, parentId, stream, name, size, parentType='item',
@@ -1067,6 +1246,8 @@ class GirderClient(object):
         }
         if reference is not None:
             params['reference'] = reference
+        if self._sendsParts(size):
+            params['partSize'] = self.PART_SIZE
         obj = self.post('file', params)
         if '_id' not in obj:
             raise Exception(
@@ -1154,16 +1335,56 @@ class GirderClient(object):
             # assume `path` is a file-like object
             shutil.copyfileobj(fp, path)
 
-    def _streamingFileDownload(self, fileId):
+    def _streamingFileDownload(self, fileId, offset=0):
         """
         Download a file streaming the contents
 
         :param fileId: The ID of the Girder file to download.
+        :param offset: The byte of the file to start from.
 
         :returns: The request
         """
         path = 'file/%s/download' % fileId
-        return self.sendRestRequest('get', path, stream=True, jsonResp=False)
+        parameters = {'offset': offset} if offset else None
+        return self.sendRestRequest(
+            'get', path, parameters=parameters, stream=True, jsonResp=False)
+
+    def _resumableFileDownload(self, fileId, path):
+        """
+        Download a file to a local path through ``<path>.part``, continuing
+        from what an interrupted download of the same file left there, and
+        record it in the journal of the current transfers.
+        """
+        journal = self._engine.journal
+        key = downloadKey(fileId, path)
+        record = journal.get(key)
+        if (record is not None and record.get('done') and os.path.isfile(path)
+                and os.path.getsize(path) == record['size']):
+            return
+
+        fileObj = self.getFile(fileId)
+        partial = path + '.part'
+        offset = 0
+        if (record is not None and record.get('updated') == fileObj.get('updated')
+                and os.path.isfile(partial)):
+            offset = os.path.getsize(partial)
+        if not offset or offset > fileObj['size']:
+            offset = 0
+            journal.set(key, size=fileObj['size'], updated=fileObj.get('updated'))
+
+        _safeMakedirs(os.path.dirname(path))
+        req = self._streamingFileDownload(fileId, offset)
+        with open(partial, 'ab' if offset else 'wb') as fh:
+            for chunk in req.iter_content(chunk_size=REQ_BUFFER_SIZE):
+                fh.write(chunk)
+
+        size = os.path.getsize(partial)
+        if size != fileObj['size']:
+            if size > fileObj['size']:
+                os.remove(partial)
+            raise IncompleteResponseError('File %s download' % fileId, fileObj['size'], size)
+        shutil.move(partial, path)
+        journal.set(key, size=size, updated=fileObj.get('updated'), done=True)
 
     def downloadFile(self, fileId, path, created=None):
         """
@@ -1172,6 +1393,11 @@ class GirderClient(object):
         :param fileId: The ID of the Girder file to download.
         :param path: The path to write the file to, or a file-like object.
         """
+        if (self._engine is not None and self._engine.journal is not None
+                and self.cache is None and isinstance(path, six.string_types)
+                and not os.path.isdir(path)):
+            return self._resumableFileDownload(fileId, path)
+
         fileObj = self.getFile(fileId)
         created = created or fileObj['created']
         cacheKey = '\n'.join([self.urlBase, fileId, created])
@@ -1279,61 +1505,103 @@ class GirderClient(object):
             if len(files) < DEFAULT_PAGE_LIMIT:
                 break
 
-    def downloadFolderRecursive(self, folderId, dest, sync=False):
+    def _listPages(self, path, params, first=None):
         """
-        Download a folder recursively from Girder into a local directory.
+        Yields the pages of a listing. Inside ``transfers()``, the next page
+        is requested while the caller goes through the current one.
 
-        :param folderId: Id of the Girder folder or resource path to download.
-        :type folderId: ObjectId or Unix-style path to the resource in Girder.
-        :param dest: The local download destination.
-        :type dest: str
-        :param sync: If True, check if item exists in local metadata
-            cache and skip download provided that metadata is identical.
-        :type sync: bool
+        :param first: A future of the first page, if it was requested ahead.
         """
-        offset = 0
-        folderId = self._checkResourcePath(folderId)
+        engine = self._engine
+        params = dict(params, limit=DEFAULT_PAGE_LIMIT, offset=0)
+        page = first.result() if first is not None else self.get(path, dict(params))
         while True:
-            folders = self.get('folder', parameters={
-                'limit': DEFAULT_PAGE_LIMIT,
-                'offset': offset,
-                'parentType': 'folder',
-                'parentId': folderId
-            })
-
-            for folder in folders:
-                local = os.path.join(dest, self.transformFilename(folder['name']))
-                _safeMakedirs(local)
+            last = len(page) < DEFAULT_PAGE_LIMIT
+            if not last:
+                params['offset'] += len(page)
+                if engine is not None:
+                    following = engine.request(self.get, path, dict(params))
+            yield page
+            if last:
+                break
+            page = following.result() if engine is not None else self.get(path, dict(params))
 
-                self.downloadFolderRecursive(folder['_id'], local, sync=sync)
+    def _listFolderContents(self, folderId, parentType='folder'):
+        """
+        :returns: the first pages of the subfolders and items of a folder,
+            requested ahead inside ``transfers()``, or None.
+        """
+        if self._engine is None:
+            return None
+        folders = self._engine.request(self.get, 'folder', {
+            'limit': DEFAULT_PAGE_LIMIT, 'offset': 0,
+            'parentType': parentType, 'parentId': folderId})
+        items = None
+        if parentType == 'folder':
+            items = self._engine.request(self.get, 'item', {
+                'limit': DEFAULT_PAGE_LIMIT, 'offset': 0, 'folderId': folderId})
+        return folders, items
 
-            offset += len(folders)
-            if len(folders) < DEFAULT_PAGE_LIMIT:
-                break
+    def _downloadFolders(self, folderId, parentType, dest, sync, listing=None):
+        """
+        Download the subfolders of a folder, collection or user in turn.
+        Inside ``transfers()``, the contents of the next few are listed while
+        the current one is walked.
+        """
+        ahead = collections.deque()
+        lookahead = self._engine.jobs if self._engine is not None else 0
+        for folders in self._listPages('folder', {
+            'parentType': parentType,
+            'parentId': folderId
+        }, first=listing[0] if listing else None):
+            for folder in folders:
+                ahead.append((folder, self._listFolderContents(folder['_id'])))
+                if len(ahead) > lookahead:
+                    self._downloadFolder(*ahead.popleft(), dest=dest, sync=sync)
+        while ahead:
+            self._downloadFolder(*ahead.popleft(), dest=dest, sync=sync)
 
-        offset = 0
+    def _downloadFolder(self, folder, listing, dest, sync):
+        local = os.path.join(dest, self.transformFilename(folder['name']))
+        _safeMakedirs(local)
+        self._downloadFolderRecursive(folder['_id'], local, sync, listing)
 
-        while True:
-            items = self.get('item', parameters={
-                'folderId': folderId,
-                'limit': DEFAULT_PAGE_LIMIT,
-                'offset': offset
-            })
+    def _downloadFolderRecursive(self, folderId, dest, sync, listing=None):
+        self._downloadFolders(folderId, 'folder', dest, sync, listing)
 
+        for items in self._listPages('item', {
+            'folderId': folderId
+        }, first=listing[1] if listing else None):
             for item in items:
                 _id = item['_id']
                 self.incomingMetadata[_id] = item
                 if sync and _id in self.localMetadata and item == self.localMetadata[_id]:
                     continue
-                self.downloadItem(item['_id'], dest, name=item['name'])
+                if self._engine is not None:
+                    self._engine.submit(self.downloadItem, item['_id'], dest, name=item['name'])
+                else:
+                    self.downloadItem(item['_id'], dest, name=item['name'])
 
-            offset += len(items)
-            if len(items) < DEFAULT_PAGE_LIMIT:
-                break
+    def downloadFolderRecursive(self, folderId, dest, sync=False):
+        """
+        Download a folder recursively from Girder into a local directory.
+        Inside ``transfers()``, items are downloaded concurrently.
+
+        :param folderId: Id of the Girder folder or resource path to download.
+        :type folderId: ObjectId or Unix-style path to the resource in Girder.
+        :param dest: The local download destination.
+        :type dest: str
+        :param sync: If True, check if item exists in local metadata
+            cache and skip download provided that metadata is identical.
+        :type sync: bool
+        """
+        folderId = self._checkResourcePath(folderId)
+        self._downloadFolderRecursive(folderId, dest, sync)
 
     def downloadResource(self, resourceId, dest, resourceType='folder', sync=False):
         """
         Download a collection, user, or folder recursively from Girder into a local directory.
+        Inside ``transfers()``, items are downloaded concurrently.
 
         :param resourceId: ID or path of the resource to download.
         :type resourceId: ObjectId or Unix-style path to the resource in Girder.
@@ -1350,25 +1618,8 @@ class GirderClient(object):
         if resourceType == 'folder':
             self.downloadFolderRecursive(resourceId, dest, sync)
         elif resourceType in ('collection', 'user'):
-            offset = 0
             resourceId = self._checkResourcePath(resourceId)
-            while True:
-                folders = self.get('folder', parameters={
-                    'limit': DEFAULT_PAGE_LIMIT,
-                    'offset': offset,
-                    'parentType': resourceType,
-                    'parentId': resourceId
-                })
-
-                for folder in folders:
-                    local = os.path.join(dest, self.transformFilename(folder['name']))
-                    _safeMakedirs(local)
-
-                    self.downloadFolderRecursive(folder['_id'], local, sync=sync)
-
-                offset += len(folders)
-                if len(folders) < DEFAULT_PAGE_LIMIT:
-                    break
+            self._downloadFolders(resourceId, resourceType, dest, sync)
         else:
             raise Exception('Invalid resource type: %s' % resourceType)
 
@@ -1478,6 +1729,25 @@ class GirderClient(object):
             return self.createFolder(parentId, folderName, parentType=parentType,
                                      metadata=metadata)
 
+    def _transfer(self, func, *args, **kwargs):
+        """
+        Run a file transfer on the pool of the current ``transfers()``, or
+        right away outside of one.
+
+        :returns: a future of the transfer, or None if it already ran.
+        """
+        if self._engine is not None:
+            return self._engine.submit(func, *args, **kwargs)
+        func(*args, **kwargs)
+
+    def _waitForTransfers(self, futures, callbacks):
+        """
+        Wait for the transfers of a folder or item before its callbacks are
+        called.
+        """
+        if callbacks and self._engine is not None:
+            self._engine.wait(futures)
+
     def _hasOnlyFiles(self, localFolder):
         """Returns whether a folder has only files. This will be false if the
         folder contains any subdirectories.
@@ -1556,6 +1826,7 @@ class GirderClient(object):
                 os.path.basename(localFolder), parentFolderId, reuseExisting)
 
         subdircontents = sorted(os.listdir(localFolder))
+        uploads = []
         # for each file in the subdir, add it to the item
         filecount = len(subdircontents)
         for (ind, currentFile) in enumerate(subdircontents):
@@ -1567,9 +1838,11 @@ class GirderClient(object):
             print('Adding file %s, (%d of %d) to Item' % (currentFile, ind + 1, filecount))
 
             if not dryRun:
-                self.uploadFileToItem(item['_id'], filepath, filename=currentFile)
+                uploads.append(self._transfer(
+                    self.uploadFileToItem, item['_id'], filepath, filename=currentFile))
 
         if not dryRun:
+            self._waitForTransfers(uploads, self._itemUploadCallbacks)
             for callback in self._itemUploadCallbacks:
                 callback(item, localFolder)
 
@@ -1610,6 +1883,7 @@ class GirderClient(object):
                 folder = self.loadOrCreateFolder(
                     os.path.basename(localFolder), parentId, parentType)
 
+            uploads = []
             for entry in sorted(os.listdir(localFolder)):
                 if entry in blacklist:
                     if dryRun:
@@ -1627,11 +1901,12 @@ class GirderClient(object):
                         fullEntry, folder['_id'], 'folder', leafFoldersAsItems, reuseExisting,
                         blacklist=blacklist, dryRun=dryRun, reference=reference)
                 else:
-                    self._uploadAsItem(
-                        entry, folder['_id'], fullEntry, reuseExisting, dryRun=dryRun,
-                        reference=reference)
+                    uploads.append(self._transfer(
+                        self._uploadAsItem, entry, folder['_id'], fullEntry, reuseExisting,
+                        dryRun=dryRun, reference=reference))
 
             if not dryRun:
+                self._waitForTransfers(uploads, self._folderUploadCallbacks)
                 for callback in self._folderUploadCallbacks:
                     callback(folder, localFolder)
 
@@ -1682,9 +1957,9 @@ class GirderClient(object):
                             'Attempting to upload an item under a %s. Items can only be added to '
                             'folders.' % parentType)
                     else:
-                        self._uploadAsItem(
-                            os.path.basename(currentFile), parentId, currentFile, reuseExisting,
-                            dryRun=dryRun, reference=reference)
+                        self._transfer(
+                            self._uploadAsItem, os.path.basename(currentFile), parentId,
+                            currentFile, reuseExisting, dryRun=dryRun, reference=reference)
                 else:
                     self._uploadFolderRecursive(
                         currentFile, parentId, parentType, leafFoldersAsItems, reuseExisting,
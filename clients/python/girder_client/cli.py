@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 import click
 import logging
+from contextlib import contextmanager
 import requests
 from requests.adapters import HTTPAdapter
 from six.moves.http_client import HTTPConnection
@@ -80,11 +81,19 @@ class GirderCli(GirderClient):
         elif username:
             self.authenticate(username, password, interactive=interactive)
 
-    def sendRestRequest(self, *args, **kwargs):
-        with self.session() as session:
+    @contextmanager
+    def session(self, session=None):
+        with super(GirderCli, self).session(session) as session:
             session.verify = self.sslVerify
             if self.retries:
                 session.mount(self.urlBase, HTTPAdapter(max_retries=self.retries))
+            yield session
+
+    def sendRestRequest(self, *args, **kwargs):
+        # Transfers keep a session open on their threads to reuse connections.
+        if self._session is not None:
+            return super(GirderCli, self).sendRestRequest(*args, **kwargs)
+        with self.session():
             return super(GirderCli, self).sendRestRequest(*args, **kwargs)
 
 
@@ -280,6 +289,20 @@ def _CommonParameters(path_exists=False, path_writable=True,
     return wrap
 
 
+def _TransferParameters(func):
+    decorators = [
+        click.option('--jobs', default=1, show_default=True, type=click.IntRange(1),
+                     help='number of files transferred at once'),
+        click.option('--journal', default=None,
+                     type=click.Path(dir_okay=False, writable=True),
+                     help='file recording the progress of the transfer; running the same '
+                          'command with it again resumes an interrupted transfer'),
+    ]
+    for decorator in reversed(decorators):
+        func = decorator(func)
+    return func
+
+
 _common_help = 'PARENT_ID is the id of the Girder parent target and ' \
                'LOCAL_FOLDER is the path to the local target folder.'
 
@@ -291,16 +314,18 @@ _short_help = 'Download files from Girder'
     _short_help, _common_help.replace('LOCAL_FOLDER', 'LOCAL_FOLDER (default: ".")')))
 @_CommonParameters(additional_parent_types=[
     'collection', 'user', 'item', 'file'], path_default='.')
+@_TransferParameters
 @click.pass_obj
-def _download(gc, parent_type, parent_id, local_folder):
+def _download(gc, parent_type, parent_id, local_folder, jobs, journal):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
-    if parent_type == 'item':
-        gc.downloadItem(parent_id, local_folder)
-    elif parent_type == 'file':
-        gc.downloadFile(parent_id, local_folder)
-    else:
-        gc.downloadResource(parent_id, local_folder, parent_type)
+    with gc.transfers(jobs, journal):
+        if parent_type == 'item':
+            gc.downloadItem(parent_id, local_folder)
+        elif parent_type == 'file':
+            gc.downloadFile(parent_id, local_folder)
+        else:
+            gc.downloadResource(parent_id, local_folder, parent_type)
 
 
 _short_help = 'Synchronize local folder with remote Girder folder'
@@ -308,12 +333,14 @@ _short_help = 'Synchronize local folder with remote Girder folder'
 
 @main.command('localsync', short_help=_short_help, help='%s\n\n%s' % (_short_help, _common_help))
 @_CommonParameters(additional_parent_types=[])
+@_TransferParameters
 @click.pass_obj
-def _localsync(gc, parent_type, parent_id, local_folder):
+def _localsync(gc, parent_type, parent_id, local_folder, jobs, journal):
     if parent_type != 'folder':
         raise Exception('localsync command only accepts parent-type of folder')
     gc.loadLocalMetadata(local_folder)
-    gc.downloadFolderRecursive(parent_id, local_folder, sync=True)
+    with gc.transfers(jobs, journal):
+        gc.downloadFolderRecursive(parent_id, local_folder, sync=True)
     gc.saveLocalMetadata(local_folder)
 
 
@@ -335,15 +362,17 @@ _short_help = 'Upload files to Girder'
               help='comma-separated list of filenames to ignore')
 @click.option('--reference', default=None,
               help='optional reference to send along with the upload')
+@_TransferParameters
 @click.pass_obj
 def _upload(gc, parent_type, parent_id, local_folder,
-            leaf_folders_as_items, reuse, blacklist, dry_run, reference):
+            leaf_folders_as_items, reuse, blacklist, dry_run, reference, jobs, journal):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
-    gc.upload(
-        local_folder, parent_id, parent_type,
-        leafFoldersAsItems=leaf_folders_as_items, reuseExisting=reuse,
-        blacklist=blacklist.split(','), dryRun=dry_run, reference=reference)
+    with gc.transfers(jobs, journal):
+        gc.upload(
+            local_folder, parent_id, parent_type,
+            leafFoldersAsItems=leaf_folders_as_items, reuseExisting=reuse,
+            blacklist=blacklist.split(','), dryRun=dry_run, reference=reference)
 
 
 if __name__ == '__main__':
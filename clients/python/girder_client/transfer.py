@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent transfers for :py:class:`girder_client.GirderClient`, used inside
+``GirderClient.transfers()``: files are uploaded and downloaded by a bounded
+pool of threads, the parts of large uploads and the next page of listings
+are requested ahead by a second pool, and completed transfers are recorded in
+an optional journal so that an interrupted run picks up where it stopped.
+"""
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_JOBS = 4
+
+
+class TransferJournal(object):
+    """
+    Append-only record, one JSON object per line, of the uploads started and
+    the transfers completed. Later lines take precedence over earlier ones.
+
+    :param path: The journal file; it is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        self._lock = threading.Lock()
+        complete = True
+        try:
+            with open(path) as fh:
+                for line in fh:
+                    complete = line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line of an interrupted run may be partial.
+                        continue
+                    self._records[record['key']] = record
+        except (IOError, OSError):
+            pass
+        self._fh = open(path, 'a')
+        if not complete:
+            # Don't append the next record to a partial line.
+            self._fh.write('\n')
+
+    def get(self, key):
+        with self._lock:
+            return self._records.get(key)
+
+    def set(self, key, **values):
+        record = dict(values, key=key)
+        with self._lock:
+            self._records[key] = record
+            self._fh.write(json.dumps(record) + '\n')
+            self._fh.flush()
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+def uploadKey(filepath, parentType, parentId):
+    """
+    :returns: the journal key of a local file uploaded into a parent; the
+        file's size and modification time are part of it so that a changed
+        file is uploaded again.
+    """
+    stat = os.stat(filepath)
+    return 'upload:%s:%s:%s:%d:%d' % (
+        parentType, parentId, os.path.abspath(filepath), stat.st_size, int(stat.st_mtime))
+
+
+def downloadKey(fileId, path):
+    """
+    :returns: the journal key of a file downloaded to a local path.
+    """
+    return 'download:%s:%s' % (fileId, os.path.abspath(path))
+
+
+class TransferEngine(object):
+    """
+    Runs whole-file transfers on ``jobs`` threads, and the requests they or
+    the listing of folders issue ahead of time on ``jobs`` more. File tasks
+    may wait for requests, requests never wait for anything, so the pools
+    cannot deadlock.
+
+    :param jobs: Number of files transferred at once, and of requests sent
+        ahead at once.
+    :param journal: Path of a :py:class:`TransferJournal`, or None.
+    """
+
+    def __init__(self, client, jobs=DEFAULT_JOBS, journal=None):
+        self.client = client
+        self.jobs = max(1, jobs)
+        self.journal = TransferJournal(journal) if journal else None
+        self._files = ThreadPoolExecutor(self.jobs)
+        self._requests = ThreadPoolExecutor(self.jobs)
+        # Bounds the parts read ahead of the requests sending them.
+        self._partSlots = threading.BoundedSemaphore(self.jobs)
+        self._pending = set()
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run a file transfer on the pool; its error, if any, is raised by
+        ``wait``.
+
+        :returns: a ``concurrent.futures.Future``.
+        """
+        future = self._files.submit(self._inSession, func, *args, **kwargs)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def request(self, func, *args, **kwargs):
+        """
+        Send a request ahead of when its result is needed.
+
+        :returns: a ``concurrent.futures.Future``.
+        """
+        return self._requests.submit(self._inSession, func, *args, **kwargs)
+
+    def sendParts(self, sendPart, parts):
+        """
+        Send parts concurrently, reading each one only once a request slot is
+        free.
+
+        :param sendPart: Called with a part number and the part's data.
+        :param parts: Iterable of ``(part, data)``, read lazily.
+        """
+        futures = []
+
+        def send(part, data):
+            try:
+                return sendPart(part, data)
+            finally:
+                self._partSlots.release()
+
+        try:
+            for part, data in self._throttle(parts):
+                futures.append(self.request(send, part, data))
+        finally:
+            wait(futures)
+        for future in futures:
+            future.result()
+
+    def _throttle(self, parts):
+        parts = iter(parts)
+        while True:
+            self._partSlots.acquire()
+            try:
+                part, data = next(parts)
+            except StopIteration:
+                self._partSlots.release()
+                return
+            except BaseException:
+                self._partSlots.release()
+                raise
+            yield part, data
+
+    def wait(self, futures=None):
+        """
+        Wait for transfers, by default for all those submitted so far and
+        those they submit.
+
+        :param futures: Only wait for these; their errors are raised by the
+            last call to ``wait`` without arguments.
+        :raises: the first error of a transfer.
+        """
+        if futures is not None:
+            wait(futures)
+            return
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            wait(pending)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def shutdown(self):
+        self._files.shutdown()
+        self._requests.shutdown()
+        if self.journal is not None:
+            self.journal.close()
+
+    def _inSession(self, func, *args, **kwargs):
+        # Sessions are per thread, so each task reuses its own connection.
+        if self.client._session is not None:
+            return func(*args, **kwargs)
+        with self.client.session():
+            return func(*args, **kwargs)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
@@ -3,6 +3,7 @@ import cgi
 import cherrypy
 import collections
 import datetime
+import hashlib
 import inspect
 import json
 import posixpath
@@ -29,6 +30,8 @@ from girderformindlogger.models.account_profile import AccountProfile
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.utility import toBool, config, JsonEncoder, optionalArgumentDecorator
 from girderformindlogger.utility._cache import requestCache
+from girderformindlogger.utility.auth_cache import getAuthCache
+from girderformindlogger.utility.json_encoding import JsonBlob, encodeJson
 from girderformindlogger.utility.model_importer import ModelImporter
 from six.moves import range, urllib
 
@@ -164,7 +167,8 @@ def getCurrentToken(allowCookie=None):
     if not tokenStr:
         return None
 
-    return Token().load(tokenStr, force=True, objectId=False)
+    return getAuthCache().get(
+        tokenStr, 'token', lambda: Token().load(tokenStr, force=True, objectId=False))
 
 
 def getCurrentUser(returnToken=False):
@@ -207,7 +211,8 @@ def getCurrentUser(returnToken=False):
         except AccessException:
             return retVal(None, token)
 
-        user = User().load(token['userId'], force=True)
+        user = getAuthCache().get(
+            token['_id'], 'user', lambda: User().load(token['userId'], force=True))
         return retVal(user, token)
 
 
@@ -223,7 +228,9 @@ def getAccountProfile():
         except AccessException:
             return None
 
-        return AccountProfile().findOne({'accountId': token['accountId'], 'userId': token['userId']})
+        return getAuthCache().get(
+            token['_id'], 'accountProfile', lambda: AccountProfile().findOne(
+                {'accountId': token['accountId'], 'userId': token['userId']}))
 
 
 def setCurrentUser(user):
@@ -495,6 +502,37 @@ def setResponseHeader(header, value):
     cherrypy.response.headers[header] = value
 
 
+def makeETag(*parts):
+    """
+    Build a strong ETag from JSON-serializable parts, such as the id and
+    ``updated`` date of a cache document and the per-user fields a response
+    adds to it.
+    """
+    return '"%s"' % hashlib.sha1(json.dumps(
+        parts, sort_keys=True, separators=(',', ':'), cls=JsonEncoder
+    ).encode('utf8')).hexdigest()
+
+
+def checkETag(etag):
+    """
+    Set the ETag header of the response, and answer with 304 Not Modified if
+    the ``If-None-Match`` header of the request lists it.
+
+    :param etag: The ETag, as returned by ``makeETag``.
+    """
+    setResponseHeader('ETag', etag)
+    ifNoneMatch = cherrypy.request.headers.get('If-None-Match')
+    if not ifNoneMatch:
+        return
+    for tag in ifNoneMatch.split(','):
+        tag = tag.strip()
+        # If-None-Match uses the weak comparison.
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag or tag == '*':
+            raise cherrypy.HTTPRedirect([], 304)
+
+
 def rawResponse(fun):
     """
     This is a decorator that can be placed on REST route handlers, and is
@@ -530,6 +568,8 @@ def _createResponse(val):
         elif accept.value == 'text/html':
             # Pretty-print and HTML-ify the response for the browser
             setResponseHeader('Content-Type', 'text/html')
+            if isinstance(val, JsonBlob):
+                val = json.loads(val.decode('utf8'))
             resp = cgi.escape(json.dumps(
                 val, indent=4, sort_keys=True, allow_nan=False, separators=(',', ': '),
                 cls=JsonEncoder))
@@ -540,8 +580,7 @@ def _createResponse(val):
     # Default behavior will just be normal JSON output. Keep this
     # outside of the loop body in case no Accept header is passed.
     setResponseHeader('Content-Type', 'application/json')
-    return json.dumps(val, sort_keys=True, allow_nan=False,
-                      cls=JsonEncoder).encode('utf8')
+    return encodeJson(val)
 
 
 def _handleRestException(e):
@@ -770,6 +809,8 @@ class Resource(object):
     def __init__(self):
         self._routes = collections.defaultdict(
             lambda: collections.defaultdict(list))
+        # (method, length) -> index of those routes built by _compileRoutes.
+        self._compiledRoutes = {}
 
     def _ensureInit(self):
         """
@@ -818,6 +859,7 @@ class Resource(object):
                 break
         else:
             nLengthRoutes.append((route, handler))
+        self._compiledRoutes.pop((method.lower(), len(route)), None)
 
         # Now handle the api doc if the handler has any attached
         if resource is None and hasattr(self, 'resourceName'):
@@ -865,6 +907,7 @@ class Resource(object):
                 break
         else:
             raise GirderException('No such route: %s %s' % (method, '/'.join(route)))
+        self._compiledRoutes.pop((method.lower(), len(route)), None)
 
         # Remove the api doc
         if resource is None:
@@ -940,7 +983,8 @@ class Resource(object):
         """
         method = method.lower()
 
-        route, handler, kwargs = self._matchRoute(method, path)
+        route, handler, kwargs, (beforeEvent, afterEvent) = self._matchCompiledRoute(
+            method, path)
 
         cherrypy.request.requiredScopes = getattr(
             handler, 'requiredScopes', None) or TokenScope.USER_AUTH
@@ -952,17 +996,7 @@ class Resource(object):
         # Add before call for the API method. Listeners can return
         # their own responses by calling preventDefault() and
         # adding a response on the event.
-
-        if hasattr(self, 'resourceName'):
-            resource = self.resourceName
-        else:
-            resource = handler.__module__.rsplit('.', 1)[-1]
-
-        routeStr = '/'.join((resource, '/'.join(route))).rstrip('/')
-        eventPrefix = '.'.join(('rest', method, routeStr))
-
-        event = events.trigger('.'.join((eventPrefix, 'before')),
-                               kwargs, pre=self._defaultAccess)
+        event = events.trigger(beforeEvent, kwargs, pre=self._defaultAccess)
         if event.defaultPrevented and len(event.responses) > 0:
             val = event.responses[0]
         else:
@@ -974,7 +1008,7 @@ class Resource(object):
         # reassign the return value completely by adding a response to
         # the event and calling preventDefault() on it.
         kwargs['returnVal'] = val
-        event = events.trigger('.'.join((eventPrefix, 'after')), kwargs)
+        event = events.trigger(afterEvent, kwargs)
         if event.defaultPrevented and len(event.responses) > 0:
             val = event.responses[0]
 
@@ -996,21 +1030,76 @@ class Resource(object):
         :raises: `GirderException`, when no routes are defined on this resource.
         :raises: `RestException`, when no route can be matched.
         """
+        return self._matchCompiledRoute(method, path)[:3]
+
+    def _matchCompiledRoute(self, method, path):
+        """
+        Like ``_matchRoute``, but also returns the names of the before and
+        after events of the route.
+        """
         if not self._routes:
             raise GirderException('No routes defined for resource')
 
-        for route, handler in self._routes[method][len(path)]:
-            wildcards = {}
-            for routeComponent, pathComponent in six.moves.zip(route, path):
-                if routeComponent[0] == ':':  # Wildcard token
-                    wildcards[routeComponent[1:]] = pathComponent
-                elif routeComponent != pathComponent:  # Exact match token
-                    break
-            else:
-                return route, handler, wildcards
+        key = (method, len(path))
+        compiled = self._compiledRoutes.get(key)
+        if compiled is None:
+            compiled = self._compiledRoutes[key] = self._compileRoutes(method, len(path))
+        routes, masks, matches = compiled
+
+        for (literals, wildcards), pathComponent in six.moves.zip(masks, path):
+            matches &= literals.get(pathComponent, 0) | wildcards
+            if not matches:
+                break
+        if matches:
+            # The lowest bit set is the first matching route in order.
+            route, handler, wildcardNames, eventNames = routes[
+                (matches & -matches).bit_length() - 1]
+            return route, handler, {
+                name: path[i] for i, name in wildcardNames
+            } if wildcardNames else {}, eventNames
 
         raise RestException('No matching route for "%s %s"' % (method.upper(), '/'.join(path)))
 
+    def _compileRoutes(self, method, length):
+        """
+        Index the routes of a method and length, in their order of precedence,
+        for ``_matchCompiledRoute``. Route ``n`` is bit ``n`` of the masks: for
+        each position there is a dict of literal components to the mask of
+        the routes having them there, and the mask of the routes with a
+        wildcard there. The routes matching a path are those set in every
+        mask its components select.
+
+        :returns: a tuple of the routes, as ``(route, handler, wildcard names
+            by position, (before event, after event))``, the ``(literals,
+            wildcards)`` masks of each position and the mask of all routes.
+        """
+        routes = []
+        literals = [{} for _ in range(length)]
+        wildcards = [0] * length
+
+        for n, (route, handler) in enumerate(self._routes[method][length]):
+            for i, routeComponent in enumerate(route):
+                if routeComponent[0] == ':':  # Wildcard token
+                    wildcards[i] |= 1 << n
+                else:
+                    literals[i][routeComponent] = literals[i].get(routeComponent, 0) | 1 << n
+
+            if hasattr(self, 'resourceName'):
+                resource = self.resourceName
+            else:
+                resource = handler.__module__.rsplit('.', 1)[-1]
+            routeStr = '/'.join((resource, '/'.join(route))).rstrip('/')
+            eventPrefix = '.'.join(('rest', method, routeStr))
+
+            routes.append((
+                route,
+                handler,
+                tuple((i, c[1:]) for i, c in enumerate(route) if c[0] == ':'),
+                ('.'.join((eventPrefix, 'before')), '.'.join((eventPrefix, 'after')))
+            ))
+
+        return routes, tuple(zip(literals, wildcards)), (1 << len(routes)) - 1
+
     def requireParams(self, required, provided=None):
         """
         This method has two modes. In the first mode, this takes two
@@ -56,6 +56,8 @@ class Activity(Resource):
         .errorResponse('Read access was denied for the activity.', 403)
     )
     def getActivity(self, folder):
+        if folder.get('cached'):
+            return jsonld_expander.loadCacheJson(folder['cached'])
         return(jsonld_expander.formatLdObject(folder, 'activity'))
 
     @access.public(scope=TokenScope.DATA_READ)
@@ -24,7 +24,7 @@ import threading
 import uuid
 import datetime
 from ..describe import Description, autoDescribeRoute
-from ..rest import Resource, rawResponse
+from ..rest import Resource, checkETag, makeETag, rawResponse
 from bson.objectid import ObjectId
 from girderformindlogger.constants import AccessType, SortDir, TokenScope,     \
     DEFINED_INFORMANTS, REPROLIB_CANONICAL, SPECIAL_SUBJECTS, USER_ROLES
@@ -284,16 +284,11 @@ class Applet(Resource):
         if not reviewerProfile or 'reviewer' not in reviewerProfile.get('roles', []) or applet['_id'] != reviewerProfile['appletId']:
             raise AccessException('unable to find reviewer with specified id')
 
-        users = [
-            profileModel.displayProfileFields(
-                p,
-                thisUser,
-                forceManager=True
-            )
-            for p in list(
-                profileModel.find({'appletId': applet['_id'], 'reviewers': reviewerProfile['_id']})
-            )
-        ]
+        users = profileModel.displayProfilesFields(
+            list(profileModel.find({'appletId': applet['_id'], 'reviewers': reviewerProfile['_id']})),
+            thisUser,
+            forceManager=True
+        )
         return users
 
     @access.user(scope=TokenScope.DATA_READ)
@@ -371,10 +366,9 @@ class Applet(Resource):
                                                'profile': True,
                                                'deactivated': {'$ne': True},
                                                'reviewers': profile['_id']})
-            return {'active': [
-                ProfileModel().displayProfileFields(p, user, forceManager=True)
-                for p in list(users)
-            ]}
+            return {'active': ProfileModel().displayProfilesFields(
+                list(users), user, forceManager=True
+            )}
 
         return AppletModel().getAppletUsers(applet, user, force=True, retrieveRoles=retrieveRoles, retrieveRequests=AppletModel().isManager(applet['_id'], user))
 
@@ -402,12 +396,19 @@ class Applet(Resource):
 
         protocol = ProtocolModel().load(applet.get('meta', {}).get('protocol', {}).get('_id', '').split('/')[-1], force=True)
 
-        items = list(ItemModel().find({
+        query = {
             'folderId': protocol['meta'].get('contentId', None),
             'version': {
                 '$in': versions
             }
-        }, sort=[("created", DESCENDING)]))
+        }
+        checkETag(makeETag([
+            (str(item['_id']), item['version'], item.get('updated')) for item in ItemModel().find(
+                query, fields=['version', 'updated'], sort=[("created", DESCENDING)]
+            )
+        ]))
+
+        items = list(ItemModel().find(query, sort=[("created", DESCENDING)]))
 
         return [
             {
@@ -513,6 +514,7 @@ class Applet(Resource):
             ProfileModel().save(profile, validate=False)
 
         if deleteResponse:
+            from girderformindlogger.models.response_date import ResponseDate
             from girderformindlogger.models.response_folder import ResponseItem
 
             ResponseItem().removeWithQuery(
@@ -522,6 +524,7 @@ class Applet(Resource):
                     "meta.applet.@id": applet['_id']
                 }
             )
+            ResponseDate().removeDates(profile['userId'], applet['_id'])
 
         return ({
             'message': 'successfully removed user from applet'
@@ -929,9 +932,17 @@ class Applet(Resource):
             dataType='array',
             default=''
         )
+        .param(
+            'format',
+            'json returns the data as one document; ndjson streams it as one '
+            'record per line, for large applets.',
+            required=False,
+            enum=['json', 'ndjson'],
+            default='json'
+        )
         .errorResponse('Write access was denied for this applet.', 403)
     )
-    def getAppletData(self, id, users):
+    def getAppletData(self, id, users, format='json'):
         from datetime import datetime
         from ..rest import setContentDisposition, setRawResponse, setResponseHeader
 
@@ -941,12 +952,16 @@ class Applet(Resource):
             users = users.replace(' ', '').split(",")
 
         users = users if users else []
-        data = AppletModel().getResponseData(id, thisUser, users)
+        if format == 'ndjson':
+            data = AppletModel().streamResponseData(id, thisUser, users)
+            setResponseHeader('Content-Type', 'application/x-ndjson')
+        else:
+            data = AppletModel().getResponseData(id, thisUser, users)
 
         setContentDisposition("{}-{}.{}".format(
             str(id),
             datetime.now().isoformat(),
-            'json'
+            format
         ))
 
         return(data)
@@ -1590,18 +1605,20 @@ class Applet(Resource):
                 for event in original['events']:
                     original_id = event.get('id')
                     if original_id not in assigned:
-                        EventsModel().deleteEvent(ObjectId(original_id))
+                        EventsModel().deleteEvent(ObjectId(original_id), refreshSchedule=False)
         else:
             if isinstance(deleted, list):
                 for event_id in deleted:
-                    EventsModel().deleteEvent(ObjectId(event_id))
+                    EventsModel().deleteEvent(ObjectId(event_id), refreshSchedule=False)
 
         if 'events' in schedule:
             # insert and update events/notifications
             for event in schedule['events']:
-                savedEvent = EventsModel().upsertEvent(event, applet, event.get('id', None))
+                savedEvent = EventsModel().upsertEvent(event, applet, event.get('id', None), refreshSchedule=False)
                 event['id'] = savedEvent['_id']
 
+        EventsModel().refreshSchedules(applet['_id'])
+
         return {
             "applet": {
                 "schedule": schedule if rewrite else EventsModel().getSchedule(applet['_id'])
@@ -75,12 +75,17 @@ class File(Resource):
                required=False)
         .param('assetstoreId', 'Direct the upload to a specific assetstore (admin-only).',
                required=False)
+        .param('partSize', 'Send the file in parts of this many bytes, the last one '
+               'possibly smaller, instead of in ordered chunks. Parts are sent with '
+               'POST /file/chunk and their number, in any order and concurrently, '
+               'then the upload is completed with POST /file/completion.',
+               dataType='integer', required=False)
         .errorResponse()
         .errorResponse('Write access was denied on the parent folder.', 403)
         .errorResponse('Failed to create upload.', 500)
     )
     def initUpload(self, parentType, parentId, name, size, mimeType, linkUrl, reference,
-                   assetstoreId):
+                   assetstoreId, partSize):
         """
         Before any bytes of the actual file are sent, a request should be made
         to initialize the upload. This creates the temporary record of the
@@ -106,7 +111,7 @@ class File(Resource):
                 assetstore = Assetstore().load(assetstoreId)
 
             chunk = None
-            if size > 0 and cherrypy.request.headers.get('Content-Length'):
+            if size > 0 and not partSize and cherrypy.request.headers.get('Content-Length'):
                 ct = cherrypy.request.body.content_type.value
                 if (ct not in cherrypy.request.body.processors
                         and ct.split('/', 1)[0] not in cherrypy.request.body.processors):
@@ -122,7 +127,8 @@ class File(Resource):
                 # version upgrade.
                 upload = Upload().createUpload(
                     user=user, name=name, parentType=parentType, parent=parent, size=size,
-                    mimeType=mimeType, reference=reference, assetstore=assetstore)
+                    mimeType=mimeType, reference=reference, assetstore=assetstore,
+                    partSize=partSize)
             except OSError as exc:
                 if exc.errno == errno.EACCES:
                     raise GirderException(
@@ -197,13 +203,16 @@ class File(Resource):
         .modelParam('uploadId', paramType='formData', model=Upload)
         .param('offset', 'Offset of the chunk in the file.', dataType='integer',
                paramType='query', required=False, default=0)
+        .param('part', 'Number of the part, from 0, for uploads started with a '
+               'partSize. The upload is returned without waiting for other parts.',
+               dataType='integer', paramType='query', required=False)
         .errorResponse(('ID was invalid.',
                         'Received too many bytes.',
                         'Chunk is smaller than the minimum size.'))
         .errorResponse('You are not the user who initiated the upload.', 403)
         .errorResponse('Failed to store upload.', 500)
     )
-    def readChunk(self, upload, offset, params):
+    def readChunk(self, upload, offset, part, params):
         """
         After the temporary upload record has been created (see initUpload),
         the bytes themselves should be passed up in ordered chunks. The user
@@ -228,6 +237,16 @@ class File(Resource):
         if upload['userId'] != user['_id']:
             raise AccessException('You did not initiate this upload.')
 
+        if upload.get('partSize'):
+            if part is None:
+                raise RestException('The part parameter is required for this upload.')
+            try:
+                return Upload().handlePart(upload, part, chunk)
+            except IOError as exc:
+                if exc.errno == errno.EACCES:
+                    raise Exception('Failed to store upload.')
+                raise
+
         if upload['received'] != offset:
             raise RestException(
                 'Server has received %s bytes, but client sent offset %s.' % (
@@ -22,6 +22,8 @@ from girderformindlogger.models.pushNotification import PushNotification as Push
 from girderformindlogger.models.setting import Setting
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.utility import JsonEncoder
+from girderformindlogger.utility.notification_dispatcher import getNotificationDispatcher, \
+    recipientKey
 from girderformindlogger.api import access
 
 from girderformindlogger.models import getRedisConnection
@@ -33,6 +35,9 @@ DEFAULT_STREAM_TIMEOUT = 300
 MIN_POLL_INTERVAL = 0.5
 # The interval increases when no new events are seen, capping at this value
 MAX_POLL_INTERVAL = 2
+# Seconds between checks that the server is still running, while a stream
+# waits to be woken by a notification
+ENGINE_CHECK_INTERVAL = 5
 
 
 def sseMessage(event):
@@ -67,8 +72,8 @@ class Notification(Resource):
             .notes('This uses long-polling to keep the connection open for '
                    'several minutes at a time (or longer) and should be requested '
                    'with an EventSource object or other SSE-capable client. '
-                   '<p>Notifications are returned within a few seconds of when '
-                   'they occur.  When no notification occurs for the timeout '
+                   '<p>Notifications are pushed as they occur, or within a few '
+                   'seconds when Redis is unavailable.  When no notification occurs for the timeout '
                    'duration, the stream is closed. '
                    '<p>This connection can stay open indefinitely long.')
             .param('timeout', 'The duration without a notification before the stream is closed.',
@@ -92,22 +97,36 @@ class Notification(Resource):
         if since is not None:
             since = datetime.datetime.utcfromtimestamp(since)
 
+        dispatcher = getNotificationDispatcher()
+
         def streamGen():
             lastUpdate = since
             start = time.time()
             wait = MIN_POLL_INTERVAL
-            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
-                wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
-                for event in NotificationModel().get(user, lastUpdate, token=token):
-                    if lastUpdate is None or event['updated'] > lastUpdate:
-                        lastUpdate = event['updated']
-                    wait = MIN_POLL_INTERVAL
-                    start = time.time()
-                    yield sseMessage(event)
-                if time.time() - start > timeout:
-                    break
-
-                time.sleep(wait)
+            query = True
+            dispatcher.listen()
+            with dispatcher.waiter(recipientKey(user, token)) as wakeup:
+                while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                    wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
+                    if query:
+                        wakeup.clear()
+                        for event in NotificationModel().get(user, lastUpdate, token=token):
+                            if lastUpdate is None or event['updated'] > lastUpdate:
+                                lastUpdate = event['updated']
+                            wait = MIN_POLL_INTERVAL
+                            start = time.time()
+                            yield sseMessage(event)
+                    if time.time() - start > timeout:
+                        break
+
+                    if dispatcher.listen():
+                        # Only query again once a notification for this user
+                        # is published.
+                        query = wakeup.wait(min(
+                            ENGINE_CHECK_INTERVAL, timeout - (time.time() - start)))
+                    else:
+                        time.sleep(wait)
+                        query = True
 
         return streamGen
 
@@ -58,6 +58,8 @@ class Protocol(Resource):
     def getProtocol(self, folder):
         try:
             protocol = folder
+            if protocol.get('cached'):
+                return jsonld_expander.loadCacheJson(protocol['cached'])
             user = self.getCurrentUser()
             return(
                 jsonld_expander.formatLdObject(
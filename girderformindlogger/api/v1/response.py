@@ -36,6 +36,7 @@ from girderformindlogger.models.activity import Activity as ActivityModel
 from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.assignment import Assignment as AssignmentModel
 from girderformindlogger.models.folder import Folder
+from girderformindlogger.models.response_date import ResponseDate
 from girderformindlogger.models.response_folder import ResponseFolder as \
     ResponseFolderModel, ResponseItem as ResponseItemModel
 from girderformindlogger.models.roles import getCanonicalUser, getUserCipher
@@ -103,6 +104,14 @@ class ResponseItem(Resource):
             required=False,
             default=True
         )
+        .param(
+            'format',
+            'json returns the data as one document; ndjson streams it as one '
+            'record per line, without filling in dates that have no responses.',
+            required=False,
+            enum=['json', 'ndjson'],
+            default='json'
+        )
         .errorResponse('ID was invalid.')
         .errorResponse(
             'Read access was denied for this applet for this user.',
@@ -117,10 +126,12 @@ class ResponseItem(Resource):
         fromDate=None,
         toDate=None,
         includeOldItems=True,
+        format='json',
     ):
         from girderformindlogger.models.profile import Profile
         from girderformindlogger.utility.response import (
-            delocalize, add_missing_dates, add_latest_daily_response, getOldVersions)
+            delocalize, add_missing_dates, add_latest_daily_response, getOldVersions,
+            dailyResponseRecords, streamResponseData, EXPORT_BATCH_SIZE)
 
         user = self.getCurrentUser()
         profile = Profile().findOne({'appletId': applet['_id'],
@@ -158,6 +169,37 @@ class ResponseItem(Resource):
         else:
             activities = list(map(lambda s: ObjectId(s), activities))
 
+        def setUserTime(response):
+            # we need this to handle old responses
+            response['meta']['subject']['userTime'] = response["created"].replace(tzinfo=pytz.timezone("UTC")).astimezone(
+                timezone(
+                    timedelta(
+                        hours=profile["timezone"] if 'timezone' not in response['meta']['subject'] else response['meta']['subject']['timezone']
+                    )
+                )
+            )
+            return response
+
+        def query(user):
+            return {"created": { "$lte": toDate, "$gt": fromDate },
+                    "meta.applet.@id": ObjectId(applet['_id']),
+                    "meta.activity.@id": { "$in": activities },
+                    "meta.subject.@id": user['_id']}
+
+        if format == 'ndjson':
+            def responses():
+                for user in users:
+                    for response in ResponseItemModel().findIter(
+                        query=query(user),
+                        sort=[("created", DESCENDING)],
+                        batchSize=EXPORT_BATCH_SIZE
+                    ):
+                        yield setUserTime(response)
+
+            setResponseHeader('Content-Type', 'application/x-ndjson')
+            return lambda: streamResponseData(
+                responses(), applet, dailyResponseRecords)
+
         data = {
             'responses': {},
             'dataSources': {},
@@ -168,22 +210,12 @@ class ResponseItem(Resource):
         # Get the responses for each users and generate the group responses data.
         for user in users:
             responses = ResponseItemModel().find(
-                query={"created": { "$lte": toDate, "$gt": fromDate },
-                       "meta.applet.@id": ObjectId(applet['_id']),
-                       "meta.activity.@id": { "$in": activities },
-                       "meta.subject.@id": user['_id']},
+                query=query(user),
                 force=True,
                 sort=[("created", DESCENDING)])
 
-            # we need this to handle old responses
             for response in responses:
-                response['meta']['subject']['userTime'] = response["created"].replace(tzinfo=pytz.timezone("UTC")).astimezone(
-                    timezone(
-                        timedelta(
-                            hours=profile["timezone"] if 'timezone' not in response['meta']['subject'] else response['meta']['subject']['timezone']
-                        )
-                    )
-                )
+                setUserTime(response)
 
             add_latest_daily_response(data, responses)
         add_missing_dates(data, fromDate, toDate)
@@ -397,6 +429,7 @@ class ResponseItem(Resource):
                         }
 
                 newItem = self._model.setMetadata(newItem, metadata)
+                ResponseDate().addResponse(newItem)
 
             if not pending:
                 newItem['readOnly'] = True
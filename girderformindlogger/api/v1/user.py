@@ -7,7 +7,7 @@ from bson import ObjectId
 
 from ..describe import Description, autoDescribeRoute
 from girderformindlogger.api import access
-from girderformindlogger.api.rest import Resource, filtermodel, setCurrentUser
+from girderformindlogger.api.rest import Resource, checkETag, filtermodel, setCurrentUser
 from girderformindlogger.constants import AccessType, SortDir, TokenScope, USER_ROLES
 from girderformindlogger.exceptions import RestException, AccessException
 from girderformindlogger.models.applet import Applet as AppletModel
@@ -605,6 +605,14 @@ class User(Resource):
             default=False,
             dataType='boolean'
         )
+        .jsonParam(
+            'versions',
+            'Object of applet IDs to the "etag" of the applet from an earlier '
+            'response. Applets which did not change since are returned as '
+            '{"applet": {"_id"}, "etag", "unchanged": true}.',
+            required=False,
+            requireObject=True
+        )
         .errorResponse('ID was invalid.')
         .errorResponse(
             'You do not have permission to see any of this user\'s applets.',
@@ -619,7 +627,8 @@ class User(Resource):
         getAllApplets=False,
         retrieveSchedule=False,
         retrieveAllEvents=False,
-        getTodayEvents=False
+        getTodayEvents=False,
+        versions=None
     ):
         from bson.objectid import ObjectId
         from girderformindlogger.utility.jsonld_expander import loadCache
@@ -654,7 +663,7 @@ class User(Resource):
 
         if ids_only:
             return applet_ids
-        applets = [AppletModel().load(ObjectId(applet_id), AccessType.READ) for applet_id in applet_ids]
+        applets = AppletModel().loadApplets(applet_ids, AccessType.READ)
 
         if unexpanded:
             return([{
@@ -662,18 +671,16 @@ class User(Resource):
             } for applet in applets])
 
         try:
-            result = []
-            for applet in applets:
-                if applet.get('cached'):
-                    formatted = AppletModel().appletFormatted(applet=applet,
-                                                              reviewer=reviewer,
-                                                              role=role,
-                                                              retrieveSchedule=retrieveSchedule,
-                                                              retrieveAllEvents=retrieveAllEvents,
-                                                              eventFilter=currentUserDate if getTodayEvents else None)
-                    result.append(formatted)
-
-            return(result)
+            return(AppletModel().appletsFormatted(applets=applets,
+                                                  reviewer=reviewer,
+                                                  role=role,
+                                                  retrieveSchedule=retrieveSchedule,
+                                                  retrieveAllEvents=retrieveAllEvents,
+                                                  eventFilter=currentUserDate if getTodayEvents else None,
+                                                  versions=versions,
+                                                  checkETag=checkETag))
+        except cherrypy.HTTPRedirect:
+            raise
         except:
             import sys, traceback
             print(sys.exc_info())
@@ -717,7 +724,8 @@ class User(Resource):
                                                  reviewer=reviewer,
                                                  role=role,
                                                  retrieveSchedule=retrieveSchedule,
-                                                 retrieveAllEvents=retrieveAllEvents)
+                                                 retrieveAllEvents=retrieveAllEvents,
+                                                 checkETag=checkETag)
         return applet
 
     @access.public(scope=TokenScope.DATA_READ)
@@ -1484,8 +1492,11 @@ class User(Resource):
 
         old = self._model.setUserName(user, username)
 
-        for p in list(ProfileModel().find(query={'userId': user['_id'], 'profile': True})):
-            ProfileModel()._cacheProfileDisplay(p, user, forceManager=True)
+        ProfileModel()._cacheProfileDisplays(
+            list(ProfileModel().find(query={'userId': user['_id'], 'profile': True})),
+            user,
+            forceManager=True
+        )
 
         return {'message': 'username changed from {} to {}'.format(old, username)}
 
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import click
+
+from girderformindlogger.models.folder import Folder
+
+
+@click.command('folder-ancestors', short_help='Store the ancestors of folders.',
+               help='Store the path from its root on every folder that does '
+               'not have it yet. Folders also get it on first load, so this '
+               'only avoids doing it at request time.')
+@click.option('--rebuild', is_flag=True, default=False,
+              help='Recompute the ancestors of all folders.')
+def main(rebuild):
+    count, orphans = Folder().backfillAncestors(rebuild=rebuild)
+    click.echo('Stored the ancestors of %d folders.' % count)
+    if orphans:
+        click.echo('Skipped %d folders without a parent: %s' % (
+            len(orphans), ', '.join(str(id) for id in orphans)))
@@ -10,6 +10,8 @@ import sys
 import threading
 import time
 
+from collections import OrderedDict
+
 import girderformindlogger
 from girderformindlogger import events, logger, logprint
 from girderformindlogger.exceptions import AccessException, ValidationException
@@ -24,6 +26,112 @@ from girderformindlogger.utility import path as path_util
 from girderformindlogger.utility.server import configureServer
 
 
+# Seconds a resolved path, or the listing of a directory, is reused for.
+DEFAULT_PATH_TTL = 10
+# Number of paths and of directory listings cached at most.
+DEFAULT_MAX_PATHS = 100000
+# File contents are read and cached in blocks of this many bytes.
+DEFAULT_BLOCK_SIZE = 128 * 1024
+DEFAULT_BLOCK_CACHE_BYTES = 64 * 1024 * 1024
+# Upper bound, in blocks, of what is read ahead of sequential reads.
+DEFAULT_MAX_READ_AHEAD = 16
+# Seconds between two reports of the cache statistics in the log.
+STATS_INTERVAL = 300
+# Models whose changes may move, rename or remove paths of the mount.
+PATH_MODELS = ('collection', 'user', 'folder', 'item', 'file')
+
+
+class _TTLCache(object):
+    """
+    LRU of values that are served for ``ttl`` seconds after they are stored.
+
+    :param ttl: Seconds an entry is served for; 0 disables the cache.
+    :param maxEntries: Number of entries cached at most.
+    """
+
+    def __init__(self, ttl, maxEntries):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :returns: ``(True, value)`` if the key is cached, ``(False, None)``
+            otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+class _BlockCache(object):
+    """
+    LRU of blocks of file contents by ``(file id, sha512, block number)``,
+    bounded in bytes.
+    """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.readAhead = 0
+        self._bytes = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._blocks.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def set(self, key, data):
+        if len(data) > self.maxBytes:
+            return
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._blocks[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.maxBytes:
+                self._bytes -= len(self._blocks.popitem(last=False)[1])
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'readAhead': self.readAhead,
+                'blocks': len(self._blocks), 'bytes': self._bytes}
+
+
 class ServerFuse(fuse.Operations):
     """
     This class handles FUSE operations that are non-default.  It exposes the
@@ -34,10 +142,13 @@ class ServerFuse(fuse.Operations):
 
     use_ns = True
 
-    def __init__(self, stat=None):
+    def __init__(self, stat=None, pathTtl=DEFAULT_PATH_TTL, maxPaths=DEFAULT_MAX_PATHS,
+                 blockSize=DEFAULT_BLOCK_SIZE, blockCacheBytes=DEFAULT_BLOCK_CACHE_BYTES,
+                 maxReadAhead=DEFAULT_MAX_READ_AHEAD):
         """
         Instantiate the operations class.  This sets up tracking for open
-        files and file descriptor numbers (handles).
+        files and file descriptor numbers (handles), and the caches of
+        resolved paths, directory listings and file blocks.
 
         :param stat: the results of an os.stat call which should be used as
             default values for files in the FUSE.  Files in the FUSE will have
@@ -45,6 +156,16 @@ class ServerFuse(fuse.Operations):
             updated and a created time stamp, the ctime and mtime will also be
             taken from this.  If None, this defaults to the user of the Girder
             process's home directory,
+        :param pathTtl: seconds a resolved path or a directory listing is
+            reused for, 0 to resolve paths on every operation.  Changes made
+            by this process drop them right away.
+        :param maxPaths: number of paths, and of listings, cached at most.
+        :param blockSize: size in bytes of the blocks file contents are read
+            and cached in.
+        :param blockCacheBytes: upper bound of the block cache, 0 to read the
+            files on every call.
+        :param maxReadAhead: number of blocks read ahead of sequential reads
+            at most.
         """
         super(ServerFuse, self).__init__()
         if not stat:
@@ -56,6 +177,40 @@ class ServerFuse(fuse.Operations):
         self.nextFH = 1
         self.openFiles = {}
         self.openFilesLock = threading.Lock()
+        self._paths = _TTLCache(pathTtl, maxPaths)
+        self._listings = _TTLCache(pathTtl, maxPaths)
+        self.blockSize = blockSize
+        self.maxReadAhead = maxReadAhead
+        self._blocks = _BlockCache(blockCacheBytes) if blockCacheBytes else None
+        self._statsAt = time.time()
+        for model in PATH_MODELS:
+            for event in ('save.after', 'remove'):
+                eventName = 'model.%s.%s' % (model, event)
+                events.unbind(eventName, 'server_fuse.cache')
+                events.bind(eventName, 'server_fuse.cache', self._invalidate)
+
+    def _invalidate(self, event=None):
+        """
+        Drop the resolved paths and listings, since a change to a resource
+        can rename, move or remove the paths of all of its descendants.
+        """
+        self._paths.clear()
+        self._listings.clear()
+
+    def cacheStats(self):
+        """
+        :returns: the hits and misses of the path, listing and block caches.
+        """
+        stats = {'paths': self._paths.stats(), 'listings': self._listings.stats()}
+        if self._blocks is not None:
+            stats['blocks'] = self._blocks.stats()
+        return stats
+
+    def _logStats(self, force=False):
+        now = time.time()
+        if force or now - self._statsAt >= STATS_INTERVAL:
+            self._statsAt = now
+            logger.info('ServerFuse cache stats: %r', self.cacheStats())
 
     def __call__(self, op, path, *args, **kwargs):
         """
@@ -82,6 +237,7 @@ class ServerFuse(fuse.Operations):
                 logger.debug('<- %s %s', op, repr(ret))
             else:
                 logger.debug('<- %s (length %d) %r', op, len(ret), ret[:16])
+            self._logStats()
 
     def _getPath(self, path):
         """
@@ -93,21 +249,46 @@ class ServerFuse(fuse.Operations):
         # If asked about a file in top level directory or the top directory,
         # return that it doesn't exist.  Other methods should handle '',
         # '/user', and 'collection' before calling this method.
-        if '/' not in path.rstrip('/')[1:]:
+        path = path.rstrip('/')
+        if '/' not in path[1:]:
+            raise fuse.FuseOSError(errno.ENOENT)
+        found, resource = self._paths.get(path)
+        if not found:
+            resource = self._lookUpPath(path)
+            # Paths that do not exist are cached too, tools probe for many.
+            self._paths.set(path, resource)
+        if resource is None:
             raise fuse.FuseOSError(errno.ENOENT)
+        return resource   # {model, document}
+
+    def _lookUpPath(self, path):
+        """
+        Resolve a path, from its parent's resource when the path is below a
+        user or collection, so that only the last component is queried.
+
+        :returns: the resource, or None if the path does not exist.
+        """
         try:
+            parentPath, name = path.rsplit('/', 1)
+            if parentPath.count('/') >= 2:
+                parent = self._getPath(parentPath)
+                document, model = path_util.lookUpToken(
+                    name, parent['model'], parent['document'])
+                return {'model': model, 'document': document}
             # We can't filter the resource, since that removes files'
             # assetstore information and users' size information.
-            resource = path_util.lookUpPath(
-                path.rstrip('/'), filter=False, force=True)
+            return path_util.lookUpPath(path, filter=False, force=True)
         except (path_util.NotFoundException, AccessException):
-            raise fuse.FuseOSError(errno.ENOENT)
+            return None
+        except fuse.FuseOSError as exc:
+            if exc.errno == errno.ENOENT:
+                return None
+            raise
         except ValidationException:
             raise fuse.FuseOSError(errno.EROFS)
         except Exception:
             logger.exception('ServerFuse server internal error')
             raise fuse.FuseOSError(errno.EROFS)
-        return resource   # {model, document}
 
     def _stat(self, doc, model):
         """
@@ -155,29 +336,47 @@ class ServerFuse(fuse.Operations):
             name = name.decode('utf8')
         return name
 
-    def _list(self, doc, model):
+    def _list(self, doc, model, path=None):
         """
         List the entries in a Girder user, collection, folder, or item.
 
         :param doc: the girderformindlogger resource document.
         :param model: the girderformindlogger model.
+        :param path: if given, the path of the document within the fuse; the
+            entries' paths are then cached, since listing a directory is
+            usually followed by a getattr of each entry.
         :returns: a list of the names of resources within the specified
         document.
         """
-        entries = []
+        children = []
         if model in ('collection', 'user', 'folder'):
             folderList = Folder().find({
                 'parentId': doc['_id'],
                 'parentCollection': model.lower()
             })
-            for folder in folderList:
-                entries.append(self._name(folder, 'folder'))
+            children.extend((folder, 'folder') for folder in folderList)
         if model == 'folder':
-            for item in Folder().childItems(doc):
-                entries.append(self._name(item, 'item'))
+            children.extend((item, 'item') for item in Folder().childItems(doc))
         elif model == 'item':
-            for file in Item().childFiles(doc):
-                entries.append(self._name(file, 'file'))
+            children.extend((file, 'file') for file in Item().childFiles(doc))
+        return self._entries(children, path)
+
+    def _entries(self, children, path=None):
+        """
+        :param children: ``(document, model)`` of the entries of a directory.
+        :param path: the path of the directory whose entries' paths are
+            cached, or None.
+        :returns: the names of the entries.
+        """
+        entries = []
+        seen = set()
+        for child, childModel in children:
+            name = self._name(child, childModel)
+            entries.append(name)
+            # The path resolves to the first entry of the name, folders first.
+            if path is not None and '/' not in name and name not in seen:
+                seen.add(name)
+                self._paths.set('%s/%s' % (path, name), {'model': childModel, 'document': child})
         return entries
 
     # We don't handle extended attributes or ioctl.
@@ -254,10 +453,48 @@ class ServerFuse(fuse.Operations):
             if fh not in self.openFiles:
                 raise fuse.FuseOSError(errno.EBADF)
             info = self.openFiles[fh]
-        with info['lock']:
-            handle = info['handle']
-            handle.seek(offset)
-            return handle.read(size)
+        if self._blocks is None:
+            with info['lock']:
+                handle = info['handle']
+                handle.seek(offset)
+                return handle.read(size)
+        return self._readBlocks(info, size, offset)
+
+    def _readBlocks(self, info, size, offset):
+        """
+        Read through the block cache.  Missing blocks are read from the file
+        in one request, together with up to ``maxReadAhead`` blocks past
+        them when reads are sequential; the read-ahead doubles with each
+        sequential read.
+        """
+        file = info['file']
+        end = min(offset + size, file['size'])
+        if offset >= end:
+            return b''
+        blockSize = self.blockSize
+        first, last = offset // blockSize, (end - 1) // blockSize
+        keyPrefix = (file['_id'], file.get('sha512'))
+        blocks = [self._blocks.get(keyPrefix + (n, )) for n in range(first, last + 1)]
+        if any(block is None for block in blocks):
+            with info['lock']:
+                if offset == info['nextOffset']:
+                    info['readAhead'] = min(max(1, info['readAhead'] * 2), self.maxReadAhead)
+                else:
+                    info['readAhead'] = 0
+                start = first + next(i for i, block in enumerate(blocks) if block is None)
+                stop = min(last + info['readAhead'], (file['size'] - 1) // blockSize)
+                handle = info['handle']
+                handle.seek(start * blockSize)
+                data = handle.read((stop + 1 - start) * blockSize)
+            self._blocks.readAhead += max(0, stop - last)
+            for n in range(start, stop + 1):
+                block = data[(n - start) * blockSize:(n + 1 - start) * blockSize]
+                self._blocks.set(keyPrefix + (n, ), block)
+                if first <= n <= last:
+                    blocks[n - first] = block
+        info['nextOffset'] = end
+        data = b''.join(blocks)
+        return data[offset - first * blockSize:end - first * blockSize]
 
     def readdir(self, path, fh):
         """
@@ -272,14 +509,18 @@ class ServerFuse(fuse.Operations):
         result = [u'.', u'..']
         if path == '':
             result.extend([u'collection', u'user'])
-        elif path in ('/user', '/collection'):
-            model = path[1:]
-            docList = ModelImporter.model(model).find({}, sort=None)
-            for doc in docList:
-                result.append(self._name(doc, model))
-        else:
-            resource = self._getPath(path)
-            result.extend(self._list(resource['document'], resource['model']))
+            return result
+        found, entries = self._listings.get(path)
+        if not found:
+            if path in ('/user', '/collection'):
+                model = path[1:]
+                docList = ModelImporter.model(model).find({}, sort=None)
+                entries = self._entries(((doc, model) for doc in docList), path)
+            else:
+                resource = self._getPath(path)
+                entries = self._list(resource['document'], resource['model'], path)
+            self._listings.set(path, entries)
+        result.extend(entries)
         return result
 
     def open(self, path, flags):
@@ -299,8 +540,13 @@ class ServerFuse(fuse.Operations):
             raise fuse.FuseOSError(errno.EROFS)
         info = {
             'path': path,
+            'file': resource['document'],
             'handle': File().open(resource['document']),
             'lock': threading.Lock(),
+            # Where a sequential read would start, and the number of blocks
+            # read ahead of it.
+            'nextOffset': 0,
+            'readAhead': 0,
         }
         with self.openFilesLock:
             fh = self.nextFH
@@ -334,6 +580,10 @@ class ServerFuse(fuse.Operations):
         :param path: always '/'.
         """
         Setting().unset(SettingKey.GIRDER_MOUNT_INFORMATION)
+        self._logStats(force=True)
+        for model in PATH_MODELS:
+            for event in ('save.after', 'remove'):
+                events.unbind('model.%s.%s' % (model, event), 'server_fuse.cache')
         events.trigger('server_fuse.destroy')
         return super(ServerFuse, self).destroy(path)
 
@@ -448,7 +698,14 @@ def mountServer(path, database=None, fuseOptions=None, quiet=False, plugins=None
     webroot, appconf = configureServer(plugins=plugins)
     girderformindlogger._setupCache()
 
-    opClass = ServerFuse(stat=os.stat(path))
+    settings = config.getConfig().get('mount', {})
+    opClass = ServerFuse(
+        stat=os.stat(path),
+        pathTtl=settings.get('path_ttl', DEFAULT_PATH_TTL),
+        maxPaths=settings.get('max_paths', DEFAULT_MAX_PATHS),
+        blockSize=settings.get('block_size', DEFAULT_BLOCK_SIZE),
+        blockCacheBytes=settings.get('block_cache_bytes', DEFAULT_BLOCK_CACHE_BYTES),
+        maxReadAhead=settings.get('max_read_ahead', DEFAULT_MAX_READ_AHEAD))
     options = {
         # By default, we run in the background so the mount command returns
         # immediately.  If we run in the foreground, a SIGTERM will shut it
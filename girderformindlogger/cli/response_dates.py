@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import click
+
+from girderformindlogger.models.response_date import ResponseDate
+
+
+@click.command('response-dates', short_help='Rebuild the response date index.',
+               help='Rebuild the index of response dates from the stored '
+               'responses. Entries missing from the index are also built on '
+               'first read, so this is only needed to repair it.')
+@click.option('--user', default=None, help='Only rebuild entries of this user ID.')
+@click.option('--applet', default=None, help='Only rebuild entries of this applet ID.')
+def main(user, applet):
+    rebuilt = ResponseDate().rebuild(
+        userId=user, appletIds=None if applet is None else [applet])
+    if isinstance(rebuilt, dict):
+        rebuilt = len(rebuilt)
+    click.echo('Rebuilt %d response date entries.' % rebuilt)
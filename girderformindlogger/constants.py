@@ -428,6 +428,9 @@ class CoreEventHandler(object):
     # For updating an item's size to include a new file.
     FILE_PROPAGATE_SIZE = 'core.propagateSizeToItem'
 
+    # For dropping cached tokens, users and account profiles when they change.
+    AUTH_CACHE_INVALIDATE = 'core.invalidateAuthCache'
+
     # For adding a group's creator into its ACL at creation time.
     GROUP_CREATOR_ACCESS = 'core.grantCreatorAccess'
 
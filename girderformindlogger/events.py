@@ -21,12 +21,18 @@ For obvious reasons, the asynchronous method does not return a value to the
 caller. Instead, the caller may optionally pass the callback argument as a
 function to be called when the task is finished. That callback function will
 receive the Event object as its only argument.
+
+Listeners can also bind to every event matching a pattern, where ``*``
+matches any characters, e.g. ``rest.get.applet/*`` or ``model.*.save``.
 """
 
 import contextlib
+import fnmatch
 import girderformindlogger
+import re
 import six
 import threading
+import time
 
 from collections import OrderedDict
 from girderformindlogger.utility import config
@@ -93,6 +99,25 @@ class Event(object):
         return self
 
 
+class _UnhandledEvent(Event):
+    """
+    What ``trigger`` returns for an event no handler is bound to, instead of
+    creating an Event. It is shared, so it can't be changed.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        super(_UnhandledEvent, self).__init__(None, None)
+        self.responses = ()
+
+    def preventDefault(self):
+        raise TypeError('Event has no handlers.')
+
+    def stopPropagation(self):
+        raise TypeError('Event has no handlers.')
+
+
 class ForegroundEventsDaemon(object):
     """
     This is the implementation used for ``girderformindlogger.events.daemon`` if the
@@ -215,13 +240,15 @@ def bind(eventName, handlerName, handler):
     if eventName in _deprecated:
         girderformindlogger.logger.warning('event "%s" is deprecated; %s' % (eventName, _deprecated[eventName]))
 
-    if eventName not in _mapping:
-        _mapping[eventName] = OrderedDict()
+    mapping = _patterns if '*' in eventName else _mapping
+    if eventName not in mapping:
+        mapping[eventName] = OrderedDict()
 
-    if handlerName in _mapping[eventName]:
+    if handlerName in mapping[eventName]:
         girderformindlogger.logger.warning('Event binding already exists: %s -> %s' % (eventName, handlerName))
     else:
-        _mapping[eventName][handlerName] = handler
+        mapping[eventName][handlerName] = handler
+        _clearIndex()
 
 
 def unbind(eventName, handlerName):
@@ -233,7 +260,9 @@ def unbind(eventName, handlerName):
     :param handlerName: The name that identifies the handler calling bind().
     :type handlerName: str
     """
-    _mapping.get(eventName, {}).pop(handlerName, None)
+    mapping = _patterns if '*' in eventName else _mapping
+    mapping.get(eventName, {}).pop(handlerName, None)
+    _clearIndex()
 
 
 def unbindAll():
@@ -245,6 +274,8 @@ def unbindAll():
        never be called outside of testing.
     """
     _mapping.clear()
+    _patterns.clear()
+    _clearIndex()
 
 
 @contextlib.contextmanager
@@ -281,9 +312,17 @@ def trigger(eventName, info=None, pre=None, asynchronous=False, daemon=False):
     :type asynchronous: bool
     :param daemon: Whether this was triggered via ``girderformindlogger.events.daemon``.
     :type daemon: bool
+    :returns: the Event, or a shared unhandled one if no handler is bound
+        and it was not triggered via the daemon.
     """
+    handlers = _index.get(eventName)
+    if handlers is None:
+        handlers = _handlers(eventName)
+    if not handlers and not daemon:
+        return _UNHANDLED
+
     e = Event(eventName, info, asynchronous=asynchronous)
-    for name, handler in six.viewitems(_mapping.get(eventName, {})):
+    for name, handler in handlers:
         if daemon and not asynchronous:
             girderformindlogger.logprint.warning(
                 'WARNING: Handler "%s" for event "%s" was triggered on the daemon, but is '
@@ -291,7 +330,14 @@ def trigger(eventName, info=None, pre=None, asynchronous=False, daemon=False):
         e.currentHandlerName = name
         if pre is not None:
             pre(info=info, handler=handler, eventName=eventName, handlerName=name)
-        handler(e)
+        if _timings is None:
+            handler(e)
+        else:
+            start = time.perf_counter()
+            try:
+                handler(e)
+            finally:
+                _recordTiming(eventName, name, time.perf_counter() - start)
 
         if e.propagate is False:
             break
@@ -299,8 +345,85 @@ def trigger(eventName, info=None, pre=None, asynchronous=False, daemon=False):
     return e
 
 
+def _handlers(eventName):
+    """
+    :returns: the ``(handlerName, handler)`` bound to an event, those bound
+        to its name first, then those bound to the patterns it matches.
+    """
+    generation = _indexGeneration
+    handlers = tuple(six.viewitems(_mapping.get(eventName, {})))
+    for pattern, patternHandlers in list(six.viewitems(_patterns)):
+        if _patternMatcher(pattern)(eventName):
+            handlers += tuple(six.viewitems(patternHandlers))
+    # Don't store what was read before a bind or unbind.
+    if generation == _indexGeneration:
+        _index[eventName] = handlers
+    return handlers
+
+
+def _patternMatcher(pattern):
+    matcher = _patternMatchers.get(pattern)
+    if matcher is None:
+        matcher = _patternMatchers[pattern] = re.compile(fnmatch.translate(pattern)).match
+    return matcher
+
+
+def _clearIndex():
+    global _indexGeneration
+    _indexGeneration += 1
+    _index.clear()
+
+
+def enableHandlerTiming(enabled=True):
+    """
+    Start or stop timing each handler, and clear the timings.
+    """
+    global _timings
+    _timings = {} if enabled else None
+
+
+def handlerTimings():
+    """
+    :returns: for each event and handler that ran since timing was enabled,
+        the number of calls and their total and longest duration in seconds,
+        slowest first; None if handlers are not timed.
+    """
+    if _timings is None:
+        return None
+    with _timingsLock:
+        timings = [
+            dict(event=eventName, handler=handlerName, **timing)
+            for (eventName, handlerName), timing in six.viewitems(_timings)
+        ]
+    return sorted(timings, key=lambda timing: timing['total'], reverse=True)
+
+
+def _recordTiming(eventName, handlerName, duration):
+    timings = _timings
+    if timings is None:
+        return
+    with _timingsLock:
+        timing = timings.get((eventName, handlerName))
+        if timing is None:
+            timing = timings[(eventName, handlerName)] = {'calls': 0, 'total': 0.0, 'max': 0.0}
+        timing['calls'] += 1
+        timing['total'] += duration
+        timing['max'] = max(timing['max'], duration)
+
+
 _deprecated = {}
 _mapping = {}
+# Bindings to event name patterns.
+_patterns = OrderedDict()
+_patternMatchers = {}
+# Event name -> handlers bound to it or to a pattern it matches, filled by
+# trigger() and cleared when bindings change.
+_index = {}
+_indexGeneration = 0
+_UNHANDLED = _UnhandledEvent()
+# (event name, handler name) -> timing, when handlers are timed.
+_timings = None
+_timingsLock = threading.Lock()
 daemon = ForegroundEventsDaemon()
 
 
@@ -310,3 +433,5 @@ def setupDaemon():
         daemon = ForegroundEventsDaemon()
     else:
         daemon = AsyncEventsThread()
+    if config.getConfig()['server'].get('event_handler_timing', False):
+        enableHandlerTiming()
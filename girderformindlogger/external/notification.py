@@ -2,13 +2,20 @@ import datetime
 
 from bson import ObjectId
 from pyfcm import FCMNotification
-from girderformindlogger.utility.notification import FirebaseNotification
+from girderformindlogger.utility import config
+from girderformindlogger.utility.notification import FirebaseNotification, \
+    DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF
 from collections import defaultdict
 
 
+fcmConfig = config.getConfig().get('fcm', {})
 push_service = FirebaseNotification(
         api_key='AAAAJOyOEz4:APA91bFudM5Cc1Qynqy7QGxDBa-2zrttoRw6ZdvE9PQbfIuAB9SFvPje7DcFMmPuX1IizR1NAa7eHC3qXmE6nmOpgQxXbZ0sNO_n1NITc1sE5NH3d8W9ld-cfN7sXNr6IAOuodtEwQy-',
-        proxy_dict={})
+        proxy_dict={},
+        concurrency=fcmConfig.get('concurrency', DEFAULT_CONCURRENCY),
+        rate=fcmConfig.get('rate', None),
+        maxRetries=fcmConfig.get('max_retries', DEFAULT_MAX_RETRIES),
+        backoff=fcmConfig.get('backoff', DEFAULT_BACKOFF))
 
 AMOUNT_MESSAGES_PER_REQUEST = 1000
 
@@ -35,11 +42,13 @@ def send_push_notification(applet_id, event_id, activity_id=None, send_time=None
         elif timezone < -12:
             timezone = timezone + 24
 
+        # served by the (appletId, timezone, individual_events) profile index
         query = {
             'appletId': applet_id,
             'timezone': round(timezone, 2),
+            'individual_events': 0,
             'profile': True,
-            'individual_events': 0
+            'deviceId': {'$nin': ['', None]}
         }
 
         if event['individualized']:
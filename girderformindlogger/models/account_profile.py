@@ -48,11 +48,14 @@ class AccountProfile(AccessControlledModel):
         return self.save(account)
 
     def updateAccountName(self, accountId, accountName):
+        from girderformindlogger.utility.auth_cache import getAuthCache
+
         self.update({
             'accountId': ObjectId(accountId)
         }, {'$set': {
             'accountName': accountName
         }})
+        getAuthCache().invalidateAccount(accountId)
 
     def hasPermission(self, profile, role):
         if profile and (profile['_id'] == profile['accountId'] or len(profile.get('applets', {}).get(role, []))):
@@ -66,13 +66,13 @@ class Activity(Folder):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId',
-                       'parentCollection', 'name', 'lowerName'}
+                       'parentCollection', 'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
         doc = super(Folder, self).load(
             id=id, level=level, user=user, objectId=objectId, force=force,
             fields=loadFields, exc=exc)
         if doc is not None:
-            pathFromRoot = Folder().parentsToRoot(doc, user=user, force=True)
+            pathFromRoot = Folder().ancestorsToRoot(doc)
             baseParent = pathFromRoot[0]
             if 'baseParentType' not in doc:
                 doc['baseParentId'] = baseParent['object']['_id']
@@ -151,7 +151,7 @@ class Activity(Folder):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId',
-                       'parentCollection', 'name', 'lowerName'}
+                       'parentCollection', 'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
         doc = super(Folder, self).load(
             id=id, level=level, user=user, objectId=objectId, force=force,
@@ -167,7 +167,7 @@ class Activity(Folder):
                         refreshCache
                     )[0]
                 )
-            pathFromRoot = Folder().parentsToRoot(doc, user=user, force=True)
+            pathFromRoot = Folder().ancestorsToRoot(doc)
             baseParent = pathFromRoot[0]
             if 'baseParentType' not in doc:
                 doc['baseParentId'] = baseParent['object']['_id']
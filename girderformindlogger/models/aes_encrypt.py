@@ -143,6 +143,21 @@ class AESEncryption(AccessControlledModel):
 
         return documents
 
+    def findIter(self, *args, batchSize=None, **kwargs):
+        """
+        Like ``find``, but decrypts documents as the cursor returns them
+        instead of loading the whole result set first.
+
+        :param batchSize: Number of documents fetched per round trip.
+        :type batchSize: int
+        """
+        cursor = super().find(*args, **kwargs)
+        if batchSize:
+            cursor.batch_size(batchSize)
+
+        for document in cursor:
+            yield self.decryptFields(document, self.fields)
+
     def findOne(self, *args, **kwargs):
         document = super().findOne(*args, **kwargs)
 
@@ -23,12 +23,11 @@ import itertools
 import json
 import os
 import six
-import threading
 import re
 
 from bson.objectid import ObjectId
 from girderformindlogger import events
-from girderformindlogger.api.rest import getCurrentUser
+from girderformindlogger.api.rest import getCurrentUser, makeETag
 from girderformindlogger.constants import AccessType, SortDir, USER_ROLES
 from girderformindlogger.exceptions import AccessException, GirderException, \
     ValidationException
@@ -37,8 +36,9 @@ from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.group import Group as GroupModel
 from girderformindlogger.models.protoUser import ProtoUser as ProtoUserModel
 from girderformindlogger.models.user import User as UserModel
+from girderformindlogger.utility.background import getBackgroundExecutor
 from girderformindlogger.utility.progress import noProgress,                   \
-    setResponseTimeLimit
+    setResponseTimeLimit, ProgressContext
 from girderformindlogger.models.account_profile import AccountProfile
 from girderformindlogger.models.profile import Profile
 from girderformindlogger.models.events import Events as EventsModel
@@ -466,6 +466,7 @@ class Applet(FolderModel):
     def receiveOwnerShip(self, applet, thisUser, email):
         from girderformindlogger.utility import mail_utils, jsonld_expander
         from girderformindlogger.models.group import Group
+        from girderformindlogger.models.response_date import ResponseDate
         from girderformindlogger.models.response_folder import ResponseItem
         from girderformindlogger.models.invitation import Invitation
         from girderformindlogger.utility import jsonld_expander
@@ -518,6 +519,7 @@ class Applet(FolderModel):
                 "meta.applet.@id": applet['_id']
             }
         )
+        ResponseDate().removeDates(appletId=applet['_id'])
 
         accountProfiles = list(AccountProfile().find({'accountId': applet['accountId'], 'applets.user': applet['_id'] }))
 
@@ -695,10 +697,14 @@ class Applet(FolderModel):
                 UserModel().save(user)
 
             # get a protocol from single json file
-            protocol = Protocol().createProtocol(
-                protocol,
-                user
-            )
+            with ProgressContext(
+                True, user=user, title='Importing applet', message='Starting'
+            ) as progress:
+                protocol = Protocol().createProtocol(
+                    protocol,
+                    user,
+                    progress=progress
+                )
 
             protocol = protocol.get('protocol', protocol)
 
@@ -1057,48 +1063,11 @@ class Applet(FolderModel):
         :type reviewer: dict
         :reutrns: TBD
         """
-        from girderformindlogger.models.ID_code import IDCode
         from girderformindlogger.models.response_folder import ResponseItem
-        from girderformindlogger.models.user import User
         from girderformindlogger.models.protocol import Protocol
         from pymongo import DESCENDING
 
-        if not any([
-            self.isReviewer(appletId, reviewer),
-            self.isManager(appletId, reviewer)]):
-            raise AccessException("You are not a owner or manager for this applet.")
-
-        applet = self.load(appletId, level=AccessType.READ, user=reviewer)
-
-        query = {
-            "baseParentType": "user",
-            "meta.applet.@id": ObjectId(appletId)
-        }
-
-        reviewerProfile = Profile().findOne(query={
-            'appletId': ObjectId(appletId),
-            'userId': reviewer['_id']
-        })
-        if len(users):
-            profiles = list(Profile().find(query={
-                "_id": {
-                    "$in": [ObjectId(user) for user in users]
-                },
-                "profile": True,
-                "reviewers": reviewerProfile["_id"]
-            }, fields=["userId"]))
-        else:
-            profiles = list(Profile().find(query={
-                "reviewers": reviewerProfile["_id"],
-                "profile": True,
-            }))
-
-        if reviewerProfile['_id'] not in reviewerProfile['reviewers'] and (str(reviewerProfile['_id']) in users or not users):
-            profiles.append(reviewerProfile)
-
-        query["creatorId"] = {
-            "$in": [profile['userId'] for profile in profiles]
-        }
+        applet, query = self._responseDataQuery(appletId, reviewer, users)
 
         responses = list(ResponseItem().find(
             query=query,
@@ -1166,6 +1135,92 @@ class Applet(FolderModel):
 
         return data
 
+    def _responseDataQuery(self, appletId, reviewer, users):
+        """
+        Check that the reviewer may export the applet's data and build the
+        query for the responses they can see.
+
+        :returns: the applet and the response query.
+        """
+        if not any([
+            self.isReviewer(appletId, reviewer),
+            self.isManager(appletId, reviewer)]):
+            raise AccessException("You are not a owner or manager for this applet.")
+
+        applet = self.load(appletId, level=AccessType.READ, user=reviewer)
+
+        query = {
+            "baseParentType": "user",
+            "meta.applet.@id": ObjectId(appletId)
+        }
+
+        reviewerProfile = Profile().findOne(query={
+            'appletId': ObjectId(appletId),
+            'userId': reviewer['_id']
+        })
+        if len(users):
+            profiles = list(Profile().find(query={
+                "_id": {
+                    "$in": [ObjectId(user) for user in users]
+                },
+                "profile": True,
+                "reviewers": reviewerProfile["_id"]
+            }, fields=["userId"]))
+        else:
+            profiles = list(Profile().find(query={
+                "reviewers": reviewerProfile["_id"],
+                "profile": True,
+            }))
+
+        if reviewerProfile['_id'] not in reviewerProfile['reviewers'] and (str(reviewerProfile['_id']) in users or not users):
+            profiles.append(reviewerProfile)
+
+        query["creatorId"] = {
+            "$in": [profile['userId'] for profile in profiles]
+        }
+
+        return applet, query
+
+    def streamResponseData(self, appletId, reviewer, users):
+        """
+        Like ``getResponseData``, but returns a generator function producing
+        the data as NDJSON records (see
+        ``girderformindlogger.utility.response.streamResponseData``), reading
+        the responses in batches.
+        """
+        from girderformindlogger.models.response_folder import ResponseItem
+        from girderformindlogger.utility.response import EXPORT_BATCH_SIZE, \
+            streamResponseData
+        from pymongo import DESCENDING
+
+        applet, query = self._responseDataQuery(appletId, reviewer, users)
+
+        def responseRecords(response):
+            meta = response.get('meta', {})
+            return [{
+                '_id': response['_id'],
+                'activity': meta.get('activity', {}),
+                'userId': meta.get('subject', {}).get('@id', None),
+                'data': meta.get('responses', {}),
+                'created': response.get('created', None),
+                'version': meta['applet'].get('version', '0.0.0')
+            }]
+
+        def stream():
+            return streamResponseData(ResponseItem().findIter(
+                query=query,
+                fields=[
+                    'created', 'meta.activity', 'meta.subject.@id',
+                    'meta.responses', 'meta.items', 'meta.responseStarted',
+                    'meta.applet.version', 'meta.userPublicKey',
+                    'meta.dataSource'
+                ],
+                sort=[("created", DESCENDING)],
+                batchSize=EXPORT_BATCH_SIZE
+            ), applet, responseRecords)
+
+        return stream
+
     def updateRelationship(self, applet, relationship):
         """
         :param applet: Applet to update
@@ -1402,31 +1457,22 @@ class Applet(FolderModel):
         }
         return(userlist)
 
-    def appletFormatted(self, applet, reviewer, role='user', retrieveSchedule=True, retrieveAllEvents=True, eventFilter=None):
+    def appletFormatted(self, applet, reviewer, role='user', retrieveSchedule=True, retrieveAllEvents=True, eventFilter=None, checkETag=None):
+        """
+        :param checkETag: If given, called with the ETag of the formatted
+            applet before its cache is loaded, e.g. to answer with 304.
+        """
+        from girderformindlogger.models.cache import Cache as CacheModel
         from girderformindlogger.utility import jsonld_expander
         from girderformindlogger.utility.response import responseDateList
 
-        formatted = {
-            **jsonld_expander.formatLdObject(
-                applet,
-                'applet',
-                reviewer,
-                refreshCache=False,
-                responseDates=False
-            ),
+        fields = {
             "users": self.getAppletUsers(applet, reviewer),
             "groups": self.getAppletGroups(
                 applet,
                 arrayOfObjects=True
             )
         } if role in ["coordinator", "manager"] else {
-            **jsonld_expander.formatLdObject(
-                applet,
-                'applet',
-                reviewer,
-                refreshCache=False,
-                responseDates=(role == "user")
-            ),
             "groups": [
                 group for group in self.getAppletGroups(applet).get(
                     role
@@ -1444,19 +1490,260 @@ class Applet(FolderModel):
         }
 
         try:
-            formatted["applet"]["responseDates"] = responseDateList(
+            responseDates = responseDateList(
                 applet.get('_id'),
                 reviewer.get('_id'),
                 reviewer
             )
         except:
-            formatted["applet"]["responseDates"] = []
+            responseDates = []
+
+        schedule = self.getSchedule(applet, reviewer, retrieveAllEvents, eventFilter if not retrieveAllEvents else None) if retrieveSchedule else None
+
+        if checkETag is not None and applet.get('cached'):
+            cacheId = str(applet['cached'])
+            checkETag(makeETag(
+                cacheId,
+                CacheModel().getVersions([cacheId])[cacheId],
+                fields,
+                responseDates,
+                schedule
+            ))
+
+        formatted = {
+            **jsonld_expander.formatLdObject(
+                applet,
+                'applet',
+                reviewer,
+                refreshCache=False,
+                responseDates=(role == "user")
+            ),
+            **fields
+        }
+        formatted["applet"]["responseDates"] = responseDates
 
         if retrieveSchedule:
-            formatted["applet"]["schedule"] = self.getSchedule(applet, reviewer, retrieveAllEvents, eventFilter if not retrieveAllEvents else None)
+            formatted["applet"]["schedule"] = schedule
 
         return formatted
 
+    def appletsFormatted(self, applets, reviewer, role='user', retrieveSchedule=True, retrieveAllEvents=True, eventFilter=None, versions=None, checkETag=None):
+        """
+        Batched version of appletFormatted for a list of applets. Cache
+        documents, users, groups, response dates and schedules are each
+        fetched with a few queries covering every applet instead of several
+        queries per applet. Applets without a cache are skipped.
+
+        Each formatted applet has an ``etag`` which changes with its cache
+        document or the fields added for the reviewer.
+
+        :param versions: dict of applet id to the ``etag`` of the applet the
+            client has. Those still current are returned as
+            ``{"applet": {"_id"}, "etag", "unchanged": True}``.
+        :param checkETag: If given, called with the ETag of the whole list
+            before any cache is loaded, e.g. to answer with 304.
+        :returns: list of formatted applets, in the order of `applets`.
+        """
+        from girderformindlogger.models.cache import Cache as CacheModel
+        from girderformindlogger.models.invitation import Invitation
+        from girderformindlogger.utility.response import responseDateLists
+
+        applets = [applet for applet in applets if applet.get('cached')]
+        if not len(applets):
+            return []
+
+        appletIds = [applet['_id'] for applet in applets]
+        cacheVersions = CacheModel().getVersions([
+            applet['cached'] for applet in applets
+        ])
+        isCoordinatorRole = role in ["coordinator", "manager"]
+        appletGroups = self.getAppletGroupsBulk(
+            applets,
+            arrayOfObjects=isCoordinatorRole
+        )
+
+        if isCoordinatorRole:
+            coordinatorOf = self._coordinatorAppletIds(appletIds, reviewer)
+            profiles = {appletId: [] for appletId in appletIds}
+            for p in Profile().find(query={'appletId': {'$in': [
+                appletId for appletId in appletIds if appletId in coordinatorOf
+            ]}, 'userId': {'$exists': True}, 'profile': True, 'deactivated': {'$ne': True}}):
+                profiles[p['appletId']].append(p)
+            invitations = {appletId: [] for appletId in appletIds}
+            for p in Invitation().find(query={'appletId': {'$in': [
+                appletId for appletId in appletIds if appletId in coordinatorOf
+            ]}}):
+                invitations[p['appletId']].append(p)
+        else:
+            reviewerGroups = [
+                *reviewer.get('groups', []),
+                *reviewer.get('formerGroups', []),
+                *[invite['groupId'] for invite in [
+                    *reviewer.get('groupInvites', []),
+                    *reviewer.get('declinedInvites', [])
+                ]]
+            ]
+
+        try:
+            responseDates = responseDateLists(
+                appletIds,
+                reviewer.get('_id'),
+                reviewer
+            )
+        except:
+            responseDates = {}
+
+        schedules = {}
+        if retrieveSchedule:
+            if not retrieveAllEvents:
+                schedules = EventsModel().getSchedulesForUser(
+                    appletIds,
+                    reviewer['_id'],
+                    eventFilter
+                )
+            else:
+                if not isCoordinatorRole:
+                    coordinatorOf = self._coordinatorAppletIds(appletIds, reviewer)
+                if any(appletId not in coordinatorOf for appletId in appletIds):
+                    raise AccessException(
+                        "Only coordinators and managers can get all events."
+                    )
+                schedules = EventsModel().getSchedules(appletIds)
+
+        entries = []
+        for applet in applets:
+            appletId = str(applet['_id'])
+            version = cacheVersions.get(str(applet['cached']))
+            if version is None:
+                continue
+
+            if isCoordinatorRole:
+                fields = {
+                    "users": self._appletUserDict(
+                        applet,
+                        reviewer,
+                        profiles[applet['_id']],
+                        invitations[applet['_id']]
+                    ) if applet['_id'] in coordinatorOf else [],
+                    "groups": appletGroups[appletId]
+                }
+            else:
+                fields = {
+                    "groups": [
+                        group for group in appletGroups[appletId].get(
+                            role
+                        ) if ObjectId(group) in reviewerGroups
+                    ]
+                }
+            dates = responseDates.get(appletId, [])
+            schedule = schedules[appletId] if retrieveSchedule else None
+            etag = makeETag(str(applet['cached']), version, fields, dates, schedule)
+            entries.append((applet, fields, dates, schedule, etag))
+
+        versions = versions or {}
+        if checkETag is not None:
+            checkETag(makeETag([entry[-1] for entry in entries], versions))
+
+        caches = CacheModel().getCacheDataBulk([
+            applet['cached'] for applet, fields, dates, schedule, etag in entries
+            if versions.get(str(applet['_id'])) != etag
+        ])
+
+        result = []
+        for applet, fields, dates, schedule, etag in entries:
+            appletId = str(applet['_id'])
+            if versions.get(appletId) == etag:
+                result.append({
+                    "applet": {"_id": "applet/%s" % appletId},
+                    "etag": etag,
+                    "unchanged": True
+                })
+                continue
+
+            cached = caches.get(str(applet['cached']))
+            if cached is None:
+                continue
+
+            formatted = {
+                **cached,
+                **fields
+            }
+            formatted["applet"]["responseDates"] = dates
+
+            if retrieveSchedule:
+                formatted["applet"]["schedule"] = schedule
+
+            formatted["etag"] = etag
+            result.append(formatted)
+
+        return result
+
+    def getAppletGroupsBulk(self, applets, arrayOfObjects=False):
+        """
+        Batched version of getAppletGroups, loading the groups of all given
+        applets with a single query.
+
+        :returns: dict of str(applet id) to the value getAppletGroups returns.
+        """
+        groupIds = set()
+        for applet in applets:
+            for role in USER_ROLES.keys():
+                groupIds.update([
+                    group['id'] for group in applet.get('roles', {}).get(
+                        role,
+                        {}
+                    ).get('groups', [])
+                ])
+        groups = {
+            group['_id']: group for group in GroupModel().find(
+                {'_id': {'$in': list(groupIds)}},
+                fields=['name', 'openRegistration']
+            )
+        } if groupIds else {}
+
+        result = {}
+        for applet in applets:
+            appletGroups = {
+                role: {
+                    str(group['id']): groups[group['id']].get('name') for group in applet.get(
+                        'roles',
+                        {}
+                    ).get(role, {}).get('groups', []) if group['id'] in groups
+                } for role in USER_ROLES.keys()
+            }
+            result[str(applet['_id'])] = [
+                {
+                    "id": groupId,
+                    "name": role,
+                    "openRegistration": groups[ObjectId(groupId)].get('openRegistration', False)
+                } if role=='user' else {
+                    "id": groupId,
+                    "name": role
+                } for role in appletGroups for groupId in appletGroups[
+                    role
+                ].keys()
+            ] if arrayOfObjects else appletGroups
+        return result
+
+    def _coordinatorAppletIds(self, appletIds, user):
+        """
+        Batched version of isCoordinator.
+
+        :returns: set of the applet ids the user coordinates or manages.
+        """
+        try:
+            user = Profile()._canonicalUser(None, user)
+            return set(
+                profile['appletId'] for profile in Profile().find({
+                    'appletId': {'$in': list(appletIds)},
+                    'userId': user['_id'],
+                    'deactivated': {'$ne': True},
+                    'roles': {'$in': ['coordinator', 'manager']}
+                }, fields=['appletId'])
+            )
+        except:
+            return set()
+
     def getAppletUsers(self, applet, user=None, force=False, retrieveRoles=False, retrieveRequests=False):
         """
         Function to return a list of Applet Users
@@ -1482,53 +1769,62 @@ class Applet(FolderModel):
                 if not self.isCoordinator(applet.get('_id', applet), user):
                     return([])
 
-            profileModel = Profile()
-            userDict = {
-                'active': [],
-                'pending': []
-            }
-
-            for p in list(profileModel.find(query={'appletId': applet['_id'], 'userId': {'$exists': True}, 'profile': True, 'deactivated': {'$ne': True}})):
-                    profile = profileModel.displayProfileFields(
-                        p,
-                        user,
-                        forceManager=True
-                    )
-
-                    if retrieveRoles:
-                        profile['roles'] = p['roles']
-                    if 'refreshRequest' in p and retrieveRequests:
-                        profile['refreshRequest'] = p['refreshRequest']
-
-                    userDict['active'].append(profile)
-
-            for p in list(Invitation().find(query={'appletId': applet['_id']})):
-                fields = ['_id', 'firstName', 'lastName', 'role', 'MRN', 'created', 'lang']
-                if p['role'] != 'owner':
-                    userDict['pending'].append({
-                        key: p[key] for key in fields if p.get(key, None)
-                    })
-
-
-            missing = threading.Thread(
-                target=profileModel.generateMissing,
-                args=(applet,)
+            return self._appletUserDict(
+                applet,
+                user,
+                Profile().find(query={'appletId': applet['_id'], 'userId': {'$exists': True}, 'profile': True, 'deactivated': {'$ne': True}}),
+                Invitation().find(query={'appletId': applet['_id']}),
+                retrieveRoles,
+                retrieveRequests
             )
-            missing.start()
-
-            if len(userDict['active']):
-                return(userDict)
-
-            else:
-                return({
-                    **userDict,
-                    "message": "cache updating"
-                })
         except:
             import sys, traceback
             print(sys.exc_info())
             return({traceback.print_tb(sys.exc_info()[2])})
 
+    def _appletUserDict(self, applet, user, profiles, invitations, retrieveRoles=False, retrieveRequests=False):
+        profileModel = Profile()
+        userDict = {
+            'active': [],
+            'pending': []
+        }
+
+        profiles = list(profiles)
+        displays = profileModel.displayProfilesFields(
+            profiles,
+            user,
+            forceManager=True
+        )
+        for p, profile in zip(profiles, displays):
+            if retrieveRoles:
+                profile['roles'] = p['roles']
+            if 'refreshRequest' in p and retrieveRequests:
+                profile['refreshRequest'] = p['refreshRequest']
+
+            userDict['active'].append(profile)
+
+        for p in list(invitations):
+            fields = ['_id', 'firstName', 'lastName', 'role', 'MRN', 'created', 'lang']
+            if p['role'] != 'owner':
+                userDict['pending'].append({
+                    key: p[key] for key in fields if p.get(key, None)
+                })
+
+        getBackgroundExecutor().submit(
+            ('generateMissing', applet['_id']),
+            profileModel.generateMissing,
+            applet
+        )
+
+        if len(userDict['active']):
+            return(userDict)
+
+        else:
+            return({
+                **userDict,
+                "message": "cache updating"
+            })
+
     def load(self, id, level=AccessType.ADMIN, user=None, objectId=True,
              force=False, fields=None, exc=False):
         """
@@ -1550,13 +1846,13 @@ class Applet(FolderModel):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId',
-                       'parentCollection', 'name', 'lowerName'}
+                       'parentCollection', 'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
         doc = super(FolderModel, self).load(
             id=id, level=level, user=user, objectId=objectId, force=force,
             fields=loadFields, exc=exc)
         if doc is not None:
-            pathFromRoot = FolderModel().parentsToRoot(doc, user=user, force=True)
+            pathFromRoot = FolderModel().ancestorsToRoot(doc)
             if 'baseParentType' not in doc:
                 baseParent = pathFromRoot[0]
                 doc['baseParentId'] = baseParent['object']['_id']
@@ -1592,6 +1888,68 @@ class Applet(FolderModel):
                     "Invalid Applet ID."
                 )
 
+    def loadApplets(self, ids, level=AccessType.ADMIN, user=None, force=False):
+        """
+        Load several applets at once with a single query, their parents are
+        read from the stored ancestors (or fetched with one more query for
+        applets stored without them); documents that are missing or are not
+        applets are skipped.
+
+        :param ids: The ids of the applets.
+        :type ids: list
+        :returns: list of applets, in the order of `ids`.
+        """
+        from girderformindlogger.utility.model_importer import ModelImporter
+
+        ids = [ObjectId(id) for id in ids]
+        docs = {doc['_id']: doc for doc in self.find({'_id': {'$in': ids}})}
+
+        parents = {
+            doc['parentId']: doc['ancestors'][-1]
+            for doc in docs.values() if doc.get('ancestors')
+        }
+        for parentType in set(
+            doc.get('parentCollection') for doc in docs.values()
+            if not doc.get('ancestors')
+        ):
+            parentIds = [
+                doc['parentId'] for doc in docs.values() if doc.get(
+                    'parentCollection'
+                )==parentType and not doc.get('ancestors')
+            ]
+            parents.update({
+                parent['_id']: parent for parent in ModelImporter.model(
+                    parentType
+                ).find({'_id': {'$in': parentIds}}, fields=['name'])
+            })
+
+        applets = []
+        for id in ids:
+            doc = docs.get(id)
+            if doc is None:
+                continue
+            if any(key not in doc for key in ('baseParentType', 'lowerName')):
+                # Documents that still need a lazy migration take the slow path.
+                doc = self.load(id, level=level, user=user, force=force)
+                if doc is not None:
+                    applets.append(doc)
+                continue
+            if '_modelType' not in doc:
+                doc['_modelType'] = 'folder'
+            if not force:
+                self.requireAccess(doc, user, level)
+            parent = parents.get(doc['parentId'])
+            if parent is None or 'name' not in parent:
+                raise ValidationException(
+                    "Invalid Applet ID."
+                )
+            if (
+                parent['name'] == "Applets" and
+                doc['baseParentType'] in {'collection', 'user'}
+            ):
+                applets.append(doc)
+        return applets
+
     def updateActivities(self, applet, obj):
         activities = [ObjectId(obj['activities'][activity]['_id'].split('/')[-1])
                       for activity in obj.get('activities', [])]
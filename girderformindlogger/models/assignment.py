@@ -139,13 +139,13 @@ class Assignment(Folder):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId',
-                       'parentCollection', 'name', 'lowerName'}
+                       'parentCollection', 'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
         doc = super(Folder, self).load(
             id=id, level=level, user=user, objectId=objectId, force=force,
             fields=loadFields, exc=exc)
         if doc is not None:
-            pathFromRoot = Folder().parentsToRoot(doc, user=user, force=True)
+            pathFromRoot = Folder().ancestorsToRoot(doc)
             if 'baseParentType' not in doc:
                 baseParent = pathFromRoot[0]
                 doc['baseParentId'] = baseParent['object']['_id']
@@ -3,17 +3,232 @@ import copy
 import datetime
 import json
 import os
+import pickle
 import six
+import threading
+import time
+import zlib
 
+from bson import BSON
+from bson.binary import Binary
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidDocument
 from bson.objectid import ObjectId
-from girderformindlogger import events
+from collections import OrderedDict
+from girderformindlogger import events, logger
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.model_base import AccessControlledModel, Model
+from girderformindlogger.utility import config
+from girderformindlogger.utility.json_encoding import JsonBlob, encodeJson
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 from bson import json_util
 
+# Redis channel used to tell the other workers that a cache document changed.
+CACHE_INVALIDATION_CHANNEL = 'girderformindlogger.cache.invalidate'
+# Default upper bound (in bytes) for the per-process tier, can be overridden
+# with ``local_tier_max_bytes`` in the ``[cache]`` section of the config.
+LOCAL_TIER_MAX_BYTES = 256 * 1024 * 1024
+# Same for the tier of encoded responses, ``json_tier_max_bytes``.
+JSON_TIER_MAX_BYTES = 64 * 1024 * 1024
+# Seconds to wait before trying to subscribe again after Redis was unreachable.
+SUBSCRIBE_RETRY_INTERVAL = 30
+
+
+class CacheFormat(object):
+    """
+    Storage formats for ``cache_data``. ``JSON`` is the legacy
+    ``json_util.dumps`` string; ``BSON`` stores the encoded document as
+    binary so that reads only pay for the C BSON decoder; ``ZLIB`` is the
+    same payload compressed.
+
+    Formatted documents are never stored as native sub-documents because
+    JSON-LD keys (``http://schema.org/about``, ``@context``...) are not valid
+    MongoDB field names.
+    """
+    JSON = 'json'
+    BSON = 'bson'
+    ZLIB = 'zlib'
+
+
+# Default format for new cache documents, can be overridden with
+# ``storage_format`` in the ``[cache]`` section of the config.
+DEFAULT_CACHE_FORMAT = CacheFormat.ZLIB
+# Binary payloads larger than this are split into ``cache_chunk`` documents
+# to stay clear of the 16 MB document limit.
+CACHE_CHUNK_SIZE = 8 * 1024 * 1024
+_CODEC_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def encodeCacheData(cachedData, format=DEFAULT_CACHE_FORMAT):
+    """
+    Serialize formatted data for the ``cache_data`` field.
+
+    :returns: a ``(format, payload)`` tuple; the format falls back to JSON
+        for data that BSON cannot represent (e.g. non-string keys or
+        integers wider than 64 bits).
+    """
+    if format in (CacheFormat.BSON, CacheFormat.ZLIB):
+        try:
+            payload = BSON.encode({'data': cachedData})
+        except (InvalidDocument, OverflowError, TypeError):
+            return CacheFormat.JSON, json_util.dumps(cachedData)
+        if format == CacheFormat.ZLIB:
+            payload = zlib.compress(payload, 1)
+        return format, payload
+    return CacheFormat.JSON, json_util.dumps(cachedData)
+
+
+def decodeCacheData(format, payload):
+    if payload is None:
+        return None
+    if format in (CacheFormat.BSON, CacheFormat.ZLIB):
+        payload = bytes(payload)
+        if format == CacheFormat.ZLIB:
+            payload = zlib.decompress(payload)
+        return BSON(payload).decode(codec_options=_CODEC_OPTIONS)['data']
+    return json_util.loads(payload)
+
+
+class LocalCacheTier(object):
+    """
+    Bounded, per-process LRU of decoded ``cache_data`` documents.
+
+    Entries are stored pickled, which keeps the size accounting honest and
+    hands every caller its own copy of the data (callers freely mutate the
+    formatted applets they get back). Each entry carries the ``updated``
+    timestamp of the cache document it was built from so that stale entries
+    are never served.
+
+    :param pickled: False to store ``bytes`` values, such as encoded
+        responses, as they are.
+    """
+
+    def __init__(self, maxBytes=LOCAL_TIER_MAX_BYTES, pickled=True):
+        self.maxBytes = maxBytes
+        self.pickled = pickled
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every invalidation so that a reader racing with a writer
+        # does not store what it read before the invalidation arrived.
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        """
+        Return a fresh copy of the cached data for ``key``, or None.
+
+        :param key: the cache document id.
+        :param version: if given, the entry is only served when it was stored
+            with this ``updated`` value.
+        """
+        key = str(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (
+                version is not None and entry[0] != version
+            ):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[1]
+        return pickle.loads(payload) if self.pickled else payload
+
+    def version(self, key):
+        entry = self._entries.get(str(key))
+        return entry[0] if entry is not None else None
+
+    def set(self, key, version, data, generation=None):
+        payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL) if self.pickled else data
+        size = len(payload)
+        key = str(key)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._discard(key)
+            if size > self.maxBytes:
+                return
+            self._entries[key] = (version, payload)
+            self.currentBytes += size
+            while self.currentBytes > self.maxBytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self._discard(str(key))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.currentBytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.currentBytes,
+            'maxBytes': self.maxBytes
+        }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.currentBytes -= len(entry[1])
+
+
+class CacheChunk(Model):
+    """
+    Parts of cache documents too large to be stored in a single document.
+    """
+
+    def initialize(self):
+        self.name = 'cache_chunk'
+        self.ensureIndices(
+            (
+                ([('cache_id', 1), ('n', 1)], {}),
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    def saveChunks(self, cache_id, payload):
+        self.removeWithQuery({'cache_id': cache_id})
+        chunks = [{
+            'cache_id': cache_id,
+            'n': n,
+            'data': Binary(payload[offset:offset + CACHE_CHUNK_SIZE])
+        } for n, offset in enumerate(
+            range(0, len(payload), CACHE_CHUNK_SIZE)
+        )]
+        self.collection.insert_many(chunks)
+        return len(chunks)
+
+    def readChunks(self, cache_id, count):
+        chunks = list(self.find(
+            {'cache_id': cache_id},
+            sort=[('n', 1)],
+            fields=['data']
+        ))
+        if len(chunks) != count:
+            raise GirderException(
+                'Cache %s is missing chunks (%d of %d).' % (
+                    cache_id, len(chunks), count
+                )
+            )
+        return b''.join(bytes(chunk['data']) for chunk in chunks)
+
 
 class Cache(Model):
     """
@@ -28,6 +243,27 @@ class Cache(Model):
                 'updated'
             )
         )
+        self.localTier = LocalCacheTier(
+            config.getConfig().get('cache', {}).get(
+                'local_tier_max_bytes',
+                LOCAL_TIER_MAX_BYTES
+            )
+        )
+        # The same documents encoded as response bodies.
+        self.jsonTier = LocalCacheTier(
+            config.getConfig().get('cache', {}).get(
+                'json_tier_max_bytes',
+                JSON_TIER_MAX_BYTES
+            ),
+            pickled=False
+        )
+        self.storageFormat = config.getConfig().get('cache', {}).get(
+            'storage_format',
+            DEFAULT_CACHE_FORMAT
+        )
+        self._subscriber = None
+        self._subscriberLock = threading.Lock()
+        self._subscribeRetryAt = 0
 
     def validate(self, document):
         return document
@@ -37,30 +273,326 @@ class Cache(Model):
             'collection_name': collection_name,
             'source_id': source_id,
             'model_type': model_type,
-            'updated': datetime.datetime.utcnow(),
-            'cache_data': json_util.dumps(cachedData)
+            'updated': datetime.datetime.utcnow()
         }
-        return self.save(newCache)
+        payload = self._setCacheData(newCache, cachedData)
+        newCache = self.save(newCache)
+        if payload is not None:
+            newCache['cache_chunks'] = CacheChunk().saveChunks(
+                newCache['_id'],
+                payload
+            )
+            self.update({'_id': newCache['_id']}, {'$set': {
+                'cache_chunks': newCache['cache_chunks']
+            }}, False)
+        return newCache
+
+    def insertCaches(self, caches):
+        """
+        Insert several cache documents at once.
+
+        :param caches: ``(collection_name, source_id, model_type, cachedData)``
+            of each cache document.
+        :type caches: list of tuple
+        :returns: the cache documents, in order.
+        """
+        documents = []
+        payloads = {}
+        for collection_name, source_id, model_type, cachedData in caches:
+            document = {
+                'collection_name': collection_name,
+                'source_id': source_id,
+                'model_type': model_type,
+                'updated': datetime.datetime.utcnow()
+            }
+            payloads[id(document)] = self._setCacheData(document, cachedData)
+            documents.append(document)
+
+        documents = self.insertMany(documents)
+        for document in documents:
+            payload = payloads[id(document)]
+            if payload is not None:
+                document['cache_chunks'] = CacheChunk().saveChunks(
+                    document['_id'],
+                    payload
+                )
+                self.update({'_id': document['_id']}, {'$set': {
+                    'cache_chunks': document['cache_chunks']
+                }}, False)
+        return documents
 
     def updateCache(self, original_id, collection_name, source_id, model_type, cachedData):
-        return self.save({
+        document = {
             '_id': ObjectId(original_id),
             'collection_name': collection_name,
             'source_id': source_id,
             'model_type': model_type,
-            'updated': datetime.datetime.utcnow(),
-            'cache_data': json_util.dumps(cachedData)
-        })
-    
-    def getCacheData(self, _id):
-        document = self.findOne(query={'_id': ObjectId(_id)})
+            'updated': datetime.datetime.utcnow()
+        }
+        payload = self._setCacheData(document, cachedData)
+        if payload is not None:
+            document['cache_chunks'] = CacheChunk().saveChunks(
+                document['_id'],
+                payload
+            )
+        document = self.save(document)
+        if payload is None:
+            CacheChunk().removeWithQuery({'cache_id': document['_id']})
+        self.invalidate(original_id)
+        return document
+
+    def removeCache(self, _id):
+        """
+        Remove a cache document and drop it from every worker's local tier.
+        """
+        result = self.removeWithQuery({'_id': ObjectId(_id)})
+        CacheChunk().removeWithQuery({'cache_id': ObjectId(_id)})
+        self.invalidate(_id)
+        return result
+
+    def _setCacheData(self, document, cachedData):
+        """
+        Encode ``cachedData`` into ``document`` in the configured format.
+
+        :returns: the payload if it is too large for the document and must be
+            written as chunks, otherwise None.
+        """
+        format, payload = encodeCacheData(cachedData, self.storageFormat)
+        document['cache_format'] = format
+        if format == CacheFormat.JSON:
+            document['cache_data'] = payload
+        elif len(payload) > CACHE_CHUNK_SIZE:
+            document['cache_data'] = None
+            return payload
+        else:
+            document['cache_data'] = Binary(payload)
+        return None
+
+    def _getCacheData(self, document):
+        """
+        Decode the data of a cache document, whatever format it was stored
+        in. Documents written before formats existed hold a JSON string.
+        """
+        if document is None:
+            return None
+        format = document.get('cache_format', CacheFormat.JSON)
+        if document.get('cache_chunks'):
+            return decodeCacheData(format, CacheChunk().readChunks(
+                document['_id'],
+                document['cache_chunks']
+            ))
         if document.get('cache_data'):
-            return json_util.loads(document.get('cache_data'))
+            return decodeCacheData(format, document['cache_data'])
         return None
 
+    def getCacheData(self, _id):
+        listening = self._listen()
+        generation = self.localTier.generation
+        if listening:
+            # Peers publish every change, so a local entry is current.
+            data = self.localTier.get(_id)
+            if data is not None:
+                return data
+        else:
+            # Without invalidation messages, compare against the stored
+            # timestamp; this skips transferring and decoding cache_data.
+            version = None
+            if self.localTier.version(_id) is not None:
+                document = self.findOne(
+                    query={'_id': ObjectId(_id)},
+                    fields={'updated': True}
+                )
+                if document is None:
+                    self.localTier.invalidate(_id)
+                    return None
+                version = document.get('updated')
+            data = self.localTier.get(_id, version)
+            if data is not None:
+                return data
+
+        document = self.findOne(query={'_id': ObjectId(_id)})
+        data = self._getCacheData(document)
+        if data is not None:
+            self.localTier.set(
+                _id, document.get('updated'), data, generation=generation
+            )
+        return data
+
+    def getCacheDataBulk(self, ids):
+        """
+        Load the data of several cache documents at once, serving what it can
+        from the local tier and fetching the rest with a single query.
+
+        :param ids: cache document ids.
+        :returns: dict of str(id) to data (None for missing documents).
+        """
+        ids = [ObjectId(_id) for _id in ids]
+        results = {}
+        listening = self._listen()
+        generation = self.localTier.generation
+
+        if listening:
+            for _id in ids:
+                data = self.localTier.get(_id)
+                if data is not None:
+                    results[str(_id)] = data
+        else:
+            known = [_id for _id in ids if self.localTier.version(_id) is not None]
+            versions = {
+                document['_id']: document.get('updated') for document in self.find(
+                    {'_id': {'$in': known}},
+                    fields={'updated': True}
+                )
+            } if known else {}
+            for _id in ids:
+                if _id in known and _id not in versions:
+                    self.localTier.invalidate(_id)
+                    results[str(_id)] = None
+                    continue
+                data = self.localTier.get(_id, versions.get(_id))
+                if data is not None:
+                    results[str(_id)] = data
+
+        missing = [_id for _id in ids if str(_id) not in results]
+        if missing:
+            for document in self.find({'_id': {'$in': missing}}):
+                data = self._getCacheData(document)
+                if data is not None:
+                    self.localTier.set(
+                        document['_id'],
+                        document.get('updated'),
+                        data,
+                        generation=generation
+                    )
+                results[str(document['_id'])] = data
+
+        return {str(_id): results.get(str(_id)) for _id in ids}
+
+    def getCacheJson(self, _id):
+        """
+        The data of a cache document encoded as a response body. The encoded
+        body is kept in the local tier so that serving the document again
+        neither decodes nor encodes it.
+
+        :returns: a ``JsonBlob``, or None for a missing document.
+        """
+        listening = self._listen()
+        generation = self.jsonTier.generation
+        version = None
+        if not listening:
+            document = self.findOne(
+                query={'_id': ObjectId(_id)},
+                fields={'updated': True}
+            )
+            if document is None:
+                self.jsonTier.invalidate(_id)
+                return None
+            version = document['updated']
+        blob = self.jsonTier.get(_id, version)
+        if blob is not None:
+            return JsonBlob(blob)
+
+        data = self.getCacheData(_id)
+        if data is None:
+            return None
+        blob = encodeJson(data)
+        self.jsonTier.set(_id, version, blob, generation=generation)
+        return JsonBlob(blob)
+
+    def getVersions(self, ids):
+        """
+        The ``updated`` dates of several cache documents, which change
+        whenever their data does. Dates of documents in the local tier are
+        not queried while it is kept current.
+
+        :param ids: cache document ids.
+        :returns: dict of str(id) to date (None for missing documents).
+        """
+        versions = {}
+        if self._listen():
+            for _id in ids:
+                version = self.localTier.version(_id)
+                if version is not None:
+                    versions[str(_id)] = version
+        missing = [ObjectId(_id) for _id in ids if str(_id) not in versions]
+        if missing:
+            for document in self.find(
+                {'_id': {'$in': missing}},
+                fields={'updated': True}
+            ):
+                versions[str(document['_id'])] = document.get('updated')
+        return {str(_id): versions.get(str(_id)) for _id in ids}
+
     def getFromSourceID(self, collection_name, source_id):
         document = self.findOne(query={'collection_name': collection_name, 'source_id': source_id})
-        if document.get('cache_data'):
-            return json_util.loads(document.get('cache_data'))
-        return None
+        return self._getCacheData(document)
+
+    def invalidate(self, _id):
+        """
+        Drop a cache document from the local tier of this and every other
+        worker process.
+        """
+        self.localTier.invalidate(_id)
+        self.jsonTier.invalidate(_id)
+        try:
+            from girderformindlogger.models import getRedisConnection
+
+            getRedisConnection().publish(CACHE_INVALIDATION_CHANNEL, str(_id))
+        except Exception:
+            logger.warning('Could not publish cache invalidation for %s' % _id)
+            # This process can no longer trust its entries without checking.
+            self._stopListening()
+            self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+
+    def getLocalTierStats(self):
+        return self.localTier.stats()
+
+    def _listen(self):
+        """
+        Make sure this process is subscribed to invalidation messages.
+
+        :returns: True if local entries can be served without a version check.
+        """
+        if self._subscriber is not None and self._subscriber.is_alive():
+            return True
+
+        if time.time() < self._subscribeRetryAt:
+            return False
+
+        with self._subscriberLock:
+            if self._subscriber is not None and self._subscriber.is_alive():
+                return True
+            try:
+                from girderformindlogger.models import getRedisConnection
+
+                pubsub = getRedisConnection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{
+                    CACHE_INVALIDATION_CHANNEL: self._onInvalidate
+                })
+                # Anything cached while we were not subscribed may be stale.
+                self.localTier.clear()
+                self.jsonTier.clear()
+                self._subscriber = pubsub.run_in_thread(
+                    sleep_time=1, daemon=True
+                )
+            except Exception:
+                self._subscriber = None
+                self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+                return False
+        return True
+
+    def _stopListening(self):
+        with self._subscriberLock:
+            if self._subscriber is not None:
+                try:
+                    self._subscriber.stop()
+                except Exception:
+                    pass
+                self._subscriber = None
 
+    def _onInvalidate(self, message):
+        data = message.get('data')
+        if isinstance(data, bytes):
+            data = data.decode('utf8')
+        self.localTier.invalidate(data)
+        self.jsonTier.invalidate(data)
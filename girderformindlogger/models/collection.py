@@ -136,10 +136,14 @@ class Collection(AccessControlledModel):
         :type collection: dict
         :returns: The collection document that was edited.
         """
+        from girderformindlogger.models.folder import Folder
+
         collection['updated'] = datetime.datetime.utcnow()
 
         # Validate and save the collection
-        return self.save(collection)
+        collection = self.save(collection)
+        Folder().renameAncestor(collection)
+        return collection
 
     def load(self, id, level=AccessType.ADMIN, user=None, objectId=True,
              force=False, fields=None, exc=False):
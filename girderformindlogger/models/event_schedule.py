@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from girderformindlogger.models.model_base import Model
+
+
+class EventSchedule(Model):
+    """
+    Events active on each local date of a rolling window, precomputed by
+    ``Events().refreshSchedules`` for an applet (``profile_id`` None) and for
+    each profile with individualized events.
+
+    ``events`` holds the events as returned by ``Events().getEvents`` and
+    ``days`` maps ``YYYY-MM-DD`` to a list of ``[index into events, valid]``.
+    """
+
+    def initialize(self):
+        self.name = 'eventSchedule'
+        self.ensureIndices(
+            (
+                ([('applet_id', 1), ('profile_id', 1)], {'unique': True}),
+            )
+        )
+
+    def validate(self, document):
+        return document
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import copy
 import datetime
+import itertools
 import json
 import os
 import six
@@ -9,16 +10,23 @@ from bson.objectid import ObjectId
 from girderformindlogger import events
 from girderformindlogger.constants import AccessType
 from girderformindlogger.exceptions import ValidationException, GirderException
+from girderformindlogger.models.event_schedule import EventSchedule
 from girderformindlogger.models.model_base import AccessControlledModel, Model
 from girderformindlogger.models.push_notification import PushNotification as PushNotificationModel
 from girderformindlogger.models.profile import Profile
 from girderformindlogger.models.folder import Folder
 from girderformindlogger.utility.model_importer import ModelImporter
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
+from pymongo.errors import DuplicateKeyError
 from bson import json_util
 from girderformindlogger.models.profile import Profile as ProfileModel
 from dateutil.relativedelta import relativedelta
 
+# Number of days, starting yesterday (UTC), for which the events active on
+# each date are precomputed.
+SCHEDULE_WINDOW_DAYS = 14
+
+
 class Events(Model):
     """
     collection for manage schedule and notification.
@@ -38,7 +46,16 @@ class Events(Model):
     def validate(self, document):
         return document
 
-    def deleteEvent(self, event_id):
+    def update(self, query, update, multi=True):
+        applet_ids = self.collection.distinct('applet_id', query)
+        result = super(Events, self).update(query, update, multi)
+
+        for applet_id in applet_ids:
+            self.refreshSchedules(applet_id)
+
+        return result
+
+    def deleteEvent(self, event_id, refreshSchedule=True):
         event = self.findOne({'_id': ObjectId(event_id)})
 
         if event:
@@ -56,19 +73,26 @@ class Events(Model):
             push_notification.remove_schedules()
             self.removeWithQuery({'_id': ObjectId(event_id)})
 
+            if refreshSchedule:
+                self.refreshSchedules(event['applet_id'], event['data'].get('users', []))
+
     def deleteEventsByAppletId(self, applet_id):
         events = self.find({'applet_id': ObjectId(applet_id)})
 
         for event in events:
-            self.deleteEvent(event.get('_id'))
+            self.deleteEvent(event.get('_id'), refreshSchedule=False)
+
+        EventSchedule().removeWithQuery({'applet_id': ObjectId(applet_id)})
 
     def deleteEventsByActivityId(self, applet_id, activity_id):
         events = self.find({'applet_id': ObjectId(applet_id), 'data.activity_id': ObjectId(activity_id)})
 
         for event in events:
-            self.deleteEvent(event.get('_id'))
+            self.deleteEvent(event.get('_id'), refreshSchedule=False)
 
-    def upsertEvent(self, event, applet, event_id=None):
+        self.refreshSchedules(applet_id)
+
+    def upsertEvent(self, event, applet, event_id=None, refreshSchedule=True):
         newEvent = {
             'applet_id': applet['_id'],
             'individualized': False,
@@ -99,8 +123,14 @@ class Events(Model):
 
         newEvent = self.save(newEvent)
         self.setSchedule(newEvent)
+        newEvent = self.save(newEvent)
 
-        return self.save(newEvent)
+        if refreshSchedule:
+            self.refreshSchedules(applet['_id'], newEvent['data'].get('users', []) + (
+                existed_event.get('data', {}).get('users', []) if existed_event else []
+            ))
+
+        return newEvent
 
     def updateIndividualSchedulesParameter(self, newEvent, oldEvent):
         new = newEvent['data']['users'] if 'users' in newEvent['data'] else []
@@ -160,12 +190,26 @@ class Events(Model):
             push_notification.set_schedules()
 
     def getSchedule(self, applet_id):
-        events = list(self.find({'applet_id': ObjectId(applet_id)}, fields=['data', 'schedule']))
+        return self.getSchedules([applet_id])[str(applet_id)]
 
-        for event in events:
-            event['id'] = event['_id']
-            event.pop('_id')
+    def getSchedules(self, applet_ids):
+        """
+        Get all events of several applets with a single query.
+
+        :returns: dict of str(applet_id) to schedule.
+        """
+        applet_ids = [ObjectId(applet_id) for applet_id in applet_ids]
+        events = {str(applet_id): [] for applet_id in applet_ids}
 
+        for event in self.find({'applet_id': {'$in': applet_ids}}, fields=['applet_id', 'data', 'schedule']):
+            event['id'] = event.pop('_id')
+            events[str(event.pop('applet_id'))].append(event)
+
+        return {
+            applet_id: self._formatSchedule(events[applet_id]) for applet_id in events
+        }
+
+    def _formatSchedule(self, events):
         return {
             "type": 2,
             "size": 1,
@@ -276,50 +320,222 @@ class Events(Model):
             return ( (not endDate or lastAvailableTime >= date), lastAvailableTime )
 
     def getScheduleForUser(self, applet_id, user_id, dayFilter=None):
-        profile = Profile().findOne({'appletId': ObjectId(applet_id), 'userId': ObjectId(user_id)})
-        individualized = profile['individual_events'] > 0
-        events = self.getEvents(applet_id, individualized, profile['_id'])
+        return self.getSchedulesForUser([applet_id], user_id, dayFilter)[str(applet_id)]
+
+    def getSchedulesForUser(self, applet_ids, user_id, dayFilter=None):
+        """
+        Get the schedule of a user for several applets. The events of a given
+        day are read from the precomputed ``EventSchedule``, otherwise the
+        user's profiles and the events of all applets are loaded with one
+        query each.
+
+        :returns: dict of str(applet_id) to schedule.
+        """
+        applet_ids = [ObjectId(applet_id) for applet_id in applet_ids]
+        profiles = {
+            profile['appletId']: profile for profile in Profile().find({
+                'appletId': {'$in': applet_ids},
+                'userId': ObjectId(user_id)
+            }, fields=['appletId', 'individual_events'])
+        }
+        individualized = [
+            applet_id for applet_id in applet_ids if profiles.get(
+                applet_id, {}
+            ).get('individual_events', 0) > 0
+        ]
+
+        if dayFilter and dayFilter == datetime.datetime.combine(dayFilter.date(), datetime.time()):
+            return self._getMaterializedSchedules({
+                applet_id: profiles[applet_id]['_id'] if applet_id in individualized else None
+                for applet_id in applet_ids
+            }, dayFilter)
+
+        events = {applet_id: [] for applet_id in applet_ids}
+        for event in self.find({'$or': [{
+            'applet_id': {'$in': [
+                applet_id for applet_id in applet_ids if applet_id not in individualized
+            ]},
+            'individualized': False
+        }, {
+            'applet_id': {'$in': individualized},
+            'individualized': True,
+            'data.users': {'$in': [profiles[applet_id]['_id'] for applet_id in individualized]}
+        }]}, fields=['applet_id', 'individualized', 'data', 'schedule']):
+            applet_id = event.pop('applet_id')
+            if event.pop('individualized') and profiles[applet_id]['_id'] not in event['data'].get('users', []):
+                continue
+            if 'data' in event and 'users' in event['data']:
+                event['data'].pop('users')
+            events[applet_id].append(event)
 
-        lastEvent = {}
-        onlyScheduledDay = {}
+        return {
+            str(applet_id): self._filterUserSchedule(events[applet_id], dayFilter) for applet_id in applet_ids
+        }
+
+    def _filterUserSchedule(self, events, dayFilter=None):
         for event in events:
             event['id'] = event['_id']
             event.pop('_id')
+            event['valid'] = False
 
-            event['valid'] = True
-            if dayFilter:
-                event['valid'], lastAvailableTime = self.dateMatch(event, dayFilter)
+        selected = self._eventsOfDay(events, dayFilter)
+        for event, valid in selected:
+            event['valid'] = valid
 
-                activityId = event.get('data', {}).get('activity_id', None)
+        return self._formatSchedule([event for event, valid in selected])
 
-                if not activityId:
-                    event['valid'] = False
-                    continue
+    def _eventsOfDay(self, events, dayFilter=None):
+        """
+        Select the events to show on a day: the ones active that day, then
+        for each activity without any, its latest expired event if it still
+        allows completion or is only available on scheduled days.
 
-                if not event['valid']:
-                    if lastAvailableTime:
-                        if activityId not in lastEvent or (lastEvent[activityId] and lastAvailableTime > lastEvent[activityId][0]):
-                            lastEvent[activityId] = (lastAvailableTime, event)
-                else:
-                    lastEvent[activityId] = None
+        :returns: list of ``(event, valid)``.
+        """
+        if not dayFilter:
+            return [(event, True) for event in events]
 
-                if event['data'].get('eventType', None) and event['data'].get('onlyScheduledDay', False):
-                    onlyScheduledDay[activityId] = True
+        valid = []
+        lastEvent = {}
+        onlyScheduledDay = {}
+        for event in events:
+            isValid, lastAvailableTime = self.dateMatch(event, dayFilter)
+
+            activityId = event.get('data', {}).get('activity_id', None)
+
+            if not activityId:
+                continue
+
+            if not isValid:
+                if lastAvailableTime:
+                    if activityId not in lastEvent or (lastEvent[activityId] and lastAvailableTime > lastEvent[activityId][0]):
+                        lastEvent[activityId] = (lastAvailableTime, event)
+            else:
+                lastEvent[activityId] = None
+                valid.append(event)
+
+            if event['data'].get('eventType', None) and event['data'].get('onlyScheduledDay', False):
+                onlyScheduledDay[activityId] = True
+
+        return [(event, True) for event in valid] + [
+            (value[1], False) for value in lastEvent.values() if value and (value[1]['data'].get('completion', False) or value[1]['data'].get('activity_id', None) in onlyScheduledDay)
+        ]
+
+    def refreshSchedules(self, applet_id, profile_ids=None):
+        """
+        Recompute the ``EventSchedule`` of an applet and of the given
+        profiles, or of every profile with individualized events if none are
+        given. Called whenever the applet's events change.
+        """
+        applet_id = ObjectId(applet_id)
+
+        if profile_ids is None:
+            profile_ids = set(itertools.chain.from_iterable(
+                event['data'].get('users', []) for event in self.find({
+                    'applet_id': applet_id,
+                    'individualized': True
+                }, fields=['data.users'])
+            ))
+            EventSchedule().removeWithQuery({
+                'applet_id': applet_id,
+                'profile_id': {'$nin': [None] + list(profile_ids)}
+            })
 
-        return {
-            "type": 2,
-            "size": 1,
-            "fill": True,
-            "minimumSize": 0,
-            "repeatCovers": True,
-            "listTimes": False,
-            "eventsOutside": True,
-            "updateRows": True,
-            "updateColumns": False,
-            "around": 1585724400000,
-            'events': ([
-                event for event in events if event['valid']
-            ] + [
-                value[1] for value in lastEvent.values() if value and (value[1]['data'].get('completion', False) or value[1]['data'].get('activity_id', None) in onlyScheduledDay)
-            ])
+        self._materializeSchedule(applet_id, None)
+        for profile_id in set(profile_ids):
+            self._materializeSchedule(applet_id, ObjectId(profile_id))
+
+    def _materializeSchedule(self, applet_id, profile_id, events=None):
+        if events is None:
+            events = self.getEvents(applet_id, profile_id is not None, profile_id)
+        for event in events:
+            event['id'] = event.pop('_id')
+
+        document = {
+            'applet_id': applet_id,
+            'profile_id': profile_id,
+            'events': events,
+            'days': self._scheduleDays(events),
+            'updated': datetime.datetime.utcnow()
+        }
+        query = {
+            'applet_id': applet_id,
+            'profile_id': profile_id
         }
+        try:
+            EventSchedule().collection.replace_one(query, document, upsert=True)
+        except DuplicateKeyError:
+            # Another request materialized it first.
+            document = EventSchedule().collection.find_one(query) or document
+
+        return document
+
+    def _scheduleDays(self, events):
+        """
+        Index the events active on each day of the window, which starts
+        yesterday (UTC).
+        """
+        start = datetime.datetime.combine(
+            datetime.datetime.utcnow().date(), datetime.time()
+        ) - datetime.timedelta(days=1)
+        days = {}
+        for n in range(SCHEDULE_WINDOW_DAYS):
+            day = start + datetime.timedelta(days=n)
+            days[day.strftime('%Y-%m-%d')] = self._indexEventsOfDay(events, day)
+        return days
+
+    def _indexEventsOfDay(self, events, day):
+        index = {id(event): i for i, event in enumerate(events)}
+        return [
+            [index[id(event)], valid] for event, valid in self._eventsOfDay(events, day)
+        ]
+
+    def _getMaterializedSchedules(self, audiences, dayFilter):
+        """
+        :param audiences: dict of applet_id to the profile_id whose
+            individualized schedule applies, or None.
+        :returns: dict of str(applet_id) to schedule.
+        """
+        key = dayFilter.strftime('%Y-%m-%d')
+        documents = {
+            (document['applet_id'], document.get('profile_id')): document
+            for document in EventSchedule().collection.find({
+                'applet_id': {'$in': list(audiences)},
+                'profile_id': {'$in': list(set(audiences.values()))}
+            }, {
+                'applet_id': True,
+                'profile_id': True,
+                'events': True,
+                'updated': True,
+                'days.' + key: True
+            })
+        }
+
+        schedules = {}
+        for applet_id, profile_id in audiences.items():
+            document = documents.get((applet_id, profile_id))
+            if document is None:
+                document = self._materializeSchedule(applet_id, profile_id)
+
+            day = document.get('days', {}).get(key)
+            if day is None:
+                days = self._scheduleDays(document['events'])
+                day = days.get(key)
+                if day is None:
+                    # Outside of the window, not stored.
+                    day = self._indexEventsOfDay(document['events'], dayFilter)
+                else:
+                    # The window moved on since the events last changed. The
+                    # days are replaced, unless the events changed meanwhile.
+                    EventSchedule().collection.update_one({
+                        'applet_id': applet_id,
+                        'profile_id': profile_id,
+                        'updated': document.get('updated')
+                    }, {'$set': {'days': days}})
+
+            events = document['events']
+            schedules[str(applet_id)] = self._formatSchedule([
+                dict(events[i], valid=valid) for i, valid in day
+            ])
+
+        return schedules
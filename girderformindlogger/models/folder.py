@@ -38,6 +38,7 @@ class Folder(AccessControlledModel):
                 'meta.protocol.url',
                 'meta.activity.url',
                 'meta.contentType',
+                'ancestors._id',
                 ([
                     ('parentId', 1),
                     ('name', 1),
@@ -141,7 +142,7 @@ class Folder(AccessControlledModel):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId', 'parentCollection',
-                       'name', 'lowerName'}
+                       'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
 
         doc = super(Folder, self).load(
@@ -150,7 +151,7 @@ class Folder(AccessControlledModel):
 
         if doc is not None:
             if 'baseParentType' not in doc:
-                pathFromRoot = self.parentsToRoot(doc, user=user, force=True)
+                pathFromRoot = self.ancestorsToRoot(doc)
                 baseParent = pathFromRoot[0]
                 doc['baseParentId'] = baseParent['object']['_id']
                 doc['baseParentType'] = baseParent['type']
@@ -312,13 +313,15 @@ class Folder(AccessControlledModel):
                            or folder).
         :type parentType: str
         """
-        if (parentType == 'folder' and (
-                self._isAncestor(folder, parent) or folder['_id'] == parent['_id'])):
+        if (parentType == 'folder' and (folder['_id'] == parent['_id'] or any(
+                ancestor['object']['_id'] == folder['_id']
+                for ancestor in self.ancestorsToRoot(parent)))):
             raise ValidationException(
                 'You may not move a folder underneath itself.')
 
         folder['parentId'] = parent['_id']
         folder['parentCollection'] = parentType
+        folder['ancestors'] = self._childAncestors(parent, parentType)
 
         if parentType == 'folder':
             rootType, rootId = parent['baseParentType'], parent['baseParentId']
@@ -344,7 +347,20 @@ class Folder(AccessControlledModel):
                 }
             })
 
-        return self.save(folder)
+        folder = self.save(folder)
+
+        # Descendants keep their path below the moved folder.
+        prefix = self._childAncestors(folder, 'folder')
+        for descendant in self.find({
+            'ancestors._id': folder['_id']
+        }, fields=['ancestors']):
+            ancestorIds = [ancestor['_id'] for ancestor in descendant['ancestors']]
+            self.update({'_id': descendant['_id']}, {'$set': {
+                'ancestors': prefix + descendant['ancestors'][
+                    ancestorIds.index(folder['_id']) + 1:]
+            }}, multi=False)
+
+        return folder
 
     def clean(self, folder, progress=None, **kwargs):
         """
@@ -523,8 +539,7 @@ class Folder(AccessControlledModel):
 
         if parentType == 'folder':
             if 'baseParentId' not in parent:
-                pathFromRoot = self.parentsToRoot(
-                    parent, user=creator, force=True)
+                pathFromRoot = self.ancestorsToRoot(parent)
                 parent['baseParentId'] = pathFromRoot[0]['object']['_id']
                 parent['baseParentType'] = pathFromRoot[0]['type']
         else:
@@ -549,7 +564,8 @@ class Folder(AccessControlledModel):
             'created': now,
             'updated': now,
             'size': 0,
-            'meta': {}
+            'meta': {},
+            'ancestors': self._childAncestors(parent, parentType)
         }
 
         if accountId != None:
@@ -588,7 +604,18 @@ class Folder(AccessControlledModel):
             self.validate(folder, allowRename=True)
 
         # Validate and save the folder
-        return self.save(folder)
+        folder = self.save(folder)
+        self.renameAncestor(folder)
+        return folder
+
+    def renameAncestor(self, doc):
+        """
+        Update the name of a folder or collection in the ancestors of the
+        folders under it.
+        """
+        self.update({'ancestors._id': doc['_id']}, {'$set': {
+            'ancestors.$.name': doc['name']
+        }})
 
     def filter(self, doc, user=None, additionalKeys=None):
         """
@@ -635,6 +662,79 @@ class Folder(AccessControlledModel):
 
             return self.parentsToRoot(curParentObject, curPath, user=user, force=force)
 
+    def ancestorsToRoot(self, folder):
+        """
+        Like ``parentsToRoot(folder, force=True)``, but answered from the
+        ancestors stored on the folder, so each ``object`` only has the
+        ``_id`` and, unless it is a user, the ``name`` of the ancestor. Folders
+        stored without ancestors get them here.
+
+        :param folder: The folder whose root to find
+        :type folder: dict
+        :returns: an ordered list of dictionaries from root to the current folder
+        """
+        ancestors = folder.get('ancestors')
+        if ancestors is None:
+            ancestors = self.setAncestors(folder)
+
+        return [{
+            'type': ancestor['type'],
+            'object': {
+                key: ancestor[key] for key in ('_id', 'name') if key in ancestor
+            }
+        } for ancestor in ancestors]
+
+    def setAncestors(self, folder):
+        """
+        Compute and store the ancestors of a folder, a list of ``{'_id',
+        'type', 'name'}`` from its root to its parent.
+        """
+        parent = ModelImporter.model(folder['parentCollection']).load(
+            folder['parentId'], force=True)
+        folder['ancestors'] = self._childAncestors(parent, folder['parentCollection'])
+        self.update({'_id': folder['_id']}, {'$set': {
+            'ancestors': folder['ancestors']
+        }}, multi=False)
+        return folder['ancestors']
+
+    def backfillAncestors(self, rebuild=False):
+        """
+        Store the ancestors of every folder stored without them.
+
+        :param rebuild: Recompute the ancestors of all folders.
+        :type rebuild: bool
+        :returns: the number of folders updated and the ids of the folders
+            whose parent no longer exists.
+        """
+        if rebuild:
+            self.update({}, {'$unset': {'ancestors': True}})
+
+        missing = {'ancestors': {'$exists': False}}
+        count = self.collection.count_documents(missing)
+        orphans = []
+        for folder in self.find(missing, fields=['parentId', 'parentCollection']):
+            # Computing a folder's ancestors also stores those of its parents.
+            if self.findOne(dict(missing, _id=folder['_id']), fields=['_id']) is None:
+                continue
+            try:
+                self.setAncestors(folder)
+            except TypeError:
+                orphans.append(folder['_id'])
+        return count - len(orphans), orphans
+
+    def _childAncestors(self, parent, parentType):
+        entry = {'_id': parent['_id'], 'type': parentType}
+        if parent.get('name') is not None:
+            entry['name'] = parent['name']
+
+        if parentType != 'folder':
+            return [entry]
+
+        ancestors = parent.get('ancestors')
+        if ancestors is None:
+            ancestors = self.setAncestors(parent)
+        return ancestors + [entry]
+
     def countItems(self, folder):
         """
         Returns the number of items within the given folder.
@@ -311,6 +311,92 @@ class Item(acl_mixin.AccessControlMixin, Model):
             'meta': {}
         }, validate=validate)
 
+    def createItems(self, items, creator):
+        """
+        Create several items with a single insert. Names are made unique
+        among their siblings the same way ``validate`` does for one item.
+
+        :param items: The items to create, each a dict with the ``name`` and
+            ``folder`` of the item and any other field to store on it (e.g.
+            ``_id`` or ``meta``).
+        :type items: list of dict
+        :param creator: User document representing the creator of the items.
+        :type creator: dict
+        :returns: The item documents that were created, in order.
+        """
+        import re
+        from collections import defaultdict
+        from girderformindlogger.models.folder import Folder
+
+        if not isinstance(creator, dict) or '_id' not in creator:
+            # Internal error -- this shouldn't be called without a user.
+            raise GirderException('Creator must be a user.',
+                                  'girderformindlogger.models.item.creator-not-user')
+
+        now = datetime.datetime.utcnow()
+        documents = []
+        for item in items:
+            folder = item['folder']
+            if 'baseParentType' not in folder:
+                pathFromRoot = self.parentsToRoot({'folderId': folder['_id']},
+                                                  creator, force=True)
+                folder['baseParentType'] = pathFromRoot[0]['type']
+                folder['baseParentId'] = pathFromRoot[0]['object']['_id']
+
+            document = {
+                'description': '',
+                'creatorId': creator['_id'],
+                'created': now,
+                'updated': now,
+                'size': 0,
+                'meta': {}
+            }
+            document.update({key: value for key, value in item.items() if key != 'folder'})
+            document.update({
+                'name': self._validateString(item['name']),
+                'description': self._validateString(document['description']),
+                'folderId': ObjectId(folder['_id']),
+                'baseParentType': folder['baseParentType'],
+                'baseParentId': folder['baseParentId']
+            })
+            if not document['name']:
+                raise ValidationException('Item name must not be empty.', 'name')
+            documents.append(document)
+
+        # The names already taken by siblings, fetched at once.
+        folderIds = list({document['folderId'] for document in documents})
+        pattern = '^(%s)( \\(\\d+\\))?$' % '|'.join(
+            re.escape(name) for name in {document['name'] for document in documents})
+        taken = defaultdict(set)
+        for sibling in self.find({
+            'folderId': {'$in': folderIds},
+            'name': {'$regex': pattern}
+        }, fields=['folderId', 'name']):
+            taken[sibling['folderId']].add(sibling['name'])
+        for sibling in Folder().find({
+            'parentId': {'$in': folderIds},
+            'parentCollection': 'folder',
+            'name': {'$regex': pattern}
+        }, fields=['parentId', 'name']):
+            taken[sibling['parentId']].add(sibling['name'])
+
+        lastSuffix = {}
+        for document in documents:
+            siblings = taken[document['folderId']]
+            name = document['name']
+            if name in siblings:
+                n = lastSuffix.get((document['folderId'], name), 0)
+                candidate = name
+                while candidate in siblings:
+                    n += 1
+                    candidate = '%s (%d)' % (name, n)
+                lastSuffix[(document['folderId'], name)] = n
+                document['name'] = candidate
+            siblings.add(document['name'])
+            document['lowerName'] = document['name'].lower()
+
+        return self.insertMany(documents)
+
     def updateItem(self, item, folder=None):
         """
         Updates an item.
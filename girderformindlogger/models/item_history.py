@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from bson.objectid import ObjectId
+from girderformindlogger.models.model_base import Model
+from pymongo.errors import DuplicateKeyError
+
+
+class ItemHistoryIndex(Model):
+    """
+    The version history of every item of a protocol, as stored in the
+    reference items of its history references folder, gathered into a single
+    document so resolving item versions does not need one query per IRI.
+
+    ``jsonld_expander.insertHistoryData`` invalidates the document whenever
+    it records new history; it is rebuilt on the next read.
+    """
+
+    def initialize(self):
+        self.name = 'itemHistoryIndex'
+        self.ensureIndices(
+            (
+                ([('referencesId', 1)], {'unique': True}),
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    def invalidate(self, referencesId):
+        self.collection.update_one({
+            'referencesId': ObjectId(referencesId)
+        }, {
+            '$inc': {'revision': 1},
+            '$unset': {'history': True}
+        }, upsert=True)
+
+    def getHistory(self, referencesFolder):
+        """
+        :param referencesFolder: The protocol's history references folder.
+        :returns: dict of item IRI to its history, a list of ``{'version',
+            'reference'}`` in the order it was recorded.
+        """
+        from girderformindlogger.models.item import Item as ItemModel
+
+        document = self.collection.find_one({
+            'referencesId': referencesFolder['_id']
+        })
+        if document and 'history' in document:
+            return {
+                entry['identifier']: entry['history']
+                for entry in document['history']
+            }
+
+        revision = document.get('revision', 0) if document else 0
+        history = [{
+            'identifier': reference['meta']['identifier'],
+            'history': [{
+                'version': entry['version'],
+                'reference': entry.get('reference')
+            } for entry in reference['meta'].get('history', [])]
+        } for reference in ItemModel().find({
+            'folderId': referencesFolder['_id'],
+            'meta.identifier': {'$exists': True}
+        }, fields=['meta.identifier', 'meta.history'])]
+
+        # Only store the index if no history was written while it was built.
+        try:
+            self.collection.update_one({
+                'referencesId': referencesFolder['_id'],
+                'revision': revision
+            }, {
+                '$set': {
+                    'history': history,
+                    'updated': datetime.datetime.utcnow()
+                }
+            }, upsert=not document)
+        except DuplicateKeyError:
+            pass
+
+        return {entry['identifier']: entry['history'] for entry in history}
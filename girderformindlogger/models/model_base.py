@@ -8,7 +8,7 @@ import six
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from pymongo.errors import WriteError
+from pymongo.errors import BulkWriteError, WriteError
 from dictdiffer import diff
 from girderformindlogger import events, logprint, logger, auditLogger
 from girderformindlogger.constants import ACCESS_FLAGS, AccessType,            \
@@ -240,6 +240,7 @@ class Model(object):
         import threading
         from . import cycleModels
         from girderformindlogger.utility import loadJSON
+        from girderformindlogger.utility.document_loader import getDocumentLoader
         from girderformindlogger.utility.jsonld_expander import camelCase,     \
             expand, importAndCompareModelType, loadCache, reprolibCanonize,    \
             snake_case
@@ -277,30 +278,32 @@ class Model(object):
                         ] else " {}".format(modelType)
                     )
                 )
-            compact = loadJSON(url)
-            if thread:
-                thread = threading.Thread(
-                    target=importAndCompareModelType,
-                    args=(compact,),
-                    kwargs={'url': url, 'user': user, 'modelType': modelType, 'meta': meta, 'existing': cachedDoc}
-                )
-                thread.start()
-                return(
-                    {
-                        "message": "This JSON LD document is not cached and must "
-                                   "be loaded. Please check back in several "
-                                   "minutes."
-                    },
-                    self.getModelType(compact)
+            # A refresh revalidates every document it reads.
+            with getDocumentLoader().revalidating(refreshCache):
+                compact = loadJSON(url)
+                if thread:
+                    thread = threading.Thread(
+                        target=importAndCompareModelType,
+                        args=(compact,),
+                        kwargs={'url': url, 'user': user, 'modelType': modelType, 'meta': meta, 'existing': cachedDoc}
+                    )
+                    thread.start()
+                    return(
+                        {
+                            "message": "This JSON LD document is not cached and must "
+                                       "be loaded. Please check back in several "
+                                       "minutes."
+                        },
+                        self.getModelType(compact)
+                    )
+                model, modelType = importAndCompareModelType(
+                    compact,
+                    url=url,
+                    user=user,
+                    modelType=modelType,
+                    meta=meta,
+                    existing=cachedDoc
                 )
-            model, modelType = importAndCompareModelType(
-                compact,
-                url=url,
-                user=user,
-                modelType=modelType,
-                meta=meta,
-                existing=cachedDoc
-            )
         else:
             model = cachedDoc
             modelType = self.getModelType(model)
@@ -642,6 +645,45 @@ class Model(object):
 
         return document
 
+    def insertMany(self, documents, triggerEvents=True):
+        """
+        Insert several new documents with a single ``insert_many``. The
+        documents are not validated, callers are responsible for that; the
+        same events as ``save`` are triggered for each of them.
+
+        :param documents: The documents to insert.
+        :type documents: list of dict
+        :param triggerEvents: Whether to trigger the pre- and post-save events.
+        :returns: the inserted documents.
+        """
+        if triggerEvents:
+            documents = [
+                document for document in documents
+                if not events.trigger('model.%s.save' % self.name, document).defaultPrevented
+            ]
+        if not documents:
+            return documents
+
+        try:
+            insertedIds = self.collection.insert_many(documents).inserted_ids
+        except (BulkWriteError, WriteError) as e:
+            raise ValidationException('Database save failed: %s' % e.details)
+        for document, insertedId in zip(documents, insertedIds):
+            document['_id'] = insertedId
+
+        if triggerEvents:
+            for document in documents:
+                auditLogger.info('document.create', extra={
+                    'details': {
+                        'collection': self.name,
+                        'id': document['_id']
+                    }
+                })
+                events.trigger('model.%s.save.created' % self.name, document)
+                events.trigger('model.%s.save.after' % self.name, document)
+
+        return documents
+
     def update(self, query, update, multi=True):
         """
         This method should be used for updating multiple documents in the
@@ -4,6 +4,7 @@ import six
 import time
 
 from girderformindlogger.models.model_base import Model
+from girderformindlogger.utility.notification_dispatcher import getNotificationDispatcher
 
 
 class ProgressState(object):
@@ -73,7 +74,9 @@ class Notification(Model):
         if expires is not None:
             doc['expires'] = expires
 
-        return self.save(doc)
+        doc = self.save(doc)
+        getNotificationDispatcher().publish(doc)
+        return doc
 
     def initProgress(self, user, title, total=0, state=ProgressState.ACTIVE,
                      current=0, message='', token=None, estimateTime=True, resource=None,
@@ -183,7 +186,9 @@ class Notification(Model):
                             total * (record['updatedTime'] - record['startTime']) / current
                 except ValueError:
                     pass
-            return self.save(record)
+            record = self.save(record)
+            getNotificationDispatcher().publish(record)
+            return record
         else:
             return record
 
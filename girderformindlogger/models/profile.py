@@ -4,6 +4,7 @@ import json
 import os
 
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 from girderformindlogger.constants import AccessType, DEFINED_RELATIONS, PROFILE_FIELDS
 from girderformindlogger.exceptions import ValidationException, AccessException
 from girderformindlogger.models.aes_encrypt import AESEncryption, AccessControlledModel
@@ -25,7 +26,9 @@ class Profile(AESEncryption, dict):
                 'userId',
                 'individual_events',
                 'completed_activities',
-                'reviewers'
+                'reviewers',
+                # profiles notified by external.notification.send_push_notification
+                ([('appletId', 1), ('timezone', 1), ('individual_events', 1)], {})
             )
         )
 
@@ -152,20 +155,22 @@ class Profile(AESEncryption, dict):
                     )
                 )
 
-    def cycleDefinitions(self, userProfile, showEmail=False, showIDCode=False):
+    def cycleDefinitions(self, userProfile, showEmail=False, showIDCode=False, idCodes=None):
         """
         :param userProfile: Profile or Invitation
         :type userProfile: dict
         :param showEmail: Show email in profile?
         :type showEmail: bool
+        :param idCodes: ID codes of profiles by id, looked up if missing.
+        :type idCodes: dict
         :returns dict: display profile
         """
-        profileFields = PROFILE_FIELDS
+        profileFields = list(PROFILE_FIELDS)
 
         if showEmail and not userProfile.get('email_encrypted', False):
             profileFields.append('email')
 
-        displayProfile = userProfile.get("coordinatorDefined", {})
+        displayProfile = dict(userProfile.get("coordinatorDefined", {}))
         displayProfile.update(userProfile.get("userDefined", {}))
 
         displayProfile.update({
@@ -180,7 +185,7 @@ class Profile(AESEncryption, dict):
             profileFields.append('idCode')
             if userProfile.get('profile', False):
                 displayProfile.update({
-                    "idCodes": IDCode().findIdCodes(
+                    "idCodes": (idCodes or {}).get(userProfile['_id']) or IDCode().findIdCodes(
                         userProfile['_id']
                     )
                 })
@@ -226,7 +231,7 @@ class Profile(AESEncryption, dict):
         :type user: dict
         :returns dict: display profile
         """
-        import threading
+        from girderformindlogger.utility.background import getBackgroundExecutor
 
         loadingMessage = '{loading}…'
         if 'cachedDisplay' in profile:
@@ -239,11 +244,11 @@ class Profile(AESEncryption, dict):
         else:
             profile['cachedDisplay'] = {}
 
-        thread = threading.Thread(
-            target=self._cacheProfileDisplay,
-            args=(profile, user, forceManager, forceReviewer)
+        getBackgroundExecutor().submit(
+            ('profileDisplay', profile['_id'], forceManager, forceReviewer),
+            self._cacheProfileDisplay,
+            profile, user, forceManager, forceReviewer
         )
-        thread.start()
         return({
             '_id': profile['_id'],
             'displayName': loadingMessage,
@@ -251,6 +256,38 @@ class Profile(AESEncryption, dict):
             'idCodes': [loadingMessage]
         })
 
+    def displayProfilesFields(
+        self,
+        profiles,
+        user=None,
+        forceManager=False,
+        forceReviewer=False
+    ):
+        """
+        Like displayProfileFields for a list of profiles, but the displays that
+        are not cached yet are computed rather than left to a background
+        thread, a few queries for all of them.
+
+        :param profiles: Profiles or Invitations
+        :type profiles: list of dict
+        :param user: user requesting profiles
+        :type user: dict
+        :returns list: display profiles, in the same order
+        """
+        view = 'reviewer' if forceReviewer else 'manager' if forceManager else None
+        missing = [
+            profile for profile in profiles
+            if view is None or view not in profile.get('cachedDisplay', {})
+        ]
+        computed = dict(zip(
+            map(id, missing),
+            self._cacheProfileDisplays(missing, user, forceManager, forceReviewer)
+        )) if missing else {}
+
+        return [
+            computed[id(profile)] if id(profile) in computed else profile['cachedDisplay'][view]
+            for profile in profiles
+        ]
 
     def _cacheProfileDisplay(
         self,
@@ -259,29 +296,77 @@ class Profile(AESEncryption, dict):
         forceManager=False,
         forceReviewer=False
     ):
+        return self._cacheProfileDisplays([profile], user, forceManager, forceReviewer)[0]
+
+    def _cacheProfileDisplays(
+        self,
+        profiles,
+        user,
+        forceManager=False,
+        forceReviewer=False
+    ):
+        """
+        Compute the displays of profiles and, for the manager and reviewer
+        views, store them in their cachedDisplay.
+
+        :returns list: display profiles, in the same order
+        """
         from girderformindlogger.models.applet import Applet
-        profileDefinitions = self.cycleDefinitions(
-            profile,
-            showEmail=forceManager if forceManager else Applet(
-            ).isCoordinator(profile['appletId'], user),
-            showIDCode=forceReviewer if forceReviewer else Applet(
-            ).isCoordinator(profile['appletId'], user)
-        )
+        from girderformindlogger.models.ID_code import IDCode
 
-        if 'invitedBy' in profile:
-            profileDefinitions['invitedBy'] = self.cycleDefinitions(
-                profile['invitedBy'],
-                showEmail=False
+        isCoordinator = {}
+
+        def coordinates(appletId):
+            if appletId not in isCoordinator:
+                isCoordinator[appletId] = Applet().isCoordinator(appletId, user)
+            return isCoordinator[appletId]
+
+        idCodes = {}
+        withIdCodes = [
+            profile['_id'] for profile in profiles if profile.get('profile', False) and (
+                forceReviewer or coordinates(profile['appletId'])
+            )
+        ]
+        if withIdCodes:
+            for idCode in IDCode().find(
+                {'profileId': {'$in': withIdCodes + [str(profileId) for profileId in withIdCodes]}},
+                fields=['profileId', 'code']
+            ):
+                if 'code' in idCode:
+                    idCodes.setdefault(ObjectId(idCode['profileId']), []).append(idCode['code'])
+
+        view = 'reviewer' if forceReviewer else 'manager' if forceManager else None
+        displays = []
+        updates = []
+        for profile in profiles:
+            profileDefinitions = self.cycleDefinitions(
+                profile,
+                showEmail=forceManager if forceManager else coordinates(profile['appletId']),
+                showIDCode=forceReviewer if forceReviewer else coordinates(profile['appletId']),
+                idCodes=idCodes
             )
 
-        if forceManager and not forceReviewer:
-            profile['cachedDisplay']['manager'] = profileDefinitions
-            self.save(profile, validate=False)
-        elif forceReviewer:
-            profile['cachedDisplay']['reviewer'] = profileDefinitions
-            self.save(profile, validate=False)
-        print(profileDefinitions)
-        return(profileDefinitions)
+            if 'invitedBy' in profile:
+                profileDefinitions['invitedBy'] = self.cycleDefinitions(
+                    profile['invitedBy'],
+                    showEmail=False
+                )
+
+            if view:
+                profile.setdefault('cachedDisplay', {})[view] = profileDefinitions
+                stored = self.encryptFields(
+                    {'cachedDisplay': {view: dict(profileDefinitions)}},
+                    self.fields
+                )
+                updates.append(UpdateOne(
+                    {'_id': profile['_id']},
+                    {'$set': {'cachedDisplay.' + view: stored['cachedDisplay'][view]}}
+                ))
+            displays.append(profileDefinitions)
+
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
+        return(displays)
 
     def getProfile(self, id, user):
         from girderformindlogger.models.applet import Applet as AppletModel
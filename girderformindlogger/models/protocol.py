@@ -29,10 +29,19 @@ from girderformindlogger import events
 from girderformindlogger.api.rest import getCurrentUser
 from girderformindlogger.constants import AccessType, SortDir, MODELS
 from girderformindlogger.exceptions import ValidationException, GirderException
+from girderformindlogger.models.cache import LocalCacheTier
 from girderformindlogger.models.folder import Folder as FolderModel
+from girderformindlogger.models.item_history import ItemHistoryIndex
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility.progress import noProgress, setResponseTimeLimit
 
+# Upper bound (in bytes) of the per-process memo of historical screens and
+# activities.
+HISTORY_SNAPSHOTS_MAX_BYTES = 64 * 1024 * 1024
+
+_historySnapshots = LocalCacheTier(HISTORY_SNAPSHOTS_MAX_BYTES)
+
+
 class Protocol(FolderModel):
     def importUrl(self, url, user=None, refreshCache=False):
         """
@@ -73,13 +82,13 @@ class Protocol(FolderModel):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId',
-                       'parentCollection', 'name', 'lowerName'}
+                       'parentCollection', 'name', 'lowerName', 'ancestors'}
         loadFields = self._supplementFields(fields, extraFields)
         doc = super(FolderModel, self).load(
             id=id, level=level, user=user, objectId=objectId, force=force,
             fields=loadFields, exc=exc)
         if doc is not None:
-            pathFromRoot = FolderModel().parentsToRoot(doc, user=user, force=True)
+            pathFromRoot = FolderModel().ancestorsToRoot(doc)
             if 'baseParentType' not in doc:
                 baseParent = pathFromRoot[0]
                 doc['baseParentId'] = baseParent['object']['_id']
@@ -116,10 +125,10 @@ class Protocol(FolderModel):
                     "Invalid Protocol ID."
                 )
 
-    def createProtocol(self, document, user, editExisting=False):
+    def createProtocol(self, document, user, editExisting=False, progress=noProgress):
         from girderformindlogger.utility import jsonld_expander
 
-        return jsonld_expander.loadFromSingleFile(document, user, editExisting)
+        return jsonld_expander.loadFromSingleFile(document, user, editExisting, progress=progress)
 
     def duplicateProtocol(self, protocolId, editor, prefLabel=None):
         from girderformindlogger.models.screen import Screen
@@ -317,67 +326,104 @@ class Protocol(FolderModel):
         return 0
 
     def getHistoryDataFromItemIRIs(self, protocolId, IRIGroup):
-        from girderformindlogger.models.item import Item as ItemModel
-        from girderformindlogger.utility import jsonld_expander
-
-        protocol = self.load(protocolId, force=True)
-
-        items = {}
-        activities = {}
-        itemReferences = {}
         result = {
-            'items': items,
-            'activities': activities,
-            'itemReferences': itemReferences
+            'items': {},
+            'activities': {},
+            'itemReferences': {}
         }
 
-        if 'historyId' not in protocol.get('meta', {}):
+        referencesFolder = self.getItemReferencesFolder(protocolId)
+        if not referencesFolder:
             return result
 
+        itemHistory = ItemHistoryIndex().getHistory(referencesFolder)
+        for IRI in IRIGroup:
+            self.addItemHistory(result, itemHistory.get(IRI), IRI, IRIGroup[IRI])
+
+        return result
+
+    def getItemReferencesFolder(self, protocolId):
+        """
+        Get the folder holding the version history of a protocol's items, or
+        None if the protocol has no history.
+        """
+        protocol = self.load(protocolId, force=True)
+
+        if 'historyId' not in protocol.get('meta', {}):
+            return None
+
         historyFolder = FolderModel().load(protocol['meta']['historyId'], force=True)
         if 'referenceId' not in historyFolder.get('meta', {}):
-            return result
+            return None
 
-        referencesFolder = FolderModel().load(historyFolder['meta']['referenceId'], force=True)
-        itemModel = ItemModel()
+        return FolderModel().load(historyFolder['meta']['referenceId'], force=True)
 
-        for IRI in IRIGroup:
-            reference = itemModel.findOne({ 'folderId': referencesFolder['_id'], 'meta.identifier': IRI })
-            if not reference:
-                continue
+    def addItemHistory(self, result, history, IRI, versions):
+        """
+        Add the item and activity snapshots for the given versions of one
+        item to a result of ``getHistoryDataFromItemIRIs``. Snapshots already
+        in the result are not loaded again.
+
+        :param history: The item's entry in ``ItemHistoryIndex().getHistory``,
+            None if it has no history.
+        """
+        items = result['items']
+        activities = result['activities']
+        itemReferences = result['itemReferences']
 
-            history = reference['meta']['history']
+        if not history:
+            return
 
-            for version in IRIGroup[IRI]:
-                if version not in itemReferences:
-                    itemReferences[version] = {}
+        for version in versions:
+            if version not in itemReferences:
+                itemReferences[version] = {}
 
-                inserted = False
-                for i in range(0, len(history)):
-                    if self.compareVersions(version, history[i]['version']) <= 0:
-                        if not history[i].get('reference', None):
-                            continue
+            inserted = False
+            for i in range(0, len(history)):
+                if self.compareVersions(version, history[i]['version']) <= 0:
+                    if not history[i].get('reference', None):
+                        continue
 
-                        if history[i]['reference'] not in items:
-                            (modelType, referenceId) = history[i]['reference'].split('/')
-                            model = MODELS()[modelType]().findOne({
-                                '_id': ObjectId(referenceId)
-                            })
-                            items[history[i]['reference']] = jsonld_expander.loadCache(model['cached'])
+                    if history[i]['reference'] not in items:
+                        snapshot = self._loadHistorySnapshot(history[i]['reference'])
+                        items[history[i]['reference']] = snapshot['item']
 
-                            activityId = str(model['meta']['activityId'])
+                        activityId = snapshot['activityId']
 
-                            if activityId not in activities:
-                                activities[activityId] = jsonld_expander.loadCache(
-                                    FolderModel().load(activityId, force=True)['cached']
-                                )
-                        if history[i]['reference']:
-                            itemReferences[version][IRI] = history[i]['reference']
-                        inserted = True
+                        if activityId not in activities:
+                            activities[activityId] = self._loadHistorySnapshot(
+                                'activity/{}'.format(activityId)
+                            )['item']
+                    if history[i]['reference']:
+                        itemReferences[version][IRI] = history[i]['reference']
+                    inserted = True
 
-                        break
+                    break
 
-                if not inserted:
-                    itemReferences[version][IRI] = None # this is same as latest version
+            if not inserted:
+                itemReferences[version][IRI] = None # this is same as latest version
 
-        return result
+    def _loadHistorySnapshot(self, reference):
+        """
+        Load the cached data of a historical screen or activity. Snapshots
+        are never modified once written, so they are memoized per process.
+
+        :param reference: ``<modelType>/<id>`` as stored in the history.
+        :returns: dict with the snapshot ``item`` and, for screens, the id of
+            its historical ``activityId``.
+        """
+        from girderformindlogger.utility import jsonld_expander
+
+        snapshot = _historySnapshots.get(reference)
+        if snapshot is None:
+            (modelType, referenceId) = reference.split('/')
+            model = MODELS()[modelType]().findOne({
+                '_id': ObjectId(referenceId)
+            })
+            snapshot = {
+                'item': jsonld_expander.loadCache(model['cached']),
+                'activityId': str(model['meta']['activityId']) if modelType == 'screen' else None
+            }
+            _historySnapshots.set(reference, None, snapshot)
+
+        return snapshot
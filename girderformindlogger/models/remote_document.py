@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from girderformindlogger.models.model_base import Model
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+
+class RemoteDocument(Model):
+    """
+    Documents fetched over HTTP by ``utility.document_loader`` when importing
+    protocols, with the validators (``etag``, ``lastModified``) needed to
+    revalidate them once their ``fetched`` time is older than the TTL.
+    """
+
+    def initialize(self):
+        self.name = 'remoteDocument'
+        self.ensureIndices(
+            (
+                ([('url', 1)], {'unique': True}),
+                'fetched'
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    def get(self, url):
+        return self.findOne({'url': url}, fields={'_id': False})
+
+    def put(self, entry):
+        try:
+            self.collection.update_one({
+                'url': entry['url']
+            }, {
+                '$set': entry
+            }, upsert=True)
+        except DuplicateKeyError:
+            pass
+
+    def prune(self, maxBytes):
+        """
+        Remove the least recently fetched documents until the stored bodies
+        take at most ``maxBytes``.
+
+        :returns: the number of documents removed.
+        """
+        total = next(self.collection.aggregate([
+            {'$group': {'_id': None, 'size': {'$sum': '$size'}}}
+        ]), {}).get('size', 0)
+
+        removed = []
+        if total > maxBytes:
+            for document in self.find(
+                {}, fields=['size'], sort=[('fetched', ASCENDING)]
+            ):
+                removed.append(document['_id'])
+                total -= document.get('size', 0)
+                if total <= maxBytes:
+                    break
+            self.removeWithQuery({'_id': {'$in': removed}})
+        return len(removed)
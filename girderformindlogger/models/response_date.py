@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from bson.objectid import ObjectId
+from girderformindlogger.models.model_base import Model
+
+
+class ResponseDate(Model):
+    """
+    Index of the distinct dates on which a user responded to an applet, so
+    that listing them does not require reading every response item.
+
+    Each document holds the dates (ISO strings, most recent first) of one
+    user and applet.
+    """
+
+    def initialize(self):
+        self.name = 'responseDate'
+        self.ensureIndices(
+            (
+                ([('userId', 1), ('appletId', 1)], {'unique': True}),
+                'appletId'
+            )
+        )
+
+    def validate(self, document):
+        return document
+
+    @staticmethod
+    def responseDate(response):
+        """
+        The date a response is listed under: when it was completed, or when
+        the item was created for responses without a completion time.
+        """
+        from girderformindlogger.utility.response import determine_date
+
+        return determine_date(
+            response.get('meta', {}).get(
+                'responseCompleted',
+                response.get('created')
+            )
+        ).isoformat()
+
+    def addResponse(self, response):
+        """
+        Record the date of a newly created response item.
+
+        :param response: The response item, with its metadata set.
+        :type response: dict
+        """
+        if response.get('baseParentType') != 'user':
+            return
+        self.addDates(
+            response['baseParentId'],
+            response['meta']['applet']['@id'],
+            [self.responseDate(response)]
+        )
+
+    def addDates(self, userId, appletId, dates):
+        """
+        Add dates to the entry of a user and applet. Pairs without an entry
+        are left alone: ``getDates`` builds them from all the response items,
+        which an entry created here would hide.
+        """
+        query = {
+            'userId': ObjectId(userId),
+            'appletId': ObjectId(appletId)
+        }
+        for date in dates:
+            self.collection.update_one({
+                **query,
+                'dates': {'$ne': date}
+            }, {
+                '$push': {'dates': {'$each': [date], '$sort': -1}},
+                '$set': {'updated': datetime.datetime.utcnow()}
+            })
+
+    def removeDates(self, userId=None, appletId=None):
+        """
+        Drop the index entries of a user and/or applet, for use when their
+        response items are deleted.
+        """
+        query = {}
+        if userId is not None:
+            query['userId'] = ObjectId(userId)
+        if appletId is not None:
+            query['appletId'] = ObjectId(appletId)
+        if query:
+            self.collection.delete_many(query)
+
+    def getDates(self, userId, appletIds):
+        """
+        Get the response dates of a user for several applets. Pairs that have
+        not been indexed yet are built from the response items on first use.
+
+        :returns: dict of str(appletId) to a list of ISO dates, most recent
+            first.
+        """
+        appletIds = [ObjectId(appletId) for appletId in appletIds]
+        dates = {}
+        for document in self.collection.find({
+            'userId': userId,
+            'appletId': {'$in': appletIds}
+        }, {'appletId': True, 'dates': True}):
+            dates[str(document['appletId'])] = document.get('dates', [])
+
+        missing = [
+            appletId for appletId in appletIds if str(appletId) not in dates
+        ]
+        if missing:
+            dates.update(self.rebuild(userId, missing))
+        return dates
+
+    def rebuild(self, userId=None, appletIds=None):
+        """
+        Rebuild the index from the response items, optionally restricted to
+        one user and/or a list of applets. When both are given, empty entries
+        are stored for applets without responses so they are not scanned
+        again.
+
+        :returns: dict of str(appletId) to dates when restricted to one user,
+            otherwise the number of (user, applet) entries written.
+        """
+        from girderformindlogger.models.response_folder import ResponseItem
+
+        query = {}
+        match = {'baseParentType': 'user', 'meta.applet.@id': {'$exists': True}}
+        if userId is not None:
+            query['userId'] = match['baseParentId'] = ObjectId(userId)
+        if appletIds is not None:
+            appletIds = [ObjectId(appletId) for appletId in appletIds]
+            query['appletId'] = match['meta.applet.@id'] = {'$in': appletIds}
+
+        entries = {}
+        if userId is not None and appletIds is not None:
+            entries = {(query['userId'], appletId): set() for appletId in appletIds}
+        for response in ResponseItem().collection.find(match, {
+            'baseParentId': True,
+            'meta.applet.@id': True,
+            'meta.responseCompleted': True,
+            'created': True
+        }):
+            key = (response['baseParentId'], response['meta']['applet']['@id'])
+            entries.setdefault(key, set()).add(self.responseDate(response))
+
+        self.collection.delete_many(query)
+        now = datetime.datetime.utcnow()
+        for (user, applet), dates in entries.items():
+            self.collection.replace_one({
+                'userId': user,
+                'appletId': applet
+            }, {
+                'userId': user,
+                'appletId': applet,
+                'dates': sorted(dates, reverse=True),
+                'updated': now
+            }, upsert=True)
+
+        if userId is None:
+            return len(entries)
+        return {
+            str(applet): sorted(dates, reverse=True)
+            for (user, applet), dates in entries.items()
+        }
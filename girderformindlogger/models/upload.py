@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import pymongo
 import six
 from bson.objectid import ObjectId
 
@@ -16,7 +17,9 @@ class Upload(Model):
     """
     This model stores temporary records for uploads that have been approved
     but are not yet complete, so that they can be uploaded in chunks of
-    arbitrary size. The chunks must be uploaded in order.
+    arbitrary size. The chunks must be uploaded in order, unless the upload
+    was created with a ``partSize``: its parts can then be sent in any order
+    and concurrently, see ``handlePart``.
     """
 
     def initialize(self):
@@ -131,6 +134,9 @@ class Upload(Model):
         from girderformindlogger.models.file import File
         from girderformindlogger.utility import assetstore_utilities
 
+        if upload.get('partSize'):
+            raise ValidationException('The parts of this upload must be sent by number.')
+
         assetstore = Assetstore().load(upload['assetstoreId'])
         adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
 
@@ -148,14 +154,66 @@ class Upload(Model):
         else:
             return upload
 
+    def handlePart(self, upload, part, chunk):
+        """
+        Store one part of an upload created with a ``partSize``. Parts can be
+        sent concurrently, in any order, and again if sending one failed.
+        Once every part was received, ``finalizeUpload`` assembles them.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The number of the part, from 0.
+        :type part: int
+        :param chunk: The file object representing the part.
+        :type chunk: file
+        :returns: the upload document.
+        """
+        from girderformindlogger.models.assetstore import Assetstore
+        from girderformindlogger.utility import assetstore_utilities
+
+        if not upload.get('partSize'):
+            raise ValidationException('This upload was not created with a part size.')
+        assetstore = Assetstore().load(upload['assetstoreId'])
+        adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
+        key = 'parts.%d' % part
+        try:
+            size = adapter.uploadPart(upload, part, chunk)
+        except ValidationException:
+            # A failed attempt may have overwritten what an earlier one
+            # stored, so the part has to be sent again.
+            stored = self.collection.find_one(
+                {'_id': upload['_id']}, projection=[key]) or {}
+            received = stored.get('parts', {}).get(str(part))
+            if received is not None:
+                self.collection.update_one(
+                    {'_id': upload['_id'], key: received},
+                    {'$unset': {key: ''}, '$inc': {'received': -received}})
+            raise
+
+        # Count the part only the first time it is received.
+        update = {'$set': {key: size, 'updated': datetime.datetime.utcnow()}}
+        doc = self.collection.find_one_and_update(
+            {'_id': upload['_id'], key: {'$exists': False}},
+            dict(update, **{'$inc': {'received': size}}),
+            return_document=pymongo.ReturnDocument.AFTER)
+        if doc is None:
+            doc = self.collection.find_one_and_update(
+                {'_id': upload['_id']}, update,
+                return_document=pymongo.ReturnDocument.AFTER)
+        return doc
+
     def requestOffset(self, upload):
         """
         Requests the offset that should be used to resume uploading. This
-        makes the request from the assetstore adapter.
+        makes the request from the assetstore adapter. For uploads with a
+        ``partSize``, returns the numbers of the parts received instead.
         """
         from girderformindlogger.models.assetstore import Assetstore
         from girderformindlogger.utility import assetstore_utilities
 
+        if upload.get('partSize'):
+            return {'parts': sorted(int(part) for part in upload.get('parts', {}))}
+
         assetstore = Assetstore().load(upload['assetstoreId'])
         adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
         return adapter.requestOffset(upload)
@@ -273,7 +331,7 @@ class Upload(Model):
         return assetstore
 
     def createUploadToFile(self, file, user, size, reference=None,
-                           assetstore=None):
+                           assetstore=None, partSize=None):
         """
         Creates a new upload record into a file that already exists. This
         should be used when updating the contents of a file. Deletes any
@@ -289,6 +347,9 @@ class Upload(Model):
         :type reference: str
         :param assetstore: An optional assetstore to use to store the file.  If
             unspecified, the current assetstore is used.
+        :param partSize: If set, the contents are sent in parts of this many
+            bytes with ``handlePart`` instead of in ordered chunks.
+        :type partSize: int
         """
         from girderformindlogger.utility import assetstore_utilities
 
@@ -309,12 +370,13 @@ class Upload(Model):
         }
         if reference is not None:
             upload['reference'] = reference
+        self._setPartSize(upload, adapter, partSize)
         upload = adapter.initUpload(upload)
         return self.save(upload)
 
     def createUpload(self, user, name, parentType, parent, size, mimeType=None,
                      reference=None, assetstore=None, attachParent=False,
-                     save=True):
+                     save=True, partSize=None):
         """
         Creates a new upload record, and creates its temporary file
         that the chunks will be written into. Chunks should then be sent
@@ -346,6 +408,9 @@ class Upload(Model):
         :type attachParent: boolean
         :param save: if True, save the document after it is created.
         :type save: boolean
+        :param partSize: If set, the file is sent in parts of this many bytes
+            with ``handlePart`` instead of in ordered chunks.
+        :type partSize: int
         :returns: The upload document that was created.
         """
         from girderformindlogger.utility import assetstore_utilities
@@ -382,11 +447,24 @@ class Upload(Model):
         else:
             upload['userId'] = None
 
+        self._setPartSize(upload, adapter, partSize)
         upload = adapter.initUpload(upload)
         if save:
             upload = self.save(upload)
         return upload
 
+    def _setPartSize(self, upload, adapter, partSize):
+        if not partSize:
+            return
+        if not adapter.supportsParts:
+            raise ValidationException(
+                'This assetstore does not support uploads in parts.', 'partSize')
+        if partSize < upload['size'] and partSize < self._getChunkSize(minSize=0):
+            raise ValidationException(
+                'Parts must be at least %d bytes.' % self._getChunkSize(minSize=0), 'partSize')
+        upload['partSize'] = partSize
+        upload['parts'] = {}
+
     def moveFileToAssetstore(self, file, user, assetstore, progress=noProgress):
         """
         Move a file from whatever assetstore it is located in to a different
@@ -16,6 +16,7 @@ from girderformindlogger.models.setting import Setting
 from girderformindlogger.settings import SettingKey
 from girderformindlogger.utility import config, mail_utils
 from girderformindlogger.utility._cache import rateLimitBuffer
+from girderformindlogger.utility.auth_cache import getAuthCache
 from bson import ObjectId
 
 
@@ -519,6 +520,7 @@ class User(AESEncryption):
         account = AccountProfile().createOwner(user)
         user['accountId'] = account['_id']
         self.update({'_id': user['_id']}, {'$set': {'accountId': user['accountId']}})
+        getAuthCache().invalidateUser(user['_id'])
 
         self.createTemplatesFolder(user)
 
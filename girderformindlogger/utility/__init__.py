@@ -119,10 +119,11 @@ def firstLower(value):
 def loadJSON(url, urlType='protocol'):
     from girderformindlogger.exceptions import ValidationException
 
+    from girderformindlogger.utility.document_loader import getDocumentLoader
+
     print("Loading {} from {}".format(urlType, url))
     try:
-        r = requests.get(url)
-        data = json5.loads(r.text)
+        data = getDocumentLoader().loadJSON(url)
     except:
         return({})
         raise ValidationException(
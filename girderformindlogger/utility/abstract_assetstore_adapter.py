@@ -113,6 +113,9 @@ class AbstractAssetstoreAdapter(object):
     This defines the interface to be used by all assetstore adapters.
     """
 
+    # Whether uploads can be sent as numbered parts, see ``uploadPart``.
+    supportsParts = False
+
     def __init__(self, assetstore):
         self.assetstore = assetstore
 
@@ -173,6 +176,35 @@ class AbstractAssetstoreAdapter(object):
         raise NotImplementedError('Must override processChunk in %s.' %
                                   self.__class__.__name__)
 
+    def uploadPart(self, upload, part, chunk):
+        """
+        Store one part of an upload with a ``partSize``. Parts may arrive in
+        any order and concurrently, and a part may be sent again; the part is
+        stored independently of the others and must not modify the upload
+        document. ``finalizeUpload`` assembles and hashes them.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The number of the part, from 0. Its offset in the file is
+            ``part * upload['partSize']``.
+        :type part: int
+        :param chunk: The file object representing the part.
+        :type chunk: file
+        :returns: the number of bytes stored.
+        """
+        raise NotImplementedError('Must override uploadPart in %s.' %
+                                  self.__class__.__name__)
+
+    def getPartRange(self, upload, part):
+        """
+        :returns: the offset and length of a part of an upload; every part
+            but the last one is ``partSize`` bytes long.
+        """
+        offset = part * upload['partSize']
+        if part < 0 or offset >= upload['size']:
+            raise ValidationException('Part %s is out of range.' % part)
+        return offset, min(upload['partSize'], upload['size'] - offset)
+
     def finalizeUpload(self, upload, file):
         """
         Call this once the last chunk has been processed. This method does not
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Per-process cache of what authenticating a request loads: its token, the
+token's user and account profile. Mobile clients poll with the same token
+many times a minute, so these are served from memory for ``auth_ttl``
+seconds.
+
+Entries are dropped when a token, user or account profile is saved or
+removed, here and, through Redis, in every other worker.
+"""
+import pickle
+import threading
+import time
+
+from collections import OrderedDict
+from girderformindlogger import events, logger
+from girderformindlogger.constants import CoreEventHandler
+
+# Redis channel used to tell the other workers that an entry changed.
+AUTH_INVALIDATION_CHANNEL = 'girderformindlogger.auth.invalidate'
+DEFAULT_TTL = 30
+DEFAULT_MAX_ENTRIES = 10000
+# Seconds to wait before trying to subscribe again after Redis was unreachable.
+SUBSCRIBE_RETRY_INTERVAL = 30
+
+_authCache = None
+_authCacheLock = threading.Lock()
+
+
+class AuthCache(object):
+    """
+    LRU of ``{'token', 'user', 'accountProfile'}`` by token id, each value
+    loaded on first use. Values are stored pickled so that callers get
+    their own copy.
+
+    :param ttl: Seconds an entry is served for; 0 disables the cache.
+    :param maxEntries: Number of tokens cached at most.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation so that a value loaded before one is
+        # not stored after it.
+        self.generation = 0
+        self._entries = OrderedDict()
+        # ('user' or 'account', id) -> ids of the tokens whose entry depends on it.
+        self._index = {}
+        self._lock = threading.Lock()
+        self._subscriber = None
+        self._subscriberLock = threading.Lock()
+        self._subscribeRetryAt = 0
+
+    def get(self, tokenId, field, load):
+        """
+        :param tokenId: The token's id.
+        :param field: 'token', 'user' or 'accountProfile'.
+        :param load: Called without arguments to load the value when it is
+            not cached.
+        :returns: the value; None values are not cached.
+        """
+        if not self.ttl or not tokenId:
+            return load()
+
+        self._listen()
+        with self._lock:
+            entry = self._entries.get(tokenId)
+            if entry is not None and entry['expires'] < time.time():
+                self._discard(tokenId)
+                entry = None
+            if entry is not None and field in entry['values']:
+                self._entries.move_to_end(tokenId)
+                self.hits += 1
+                payload = entry['values'][field]
+            else:
+                self.misses += 1
+                payload = None
+                generation = self.generation
+        if payload is not None:
+            return pickle.loads(payload)
+
+        value = load()
+        if value is not None:
+            self._set(tokenId, field, value, generation)
+        return value
+
+    def invalidateToken(self, tokenId):
+        self._invalidate('token', tokenId)
+
+    def invalidateUser(self, userId):
+        self._invalidate('user', userId)
+
+    def invalidateAccount(self, accountId):
+        self._invalidate('account', accountId)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'maxEntries': self.maxEntries,
+            'ttl': self.ttl
+        }
+
+    def _set(self, tokenId, field, value, generation):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        keys = set()
+        if field == 'token':
+            keys.update((('user', value.get('userId')), ('account', value.get('accountId'))))
+        elif field == 'user':
+            keys.add(('user', value.get('_id')))
+        elif field == 'accountProfile':
+            keys.update((('user', value.get('userId')), ('account', value.get('accountId'))))
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            entry = self._entries.get(tokenId)
+            if entry is None:
+                entry = self._entries[tokenId] = {
+                    'expires': time.time() + self.ttl, 'values': {}, 'keys': set()}
+                while len(self._entries) > self.maxEntries:
+                    self._discard(next(iter(self._entries)))
+            entry['values'][field] = payload
+            for kind, id in keys:
+                if id is not None:
+                    key = (kind, str(id))
+                    entry['keys'].add(key)
+                    self._index.setdefault(key, set()).add(tokenId)
+
+    def _discard(self, tokenId):
+        entry = self._entries.pop(tokenId, None)
+        if entry is not None:
+            for key in entry['keys']:
+                tokens = self._index.get(key)
+                if tokens is not None:
+                    tokens.discard(tokenId)
+                    if not tokens:
+                        del self._index[key]
+
+    def _invalidate(self, kind, id, publish=True):
+        id = str(id)
+        with self._lock:
+            self.generation += 1
+            if kind == 'token':
+                self._discard(id)
+            else:
+                for tokenId in list(self._index.get((kind, id), ())):
+                    self._discard(tokenId)
+        if publish and self.ttl:
+            try:
+                from girderformindlogger.models import getRedisConnection
+
+                getRedisConnection().publish(AUTH_INVALIDATION_CHANNEL, '%s:%s' % (kind, id))
+            except Exception:
+                logger.warning('Could not publish auth cache invalidation for %s %s' % (kind, id))
+                self._stopListening()
+                self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+
+    def _listen(self):
+        """
+        Make sure this process is subscribed to invalidation messages. Without
+        Redis, entries changed by another worker are served until they
+        expire.
+        """
+        if self._subscriber is not None and self._subscriber.is_alive():
+            return True
+
+        if time.time() < self._subscribeRetryAt:
+            return False
+
+        with self._subscriberLock:
+            if self._subscriber is not None and self._subscriber.is_alive():
+                return True
+            try:
+                from girderformindlogger.models import getRedisConnection
+
+                pubsub = getRedisConnection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{
+                    AUTH_INVALIDATION_CHANNEL: self._onInvalidate
+                })
+                # Anything cached while we were not subscribed may be stale.
+                self.clear()
+                self._subscriber = pubsub.run_in_thread(
+                    sleep_time=1, daemon=True
+                )
+            except Exception:
+                self._subscriber = None
+                self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+                return False
+        return True
+
+    def _stopListening(self):
+        with self._subscriberLock:
+            if self._subscriber is not None:
+                try:
+                    self._subscriber.stop()
+                except Exception:
+                    pass
+                self._subscriber = None
+
+    def _onInvalidate(self, message):
+        data = message.get('data')
+        if isinstance(data, bytes):
+            data = data.decode('utf8')
+        kind, _, id = data.partition(':')
+        self._invalidate(kind, id, publish=False)
+
+
+def _onTokenChange(event):
+    getAuthCache().invalidateToken(event.info['_id'])
+
+
+def _onUserChange(event):
+    getAuthCache().invalidateUser(event.info['_id'])
+
+
+def _onAccountProfileChange(event):
+    getAuthCache().invalidateUser(event.info['userId'])
+
+
+def getAuthCache():
+    """
+    :returns: the process's ``AuthCache``, configured with ``auth_ttl`` and
+        ``auth_max_entries`` from the ``[cache]`` section of the config.
+    """
+    global _authCache
+
+    if _authCache is None:
+        from girderformindlogger.utility import config
+
+        with _authCacheLock:
+            if _authCache is None:
+                settings = config.getConfig().get('cache', {})
+                _authCache = AuthCache(
+                    ttl=settings.get('auth_ttl', DEFAULT_TTL),
+                    maxEntries=settings.get('auth_max_entries', DEFAULT_MAX_ENTRIES))
+                for model, handler in (
+                    ('token', _onTokenChange),
+                    ('user', _onUserChange),
+                    ('accountProfile', _onAccountProfileChange)
+                ):
+                    for event in ('save.after', 'remove'):
+                        events.bind('model.%s.%s' % (model, event),
+                                    CoreEventHandler.AUTH_CACHE_INVALIDATE, handler)
+    return _authCache
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+A shared pool of threads for work that can be done after a response, such
+as refreshing cached profile displays. Tasks are submitted with a key, and
+a task is not queued again while one with the same key is pending.
+"""
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from girderformindlogger import logger
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 10000
+
+_executor = None
+_executorLock = threading.Lock()
+
+
+class KeyedExecutor(object):
+    """
+    :param maxWorkers: Number of threads.
+    :param maxPending: Number of keys queued or running at most; tasks
+        submitted beyond that are dropped.
+    """
+
+    def __init__(self, maxWorkers=DEFAULT_WORKERS, maxPending=DEFAULT_MAX_PENDING):
+        self.maxPending = maxPending
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` in the pool, unless a task with the same
+        key is already queued or running.
+
+        :param key: A hashable identifying the work, e.g. ``('generateMissing',
+            appletId)``.
+        :returns: the Future of the task with this key, or None if too many
+            tasks are pending.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                if len(self._futures) >= self.maxPending:
+                    logger.warning('Too many background tasks, dropped %r.', key)
+                    return None
+                future = self._futures[key] = self._executor.submit(
+                    self._run, key, fn, args, kwargs)
+            return future
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def _run(self, key, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception('Background task %r failed.', key)
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+
+def getBackgroundExecutor():
+    """
+    :returns: the process's ``KeyedExecutor``, with ``background_workers``
+        threads from the ``[server]`` section of the config.
+    """
+    global _executor
+
+    if _executor is None:
+        from girderformindlogger.utility import config
+
+        with _executorLock:
+            if _executor is None:
+                settings = config.getConfig().get('server', {})
+                _executor = KeyedExecutor(
+                    maxWorkers=settings.get('background_workers', DEFAULT_WORKERS))
+    return _executor
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Fetches the JSON-LD documents (protocols, activities, items and contexts)
+read when importing or refreshing an applet, through a shared connection
+pool and a cache of the responses.
+
+A response is served from the cache while it is younger than ``ttl``, then
+revalidated with ``If-None-Match``/``If-Modified-Since``; it is also served
+when it can no longer be fetched. Refreshes read within a ``revalidating``
+block, which revalidates each document once whatever its age. The cache has three tiers: a bounded
+per-process LRU, an optional directory and the ``remoteDocument``
+collection. In ``offline`` mode nothing is fetched, so imports can run
+against a directory of fixtures laid out as ``<cache_dir>/<host>/<path>``.
+"""
+import contextlib
+import hashlib
+import json
+import json5
+import os
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from girderformindlogger.exceptions import ResourcePathNotFound
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from six.moves import urllib
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+MEMORY_MAX_BYTES = 32 * 1024 ** 2
+DEFAULT_CONCURRENCY = 8
+REQUEST_TIMEOUT = 30
+# Prune the remoteDocument collection after this many writes.
+PRUNE_EVERY = 100
+ACCEPT = 'application/ld+json, application/json;q=0.9, */*;q=0.1'
+
+_loader = None
+_loaderLock = threading.Lock()
+
+
+def parseJSON(text):
+    """
+    Parse a document, with ``json5`` only if it is not plain JSON as it is
+    much slower.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json5.loads(text)
+
+
+class DocumentLoader(object):
+    """
+    :param cacheDir: Directory of the on-disk tier, None to disable it.
+    :param ttl: Seconds during which a response is served without being
+        revalidated.
+    :param maxBytes: Upper bound of the on-disk and collection tiers.
+    :param offline: Only serve documents from the cache.
+    :param useCollection: Whether to use the ``remoteDocument`` collection.
+    :param concurrency: Number of connections and of parallel prefetches.
+    """
+
+    def __init__(self, cacheDir=None, ttl=DEFAULT_TTL, maxBytes=DEFAULT_MAX_BYTES,
+                 offline=False, useCollection=True, concurrency=DEFAULT_CONCURRENCY):
+        import requests
+        from girderformindlogger.models.cache import LocalCacheTier
+
+        self.cacheDir = os.path.abspath(os.path.expanduser(cacheDir)) if cacheDir else None
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.offline = offline
+        self.useCollection = useCollection
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        self.memory = LocalCacheTier(MEMORY_MAX_BYTES)
+        self._pending = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._diskBytes = None
+
+    @contextlib.contextmanager
+    def revalidating(self, revalidate=True):
+        """
+        Revalidate the responses this thread reads within the block if they
+        were fetched before it started, even if they are younger than
+        ``ttl``. Nested blocks keep the outermost start, and nothing is done
+        if ``revalidate`` is false so callers can pass their
+        ``refreshCache``.
+        """
+        if not revalidate or getattr(self._local, 'since', None) is not None:
+            yield
+            return
+        self._local.since = time.time()
+        try:
+            yield
+        finally:
+            self._local.since = None
+
+    def fetch(self, url, since=None):
+        """
+        :param since: Revalidate the cached response if it was fetched
+            before this time. Defaults to the start of the thread's
+            ``revalidating`` block.
+        :returns: the cache entry of ``url``, a dict with its ``body``,
+            ``contentType``, ``documentUrl`` and validators.
+        :raises ResourcePathNotFound: if the document can't be fetched and is
+            not cached.
+        """
+        if since is None:
+            since = getattr(self._local, 'since', None) or 0
+        entry = self._lookup(url)
+        if entry is not None and (self.offline or (
+            entry.get('fetched', 0) + self.ttl > time.time() and
+            entry.get('fetched', 0) >= since
+        )):
+            return entry
+        if self.offline:
+            raise ResourcePathNotFound('Document not cached: {}'.format(url))
+
+        # Concurrent fetches of the same URL share a single request.
+        with self._lock:
+            future = self._pending.get(url)
+            owner = future is None
+            if owner:
+                future = self._pending[url] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            entry = self._download(url, entry)
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def loadJSON(self, url):
+        return parseJSON(self.fetch(url)['body'])
+
+    def prefetch(self, urls):
+        """
+        Fetch documents in parallel so that the following ``fetch`` calls
+        for them are served from the cache. Errors are left for those calls.
+        """
+        urls = {
+            url for url in urls
+            if isinstance(url, str) and url.startswith(('http://', 'https://'))
+        }
+        if self.offline or len(urls) < 2:
+            return
+        since = getattr(self._local, 'since', None)
+        wait([self.executor.submit(self.fetch, url, since) for url in urls])
+
+    def pyldLoader(self, url, options={}):
+        """
+        Document loader for ``pyld.jsonld``'s ``documentLoader`` option.
+        """
+        from pyld.jsonld import JsonLdError
+
+        try:
+            entry = self.fetch(url)
+            return {
+                'contentType': entry.get('contentType') or 'application/ld+json',
+                'contextUrl': None,
+                'documentUrl': entry.get('documentUrl') or url,
+                'document': parseJSON(entry['body'])
+            }
+        except Exception as cause:
+            raise JsonLdError(
+                'Could not retrieve a JSON-LD document from the URL.',
+                'jsonld.LoadDocumentError', {'url': url},
+                code='loading document failed', cause=cause)
+
+    def _lookup(self, url):
+        entry = self.memory.get(url)
+        if entry is None:
+            entry = self._readFile(url)
+            if entry is None and self.useCollection:
+                from girderformindlogger.models.remote_document import RemoteDocument
+
+                entry = RemoteDocument().get(url)
+            if entry is not None:
+                self.memory.set(url, None, entry)
+        return entry
+
+    def _download(self, url, stale):
+        headers = {'Accept': ACCEPT}
+        if stale is not None:
+            if stale.get('etag'):
+                headers['If-None-Match'] = stale['etag']
+            if stale.get('lastModified'):
+                headers['If-Modified-Since'] = stale['lastModified']
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        except RequestException as e:
+            if stale is not None:
+                return stale
+            raise ResourcePathNotFound('Could not load {}: {}'.format(url, e))
+
+        if response.status_code == 304 and stale is not None:
+            entry = dict(stale, fetched=time.time())
+        elif response.ok:
+            entry = {
+                'url': url,
+                'body': response.text,
+                'size': len(response.content),
+                'contentType': response.headers.get('Content-Type'),
+                'documentUrl': response.url,
+                'etag': response.headers.get('ETag'),
+                'lastModified': response.headers.get('Last-Modified'),
+                'fetched': time.time()
+            }
+        else:
+            raise ResourcePathNotFound('Could not load {}: HTTP {}'.format(
+                url, response.status_code))
+
+        self._store(entry)
+        return entry
+
+    def _store(self, entry):
+        self.memory.set(entry['url'], None, entry)
+        self._writeFile(entry)
+        if self.useCollection:
+            from girderformindlogger.models.remote_document import RemoteDocument
+
+            RemoteDocument().put(entry)
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % PRUNE_EVERY == 0
+            if prune:
+                RemoteDocument().prune(self.maxBytes)
+
+    def _path(self, url):
+        """
+        :returns: the path of ``url`` in the cache directory, or None.
+        """
+        if self.cacheDir is None:
+            return None
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path if not parts.path.endswith('/') else parts.path + 'index'
+        if parts.query:
+            path += '_' + hashlib.sha1(parts.query.encode('utf8')).hexdigest()
+        path = os.path.normpath(os.path.join(
+            self.cacheDir, parts.netloc.replace(':', '_'), path.lstrip('/')))
+        if not path.startswith(self.cacheDir + os.sep):
+            return None
+        return path
+
+    def _readFile(self, url):
+        path = self._path(url)
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path, 'r', encoding='utf8') as f:
+            body = f.read()
+        try:
+            with open(path + '.meta', 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            # A fixture, or a body whose metadata was not written.
+            entry = {'url': url, 'fetched': 0}
+        entry['body'] = body
+        return entry
+
+    def _writeFile(self, entry):
+        path = self._path(entry['url'])
+        if path is None:
+            return
+        meta = {key: value for key, value in entry.items() if key != 'body'}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for target, content in ((path, entry['body']), (path + '.meta', json.dumps(meta))):
+                temp = '{}.{}.tmp'.format(target, threading.get_ident())
+                with open(temp, 'w', encoding='utf8') as f:
+                    f.write(content)
+                os.replace(temp, target)
+        except OSError:
+            # e.g. a URL whose path is a directory of another; the other
+            # tiers still have it.
+            return
+        self._pruneFiles(entry.get('size', 0))
+
+    def _pruneFiles(self, added):
+        """
+        Remove the least recently written files of the cache directory once
+        it holds more than ``maxBytes``.
+        """
+        with self._lock:
+            if self._diskBytes is not None:
+                self._diskBytes += added
+                if self._diskBytes <= self.maxBytes:
+                    return
+            files = []
+            for root, dirs, names in os.walk(self.cacheDir):
+                for name in names:
+                    if not name.endswith(('.meta', '.tmp')):
+                        path = os.path.join(root, name)
+                        stat = os.stat(path)
+                        files.append((stat.st_mtime, stat.st_size, path))
+            self._diskBytes = sum(size for mtime, size, path in files)
+            for mtime, size, path in sorted(files):
+                if self._diskBytes <= self.maxBytes:
+                    break
+                for target in (path, path + '.meta'):
+                    if os.path.exists(target):
+                        os.remove(target)
+                self._diskBytes -= size
+
+
+def getDocumentLoader():
+    """
+    :returns: the process's ``DocumentLoader``, configured from the
+        ``[document_loader]`` section of the config.
+    """
+    global _loader
+
+    if _loader is None:
+        from girderformindlogger.utility import config
+
+        with _loaderLock:
+            if _loader is None:
+                settings = config.getConfig().get('document_loader', {})
+                _loader = DocumentLoader(
+                    cacheDir=settings.get('cache_dir'),
+                    ttl=settings.get('ttl', DEFAULT_TTL),
+                    maxBytes=settings.get('max_bytes', DEFAULT_MAX_BYTES),
+                    offline=settings.get('offline', False),
+                    useCollection=settings.get('collection', True),
+                    concurrency=settings.get('concurrency', DEFAULT_CONCURRENCY))
+    return _loader
+
+
+def setDocumentLoader(loader):
+    """
+    Replace the process's ``DocumentLoader``, e.g. with an offline one in
+    tests.
+    """
+    global _loader
+    _loader = loader
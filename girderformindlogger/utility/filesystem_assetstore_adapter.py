@@ -9,18 +9,28 @@ from six import BytesIO
 import stat
 import tempfile
 
+import cherrypy
+
 from girderformindlogger import events, logger
-from girderformindlogger.api.rest import setResponseHeader
+from girderformindlogger.api.rest import setContentDisposition, setResponseHeader
 from girderformindlogger.exceptions import ValidationException, GirderException
 from girderformindlogger.models.file import File
 from girderformindlogger.models.folder import Folder
 from girderformindlogger.models.item import Item
 from girderformindlogger.models.upload import Upload
-from girderformindlogger.utility import mkdir, progress
+from girderformindlogger.utility import config, mkdir, progress
 from . import _hash_state
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 BUF_SIZE = 65536
+# Read size when hashing the assembled parts of an upload
+PART_HASH_BUF_SIZE = 4 * 1024 * 1024
+
+# Response headers with which a fronting proxy is told to send a file itself.
+OFFLOAD_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile'
+}
 
 # Default permissions for the files written to the filesystem
 DEFAULT_PERMS = stat.S_IRUSR | stat.S_IWUSR
@@ -36,6 +46,8 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
     :type assetstore: dict
     """
 
+    supportsParts = True
+
     @staticmethod
     def validateInfo(doc):
         """
@@ -184,6 +196,36 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         upload['received'] += size
         return upload
 
+    def uploadPart(self, upload, part, chunk):
+        """
+        Writes the part at its offset in the temporary file.
+        """
+        offset, length = self.getPartRange(upload, part)
+        chunkSize = self.getChunkSize(chunk)
+        if chunkSize is not None and chunkSize != length:
+            raise ValidationException('Part %d must be %d bytes.' % (part, length))
+
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+
+        if isinstance(chunk, six.binary_type):
+            chunk = BytesIO(chunk)
+
+        size = 0
+        with open(upload['tempFile'], 'r+b') as tempFile:
+            tempFile.seek(offset)
+            while size <= length:
+                data = chunk.read(BUF_SIZE)
+                if not data:
+                    break
+                tempFile.write(data[:length - size])
+                size += len(data)
+        chunk.close()
+
+        if size != length:
+            raise ValidationException('Part %d must be %d bytes.' % (part, length))
+        return size
+
     def requestOffset(self, upload):
         """
         Returns the size of the temp file.
@@ -195,7 +237,18 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         Moves the file into its permanent content-addressed location within the
         assetstore. Directory hierarchy yields 256^2 buckets.
         """
-        hash = _hash_state.restoreHex(upload['sha512state'], 'sha512').hexdigest()
+        if upload.get('partSize'):
+            # Parts were written in any order, hash them in one pass.
+            checksum = sha512()
+            with open(upload['tempFile'], 'rb') as tempFile:
+                while True:
+                    data = tempFile.read(PART_HASH_BUF_SIZE)
+                    if not data:
+                        break
+                    checksum.update(data)
+            hash = checksum.hexdigest()
+        else:
+            hash = _hash_state.restoreHex(upload['sha512state'], 'sha512').hexdigest()
         dir = os.path.join(hash[0:2], hash[2:4])
         absdir = os.path.join(self.assetstore['root'], dir)
 
@@ -260,6 +313,13 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
                 'girderformindlogger.utility.filesystem_assetstore_adapter.'
                 'file-does-not-exist')
 
+        if headers and self._offloadDownload(file, path, offset, endByte, contentDisposition):
+            def empty():
+                return
+                yield
+
+            return empty
+
         if headers:
             setResponseHeader('Accept-Ranges', 'bytes')
             self.setContentHeaders(file, offset, endByte, contentDisposition)
@@ -284,6 +344,36 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
 
         return stream
 
+    def _offloadDownload(self, file, path, offset, endByte, contentDisposition):
+        """
+        Let the fronting proxy send the file, as set by ``download_offload``
+        in the ``[server]`` section of the config. The proxy applies the
+        request's Range header itself, so ranges given only as query
+        parameters are still streamed from here.
+
+        :returns: whether the response headers were set for the proxy.
+        """
+        settings = config.getConfig().get('server', {})
+        header = OFFLOAD_HEADERS.get((settings.get('download_offload') or '').lower())
+        if header is None:
+            return False
+        if (offset or endByte < file['size']) and 'Range' not in cherrypy.request.headers:
+            return False
+
+        if header == 'X-Accel-Redirect':
+            if file.get('imported'):
+                return False
+            target = '/'.join((
+                settings.get('download_offload_prefix', '/assetstore').rstrip('/'),
+                six.moves.urllib.parse.quote(file['path'].replace(os.sep, '/'))))
+        else:
+            target = path
+
+        setResponseHeader('Content-Type', file.get('mimeType') or 'application/octet-stream')
+        setContentDisposition(file['name'], contentDisposition or 'attachment')
+        setResponseHeader(header, target)
+        return True
+
     def deleteFile(self, file):
         """
         Deletes the file from disk if it is the only File in this assetstore
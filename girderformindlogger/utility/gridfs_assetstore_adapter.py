@@ -39,12 +39,27 @@ def _ensureChunkIndices(collection):
     ], unique=True)
 
 
+def _readFull(stream, size):
+    """
+    Read ``size`` bytes from a stream, fewer only at its end.
+    """
+    data = stream.read(size)
+    while data and len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
 class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
     """
     This assetstore type stores files within MongoDB using the GridFS data
     model.
     """
 
+    supportsParts = True
+
     @staticmethod
     def validateInfo(doc):
         """
@@ -118,10 +133,62 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         """
         Creates a UUID that will be used to uniquely link each chunk to
         """
+        if upload.get('partSize') and upload['partSize'] % CHUNK_SIZE:
+            raise ValidationException(
+                'Parts must be a multiple of %d bytes.' % CHUNK_SIZE, 'partSize')
         upload['chunkUuid'] = uuid.uuid4().hex
         upload['sha512state'] = _hash_state.serializeHex(sha512())
         return upload
 
+    def uploadPart(self, upload, part, chunk):
+        """
+        Stores the part as the chunks at its offset. Parts are a multiple of
+        the chunk size, so chunks are numbered as in sequential uploads.
+        """
+        offset, length = self.getPartRange(upload, part)
+        chunkSize = self.getChunkSize(chunk)
+        if chunkSize is not None and chunkSize != length:
+            raise ValidationException('Part %d must be %d bytes.' % (part, length))
+
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+
+        if isinstance(chunk, six.binary_type):
+            chunk = BytesIO(chunk)
+
+        startingN = offset // CHUNK_SIZE
+        endN = startingN + (length + CHUNK_SIZE - 1) // CHUNK_SIZE
+        # Drop what an earlier attempt at this part stored.
+        self.chunkColl.delete_many({
+            'uuid': upload['chunkUuid'],
+            'n': {'$gte': startingN, '$lt': endN}
+        })
+
+        n = startingN
+        size = 0
+        while size <= length:
+            data = _readFull(chunk, CHUNK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            if size > length:
+                break
+            self.chunkColl.insert_one({
+                'n': n,
+                'uuid': upload['chunkUuid'],
+                'data': bson.binary.Binary(data)
+            })
+            n += 1
+        chunk.close()
+
+        if size != length:
+            self.chunkColl.delete_many({
+                'uuid': upload['chunkUuid'],
+                'n': {'$gte': startingN, '$lt': endN}
+            })
+            raise ValidationException('Part %d must be %d bytes.' % (part, length))
+        return size
+
     def uploadChunk(self, upload, chunk):
         """
         Stores the uploaded chunk in fixed-sized pieces in the chunks
@@ -227,7 +294,20 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         Grab the final state of the checksum and set it on the file object,
         and write the generated UUID into the file itself.
         """
-        hash = _hash_state.restoreHex(upload['sha512state'], 'sha512').hexdigest()
+        if upload.get('partSize'):
+            # Parts were stored in any order, hash their chunks in one pass.
+            checksum = sha512()
+            count = 0
+            for chunk in self.chunkColl.find({
+                'uuid': upload['chunkUuid']
+            }, projection=['data']).sort('n', pymongo.ASCENDING):
+                checksum.update(chunk['data'])
+                count += 1
+            if count != (upload['size'] + CHUNK_SIZE - 1) // CHUNK_SIZE:
+                raise ValidationException('The upload is missing chunks.')
+            hash = checksum.hexdigest()
+        else:
+            hash = _hash_state.restoreHex(upload['sha512state'], 'sha512').hexdigest()
 
         file['sha512'] = hash
         file['chunkUuid'] = upload['chunkUuid']
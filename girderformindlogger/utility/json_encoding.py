@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Encoders of REST response bodies. ``orjson`` is used when it is installed,
+otherwise the standard library's ``json``; ``json_encoder`` in the
+``[server]`` section of the config picks one explicitly.
+
+Keys are not sorted unless ``json_sort_keys`` is set, which formatted
+applets of several MB pay for on every request.
+"""
+import json
+import threading
+
+import six
+
+from girderformindlogger import logger
+from girderformindlogger.utility import JsonEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENCODERS = ('auto', 'orjson', 'json')
+
+_encoder = None
+_encoderLock = threading.Lock()
+
+
+class JsonBlob(six.binary_type):
+    """
+    UTF-8 encoded JSON which is sent as the response body as is, for
+    endpoints serving data that was already encoded, such as a cache
+    document's.
+    """
+
+
+# Serializes the types JSON has no representation for, after asking the
+# handlers of the ``rest.json_encode`` event.
+_encodeDefault = JsonEncoder().default
+
+
+class StdlibJsonEncoder(object):
+    """
+    Encodes with ``json.dumps`` and :py:class:`girderformindlogger.utility.JsonEncoder`.
+    """
+    name = 'json'
+
+    def __init__(self, sortKeys=False):
+        self.sortKeys = sortKeys
+
+    def encode(self, val):
+        return json.dumps(
+            val, sort_keys=self.sortKeys, allow_nan=False, separators=(',', ':'),
+            cls=JsonEncoder).encode('utf8')
+
+
+class OrjsonEncoder(StdlibJsonEncoder):
+    """
+    Encodes with ``orjson``, which serializes datetimes itself (naive ones
+    as UTC) and other types with ``JsonEncoder.default``. Values it
+    rejects, such as integers wider than 64 bits, are encoded with the
+    standard library instead.
+    """
+    name = 'orjson'
+
+    def __init__(self, sortKeys=False):
+        super(OrjsonEncoder, self).__init__(sortKeys)
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+        if sortKeys:
+            self.options |= orjson.OPT_SORT_KEYS
+
+    def encode(self, val):
+        try:
+            return orjson.dumps(val, default=_encodeDefault, option=self.options)
+        except orjson.JSONEncodeError:
+            return super(OrjsonEncoder, self).encode(val)
+
+
+def createJsonEncoder(name='auto', sortKeys=False):
+    """
+    :param name: One of ``ENCODERS``; ``auto`` is ``orjson`` if it is
+        installed.
+    :param sortKeys: Whether to sort the keys of objects.
+    """
+    if name not in ENCODERS:
+        raise ValueError('JSON encoder must be one of %s.' % ', '.join(ENCODERS))
+    if name == 'orjson' and orjson is None:
+        logger.warning('orjson is not installed, encoding responses with json.')
+    if name != 'json' and orjson is not None:
+        return OrjsonEncoder(sortKeys)
+    return StdlibJsonEncoder(sortKeys)
+
+
+def getJsonEncoder():
+    """
+    :returns: the process's response encoder, as set by ``json_encoder`` and
+        ``json_sort_keys`` in the ``[server]`` section of the config.
+    """
+    global _encoder
+
+    if _encoder is None:
+        from girderformindlogger.utility import config
+
+        with _encoderLock:
+            if _encoder is None:
+                settings = config.getConfig().get('server', {})
+                _encoder = createJsonEncoder(
+                    settings.get('json_encoder', 'auto'),
+                    settings.get('json_sort_keys', False))
+    return _encoder
+
+
+def encodeJson(val):
+    """
+    Encode a value as a JSON response body.
+
+    :returns: UTF-8 encoded JSON; a ``JsonBlob`` is returned unchanged.
+    """
+    if isinstance(val, JsonBlob):
+        return val
+    return getJsonEncoder().encode(val)
@@ -11,16 +11,23 @@ from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.collection import Collection as CollectionModel
 from girderformindlogger.models.folder import Folder as FolderModel
 from girderformindlogger.models.item import Item as ItemModel
+from girderformindlogger.models.item_history import ItemHistoryIndex
 from girderformindlogger.models.protocol import Protocol as ProtocolModel
 from girderformindlogger.models.screen import Screen as ScreenModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.utility import loadJSON
+from girderformindlogger.utility.document_loader import getDocumentLoader
+from girderformindlogger.utility.progress import noProgress
 from girderformindlogger.utility.response import responseDateList
 from girderformindlogger.models.cache import Cache as CacheModel
 from bson.objectid import ObjectId
 from pyld import jsonld
 from pymongo import ASCENDING, DESCENDING
 
+# Number of documents expanded, and of items formatted, in parallel when
+# importing a protocol.
+IMPORT_WORKERS = 8
+
 
 def getModelCollection(modelType):
     """
@@ -193,19 +200,38 @@ def insertHistoryData(obj, identifier, modelType, baseVersion, historyFolder, hi
             'updated': now
         }
     })
+    ItemHistoryIndex().invalidate(historyReferenceFolder['_id'])
 
     return obj
 
-def createProtocolFromExpandedDocument(protocol, user, editExisting=False, removed={}, baseVersion=None):
+def createProtocolFromExpandedDocument(protocol, user, editExisting=False, removed={}, baseVersion=None, progress=noProgress, bulk=True):
+    """
+    Store the protocol, activities and items of an expanded document.
+
+    :param progress: Progress context updated as documents are stored.
+    :param bulk: Create new items (and their caches) with bulk writes after
+        formatting them in a worker pool instead of one at a time. The
+        protocol and its activities are still stored one at a time.
+    """
     protocolId = None
     historyFolder = None
     historyReferenceFolder = None
+    total = sum(len(protocol[modelType]) for modelType in ['protocol', 'activity', 'screen'])
+    progress.update(total=total, current=0, message='Storing documents')
 
     for modelType in ['protocol', 'activity', 'screen']:
         modelClass = MODELS()[modelType]()
         docCollection = getModelCollection(modelType)
+        newItems = []
 
         for model in protocol[modelType].values():
+            if bulk and modelType == 'screen' and not (
+                model['ref2Document'].get('_id', None) and editExisting
+            ):
+                newItems.append(model)
+                continue
+
+            progress.update(increment=1)
             prefName = modelClass.preferredName(model['expanded'])
 
             if modelClass.name in ['folder', 'item']:
@@ -414,8 +440,98 @@ def createProtocolFromExpandedDocument(protocol, user, editExisting=False, remov
 
                 model['ref2Document']['_id'] = newModel['_id']
 
+        if newItems:
+            _createItems(
+                protocol, newItems, user, editExisting, baseVersion,
+                historyFolder, historyReferenceFolder, progress)
+
     return protocolId
 
+
+def _createItems(protocol, models, user, editExisting, baseVersion, historyFolder, historyReferenceFolder, progress):
+    """
+    Bulk counterpart of ``createProtocolFromExpandedDocument`` for items that
+    do not exist yet: items and their caches are each created with one insert
+    and the items are formatted in a worker pool.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pymongo import UpdateOne
+
+    docCollection = getModelCollection('screen')
+    folders = {}
+    items = []
+    for model in models:
+        prefName = ScreenModel().preferredName(model['expanded'])
+        metadata = {'screen': model['expanded']}
+
+        tmp = model
+        while tmp.get('parentId', None):
+            key = tmp['parentKey']
+            tmp = protocol[key][tmp['parentId']]
+
+            metadata['{}Id'.format(key)] = tmp['_id']
+
+        if prefName not in folders:
+            folders[prefName] = FolderModel().createFolder(
+                name=prefName,
+                parent=docCollection,
+                parentType='collection',
+                public=True,
+                creator=user,
+                allowRename=True,
+                reuseExisting=True
+            )
+
+        itemId = ObjectId()
+        metadata['identifier'] = '{}/{}'.format(metadata['activityId'], str(itemId))
+        item = {
+            '_id': itemId,
+            'name': prefName,
+            'folder': folders[prefName],
+            'meta': metadata,
+            'loadedFromSingleFile': True,
+            'lastUpdatedBy': user['_id']
+        }
+        if 'duplicateOf' in model['ref2Document']:
+            item['duplicateOf'] = ObjectId(model['ref2Document']['duplicateOf'])
+        items.append(item)
+
+    items = ScreenModel().createItems(items, user)
+    progress.update(increment=len(items) // 2, message='Formatting items')
+
+    if editExisting:
+        for item in items:
+            insertHistoryData(None, item['meta']['identifier'], 'screen', baseVersion, historyFolder, historyReferenceFolder, user)
+
+    def format(item):
+        # Formatted like the item one at a time path stores it, before it is
+        # flagged as loaded from a single file.
+        item = {key: value for key, value in item.items() if key not in (
+            'loadedFromSingleFile', 'lastUpdatedBy', 'duplicateOf')}
+        return _fixUpFormat(formatLdObject(
+            item,
+            mesoPrefix='screen',
+            user=user,
+            refreshCache=True
+        ))
+
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as executor:
+        formatted = list(executor.map(format, items))
+
+    caches = CacheModel().insertCaches([
+        (ScreenModel().name, item['_id'], 'screen', data)
+        for item, data in zip(items, formatted)
+    ])
+    ScreenModel().collection.bulk_write([
+        UpdateOne({'_id': item['_id']}, {'$set': {'cached': cache['_id']}})
+        for item, cache in zip(items, caches)
+    ], ordered=False)
+
+    for model, item in zip(models, items):
+        model['_id'] = item['_id']
+        model['ref2Document']['_id'] = item['_id']
+    progress.update(increment=len(items) - len(items) // 2)
+
 def getUpdatedContent(updates, document):
     # document: previous version of protocol data
     # updates: contains only changes
@@ -531,7 +647,9 @@ def cacheProtocolContent(protocol, document, user, editExisting=False):
 
         ItemModel().save(item)
 
-def loadFromSingleFile(document, user, editExisting=False):
+def loadFromSingleFile(document, user, editExisting=False, progress=noProgress, bulk=True):
+    from concurrent.futures import ThreadPoolExecutor
+
     if 'protocol' not in document or 'data' not in document['protocol']:
         raise ValidationException(
             'should contain protocol field in the json file.',
@@ -545,15 +663,33 @@ def loadFromSingleFile(document, user, editExisting=False):
         'screen': {}
     }
 
-    expandedProtocol = expandObj(contexts, document['protocol']['data'])
+    activities = list(document['protocol']['activities'].values())
+    for activity in activities:
+        if 'items' not in activity and not editExisting:
+            raise ValidationException(
+                'should contain at least one item in each activity.',
+            )
+
+    # Expand every document in a worker pool before storing anything.
+    progress.update(message='Expanding documents')
+    documents = [document['protocol']['data']] + [
+        activity['data'] for activity in activities
+    ] + [
+        item for activity in activities
+        for item in activity.get('items', {}).values()
+    ]
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS if bulk else 1) as executor:
+        expanded = iter(executor.map(
+            lambda data: expandObj(contexts, data), documents))
+
+    expandedProtocol = next(expanded)
     protocol['protocol'][expandedProtocol['@id']] = {
         'expanded': expandedProtocol,
         'ref2Document': document['protocol']['data']
     }
 
-    protocolId = None
-    for activity in document['protocol']['activities'].values():
-        expandedActivity = expandObj(contexts, activity['data'])
+    expandedActivities = [next(expanded) for activity in activities]
+    for activity, expandedActivity in zip(activities, expandedActivities):
         protocol['activity'][expandedActivity['@id']] = {
             'parentKey': 'protocol',
             'parentId': expandedProtocol['@id'],
@@ -561,14 +697,10 @@ def loadFromSingleFile(document, user, editExisting=False):
             'ref2Document': activity['data']
         }
 
-        if 'items' not in activity and not editExisting:
-            raise ValidationException(
-                'should contain at least one item in each activity.',
-            )
-
+    for activity, expandedActivity in zip(activities, expandedActivities):
         if 'items' in activity:
             for item in activity['items'].values():
-                expandedItem = expandObj(contexts, item)
+                expandedItem = next(expanded)
                 protocol['screen']['{}.{}'.format(expandedActivity['@id'], expandedItem['@id'])] = {
                     'parentKey': 'activity',
                     'parentId': expandedActivity['@id'],
@@ -576,11 +708,12 @@ def loadFromSingleFile(document, user, editExisting=False):
                     'ref2Document': item
                 }
 
-    protocolId = createProtocolFromExpandedDocument(protocol, user, editExisting, document.get('removed', {}), document.get('baseVersion', None))
+    protocolId = createProtocolFromExpandedDocument(protocol, user, editExisting, document.get('removed', {}), document.get('baseVersion', None), progress=progress, bulk=bulk)
     protocol = ProtocolModel().load(protocolId, force=True)
 
     cacheProtocolContent(protocol, document, user, editExisting)
 
+    progress.update(message='Formatting protocol')
     return formatLdObject(
         protocol,
         mesoPrefix='protocol',
@@ -1028,12 +1161,16 @@ def expandOneLevel(obj):
                     if isinstance(data['@context'], str):
                         data['@context'] = 'https://raw.githubusercontent.com/jj105/reproschema-context/master/context.json'
 
-                newObj = jsonld.expand(data)
+                newObj = jsonld.expand(data, {
+                    'documentLoader': getDocumentLoader().pyldLoader
+                })
             else:
                 print("Invalid Url: ", obj)
                 return (obj)
         else:
-            newObj = jsonld.expand(obj)
+            newObj = jsonld.expand(obj, {
+                'documentLoader': getDocumentLoader().pyldLoader
+            })
     except jsonld.JsonLdError as e: # 👮 Catch illegal JSON-LD
         if e.cause.type == "jsonld.ContextUrlError":
             invalidContext = e.cause.details.get("url")
@@ -1135,6 +1272,12 @@ def expand(obj, keepUndefined=False):
     newObj = expandOneLevel(obj)
 
     if isinstance(newObj, dict):
+        # Fetch the documents of the next level in parallel, expanding them
+        # below then reads them from the cache.
+        getDocumentLoader().prefetch([
+            lv.get('@id') for k in KEYS_TO_EXPAND if isinstance(newObj.get(k), list)
+            for lv in newObj[k] if isinstance(lv, dict)
+        ])
         for k in KEYS_TO_EXPAND:
             if k in newObj.keys():
                 if isinstance(newObj.get(k), list):
@@ -1281,13 +1424,20 @@ def clearCache(obj, modelType):
         cache_id = obj['cached']
         obj['cached'] = None
         MODELS()[modelType]().update({'_id': ObjectId(obj['_id'])}, {'$set': {'cached': None}}, False)
-        CacheModel().removeWithQuery({'_id': ObjectId(cache_id)})
+        CacheModel().removeCache(cache_id)
     return obj
 
 def loadCache(id):
     cache = CacheModel().getCacheData(id)
     return cache
 
+def loadCacheJson(id):
+    """
+    Like ``loadCache``, for returning a cached object from an endpoint as is:
+    it is served already encoded.
+    """
+    return CacheModel().getCacheJson(id)
+
 def _fixUpFormat(obj):
     if isinstance(obj, dict):
         newObj = {}
@@ -1400,7 +1550,8 @@ def formatLdObject(
         newObj = newObj.get(mesoPrefix, newObj)
 
         if not obj.get('loadedFromSingleFile', False):
-            newObj = expand(newObj, keepUndefined=keepUndefined)
+            with getDocumentLoader().revalidating(refreshCache):
+                newObj = expand(newObj, keepUndefined=keepUndefined)
 
         if type(newObj)==list and len(newObj)==1:
             try:
@@ -1669,6 +1820,11 @@ def componentImport(
     updatedProtocol = deepcopy(protocol)
     obj2 = {k: v for k, v in expand(deepcopy(obj)).items() if v is not None}
     try:
+        getDocumentLoader().prefetch([
+            activity.get('url', activity.get('@id'))
+            for order in obj2.get("reprolib:terms/order", {})
+            for activity in order.get("@list", [])
+        ])
         for order in obj2.get(
             "reprolib:terms/order",
             {}
@@ -1,20 +1,211 @@
+import heapq
+import json
+import threading
 import time
 
 from pyfcm import FCMNotification
+from concurrent.futures import FIRST_COMPLETED, wait
 from concurrent.futures.thread import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+# Defaults of the delivery engine, can be overridden in the ``[fcm]`` section
+# of the config.
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket allowing ``rate`` acquisitions per second on
+    average, with bursts of up to ``capacity``.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """
+        Take a token if one is available.
+
+        :returns: 0 if a token was taken, otherwise the number of seconds
+            until one will be.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
 
 
 class FirebaseNotification(FCMNotification):
+    """
+    FCM client sending the payloads of a request concurrently over a shared
+    connection pool.
+
+    Throttled (``Retry-After``, 429) and failed (5xx, connection errors)
+    requests are scheduled again with exponential backoff without holding a
+    worker, and the number of requests in flight is halved on every throttle
+    and grows back by one on every success. Once a payload runs out of
+    retries it is counted as failed for all its recipients instead of
+    aborting the other payloads.
+
+    :param concurrency: Maximum number of requests in flight.
+    :param rate: Maximum number of requests per second, None for no limit.
+    :param maxRetries: Number of times a payload is retried.
+    :param backoff: Base delay in seconds of the exponential backoff.
+    :param endpoint: FCM endpoint, for tests against a stub server.
+    """
+
+    def __init__(self, *args, concurrency=DEFAULT_CONCURRENCY, rate=None,
+                 maxRetries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 endpoint=None, **kwargs):
+        super(FirebaseNotification, self).__init__(*args, **kwargs)
+        self.concurrency = max(1, int(concurrency))
+        self.rateLimiter = TokenBucket(rate) if rate else None
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+        if endpoint:
+            self.FCM_END_POINT = endpoint
+
+        # Retries are scheduled by send_request, keep urllib3 from blocking
+        # a worker on them.
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.concurrency, max_retries=0)
+        self.requests_session.mount('http://', adapter)
+        self.requests_session.mount('https://', adapter)
+        self.send_request_stats = {}
+
     def do_request(self, payload, timeout=5):
-        response = self.requests_session.post(self.FCM_END_POINT, data=payload, timeout=timeout)
-        if 'Retry-After' in response.headers and int(response.headers['Retry-After']) > 0:
-            sleep_time = int(response.headers['Retry-After'])
-            time.sleep(sleep_time)
-            return self.do_request(payload, timeout)
-        return response
+        return self.requests_session.post(
+            self.FCM_END_POINT, data=payload, timeout=timeout)
+
+    def _retryDelay(self, response, attempt):
+        retryAfter = getattr(response, 'headers', {}).get('Retry-After')
+        try:
+            retryAfter = float(retryAfter)
+        except (TypeError, ValueError):
+            retryAfter = 0
+        return max(retryAfter, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
 
     def send_request(self, payloads=None, timeout=None):
-        self.send_request_responses = []
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            response = executor.map(self.do_request, payloads)
-            executor.map(self.send_request_responses.append, response)
+        """
+        Send all payloads and store their final responses, in order, in
+        ``send_request_responses``. Payloads that failed for good have an
+        exception or a non-200 response there. Counters for the batch are in
+        ``send_request_stats``.
+        """
+        payloads = list(payloads or [])
+        timeout = timeout or 5
+        responses = [None] * len(payloads)
+        stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failed': 0}
+
+        # (ready time, index, attempt)
+        queue = [(0, index, 0) for index in range(len(payloads))]
+        heapq.heapify(queue)
+        limit = self.concurrency
+        inFlight = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while queue or inFlight:
+                now = time.monotonic()
+                wakeUp = None
+                while queue and len(inFlight) < limit:
+                    if queue[0][0] > now:
+                        wakeUp = queue[0][0] - now
+                        break
+                    if self.rateLimiter:
+                        delay = self.rateLimiter.delay()
+                        if delay:
+                            wakeUp = delay
+                            break
+                    readyAt, index, attempt = heapq.heappop(queue)
+                    stats['requests'] += 1
+                    future = executor.submit(self.do_request, payloads[index], timeout)
+                    inFlight[future] = (index, attempt)
+
+                if not inFlight:
+                    time.sleep(wakeUp or 0)
+                    continue
+
+                done, _ = wait(list(inFlight), timeout=wakeUp, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, attempt = inFlight.pop(future)
+                    try:
+                        response = future.result()
+                        retry = response.status_code in RETRY_STATUS_CODES
+                    except RequestException as e:
+                        response = e
+                        retry = True
+
+                    if not retry:
+                        responses[index] = response
+                        limit = min(self.concurrency, limit + 1)
+                        continue
+
+                    stats['throttled'] += 1
+                    limit = max(1, limit // 2)
+                    if attempt >= self.maxRetries:
+                        responses[index] = response
+                        stats['failed'] += 1
+                        continue
+
+                    stats['retries'] += 1
+                    heapq.heappush(queue, (
+                        time.monotonic() + self._retryDelay(response, attempt),
+                        index,
+                        attempt + 1
+                    ))
+
+        self.send_request_payloads = payloads
+        self.send_request_responses = responses
+        self.send_request_stats = stats
+
+    def parse_responses(self):
+        """
+        Like ``FCMNotification.parse_responses``, but a payload that still
+        failed after its retries counts as a failure for each of its
+        recipients instead of raising. ``results`` stays in the order of the
+        recipients, with an ``Unavailable`` error for those of failed
+        payloads.
+        """
+        responses = self.send_request_responses
+        failed = set()
+        succeeded = []
+        for index, response in enumerate(responses):
+            if isinstance(response, Exception) or response.status_code not in (200, 400, 401):
+                failed.add(index)
+            else:
+                succeeded.append(response)
+
+        # 400 and 401 still raise, they would fail on every payload.
+        self.send_request_responses = succeeded
+        result = super(FirebaseNotification, self).parse_responses()
+
+        # Rebuild the results in the order of the payloads so they still line
+        # up with the recipients.
+        results = []
+        for index, (payload, response) in enumerate(
+            zip(self.send_request_payloads, responses)
+        ):
+            if index in failed:
+                payload = json.loads(payload)
+                recipients = payload.get('registration_ids', [payload.get('to')])
+                result['failure'] += len(recipients)
+                results.extend({'error': 'Unavailable'} for recipient in recipients)
+            else:
+                results.extend(response.json().get('results', []))
+        result['results'] = results
+        result['failed_requests'] = len(failed)
+        return result
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Wakes the notification streams of the user or token a notification was
+created or updated for, in every worker process, through Redis. Streams
+wait for a wakeup instead of querying for new notifications every few
+seconds, so idle streams cost no queries.
+"""
+import contextlib
+import threading
+import time
+
+from girderformindlogger import logger
+
+# Redis channel on which the recipient of each notification is published.
+NOTIFICATION_CHANNEL = 'girderformindlogger.notification'
+# Seconds to wait before trying to subscribe again after Redis was unreachable.
+SUBSCRIBE_RETRY_INTERVAL = 30
+
+_dispatcher = None
+_dispatcherLock = threading.Lock()
+
+
+def recipientKey(user=None, token=None):
+    """
+    :returns: the key streams of a user, or of a token when there is no
+        user, are woken with.
+    """
+    if user:
+        return 'user:%s' % user['_id']
+    return 'token:%s' % token['_id']
+
+
+class NotificationDispatcher(object):
+    """
+    Keeps a ``threading.Event`` per open stream, set when a notification
+    for its recipient is published.
+    """
+
+    def __init__(self):
+        # recipient key -> Events of the streams open in this process.
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._subscriber = None
+        self._subscriberLock = threading.Lock()
+        self._subscribeRetryAt = 0
+
+    @contextlib.contextmanager
+    def waiter(self, key):
+        """
+        Register a stream for the duration of the block.
+
+        :param key: The stream's ``recipientKey``.
+        :returns: the Event set when the stream should query again.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                events = self._waiters.get(key)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._waiters[key]
+
+    def publish(self, doc):
+        """
+        Wake the streams of the recipient of a notification document.
+        """
+        if doc.get('userId'):
+            key = recipientKey(user={'_id': doc['userId']})
+        else:
+            key = recipientKey(token={'_id': doc.get('tokenId')})
+        if self._subscriber is None or not self._subscriber.is_alive():
+            # The message will not come back to this process.
+            self._wake(key)
+        try:
+            from girderformindlogger.models import getRedisConnection
+
+            getRedisConnection().publish(NOTIFICATION_CHANNEL, key)
+        except Exception:
+            logger.warning('Could not publish notification for %s' % key)
+            self._stopListening()
+            self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+            self._wake(key)
+
+    def streams(self):
+        with self._lock:
+            return sum(len(events) for events in self._waiters.values())
+
+    def listen(self):
+        """
+        Make sure this process is subscribed to the channel.
+
+        :returns: True if streams can wait to be woken, False if they must
+            poll.
+        """
+        if self._subscriber is not None and self._subscriber.is_alive():
+            return True
+
+        if time.time() < self._subscribeRetryAt:
+            return False
+
+        with self._subscriberLock:
+            if self._subscriber is not None and self._subscriber.is_alive():
+                return True
+            try:
+                from girderformindlogger.models import getRedisConnection
+
+                pubsub = getRedisConnection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{
+                    NOTIFICATION_CHANNEL: self._onMessage
+                })
+                self._subscriber = pubsub.run_in_thread(
+                    sleep_time=1, daemon=True
+                )
+            except Exception:
+                self._subscriber = None
+                self._subscribeRetryAt = time.time() + SUBSCRIBE_RETRY_INTERVAL
+                return False
+        # Notifications published while we were not subscribed were missed.
+        self._wakeAll()
+        return True
+
+    def _stopListening(self):
+        with self._subscriberLock:
+            if self._subscriber is not None:
+                try:
+                    self._subscriber.stop()
+                except Exception:
+                    pass
+                self._subscriber = None
+
+    def _onMessage(self, message):
+        data = message.get('data')
+        if isinstance(data, bytes):
+            data = data.decode('utf8')
+        self._wake(data)
+
+    def _wake(self, key):
+        with self._lock:
+            events = list(self._waiters.get(key, ()))
+        for event in events:
+            event.set()
+
+    def _wakeAll(self):
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+
+def getNotificationDispatcher():
+    """
+    :returns: the process's ``NotificationDispatcher``.
+    """
+    global _dispatcher
+
+    if _dispatcher is None:
+        with _dispatcherLock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    return _dispatcher
@@ -1,6 +1,7 @@
 import backports
 import isodate
 import itertools
+import json
 import pandas as pd
 import pytz
 import tzlocal
@@ -12,9 +13,11 @@ from girderformindlogger.models.applet import Applet as AppletModel
 from girderformindlogger.models.user import User as UserModel
 from girderformindlogger.models.response_folder import ResponseItem
 from girderformindlogger.models.account_profile import AccountProfile
-from girderformindlogger.utility import clean_empty
+from girderformindlogger.models.item_history import ItemHistoryIndex
+from girderformindlogger.utility import clean_empty, JsonEncoder
 from pandas.api.types import is_numeric_dtype
 from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from bson import json_util
 from girderformindlogger.utility import jsonld_expander
 from girderformindlogger.models.protocol import Protocol
@@ -117,28 +120,12 @@ def aggregate(metadata, informant, startDate=None, endDate=None):
         tzlocal.get_localzone()
     )
 
-    startDate = datetime.fromisoformat(startDate.isoformat(
-    )).astimezone(pytz.utc).replace(tzinfo=None) if startDate is not None else None
-
     endDate = datetime.fromisoformat((
         thisResponseTime if endDate is None else endDate
     ).isoformat()).astimezone(pytz.utc).replace(tzinfo=None)
 
-    query = {
-            "baseParentType": 'user',
-            "baseParentId": informant.get("_id") if isinstance(
-                informant,
-                dict
-            ) else informant,
-            "created": {
-                "$gte": startDate,
-                # "$lt": endDate
-            } if startDate else {
-                # "$lt": endDate
-            },
-            "meta.applet.@id": metadata["applet_id"],
-            "meta.subject.@id": metadata["subject_id"]
-        }
+    query = _responseQuery(metadata, informant, startDate)
+    startDate = query['created'].get('$gte')
 
     definedRange = list(ResponseItem().find(
         query=query,
@@ -189,6 +176,27 @@ def aggregate(metadata, informant, startDate=None, endDate=None):
     return(aggregated)
 
 
+def _responseQuery(metadata, informant, startDate=None):
+    startDate = datetime.fromisoformat(startDate.isoformat(
+    )).astimezone(pytz.utc).replace(tzinfo=None) if startDate is not None else None
+
+    return {
+        "baseParentType": 'user',
+        "baseParentId": informant.get("_id") if isinstance(
+            informant,
+            dict
+        ) else informant,
+        "created": {
+            "$gte": startDate,
+            # "$lt": endDate
+        } if startDate else {
+            # "$lt": endDate
+        },
+        "meta.applet.@id": metadata["applet_id"],
+        "meta.subject.@id": metadata["subject_id"]
+    }
+
+
 def completedDate(response):
     completed = response.get("created", {})
     return completed
@@ -325,26 +333,30 @@ def last7Days(
 
     profile = Profile().findOne({'userId': ObjectId(informantId), 'appletId': ObjectId(appletId)})
 
-    responses = aggregate({
+    metadata = {
         'applet_id': profile['appletId'],
         'subject_id': profile['_id']
-    }, informantId, startDate, referenceDate)
+    }
+
+    l7d = {}
+    if groupByDateActivity:
+        l7d["responses"], dataSources = latestResponsesPerDate(
+            metadata, informantId, startDate, profile['timezone'])
+    else:
+        responses = aggregate(metadata, informantId, startDate, referenceDate)
 
-    # destructure the responses
-    # TODO: we are assuming here that activities don't share items.
-    # might not be the case later on, so watch out.
+        # destructure the responses
+        # TODO: we are assuming here that activities don't share items.
+        # might not be the case later on, so watch out.
 
-    outputResponses = responses.get('responses', {})
-    dataSources = responses.get('dataSources', {})
+        outputResponses = responses.get('responses', {})
+        dataSources = responses.get('dataSources', {})
 
-    for item in outputResponses:
-        for resp in outputResponses[item]:
-            resp['date'] = delocalize(resp['date'])
-            if not groupByDateActivity:
-                resp['date'] = determine_date(resp['date'] + timedelta(hours=profile['timezone']))
+        for item in outputResponses:
+            for resp in outputResponses[item]:
+                resp['date'] = determine_date(delocalize(resp['date']) + timedelta(hours=profile['timezone']))
 
-    l7d = {}
-    l7d["responses"] = _oneResponsePerDatePerVersion(outputResponses, profile['timezone']) if groupByDateActivity else outputResponses
+        l7d["responses"] = outputResponses
 
     endDate = referenceDate.date()
     l7d["schema:endDate"] = endDate.isoformat()
@@ -412,28 +424,22 @@ def isodatetime(d):
 
 
 def responseDateList(appletId, userId, reviewer):
+    return(responseDateLists([appletId], userId, reviewer)[str(appletId)])
+
+
+def responseDateLists(appletIds, userId, reviewer):
+    """
+    Get the ISO dates of a user's responses for several applets from the
+    response date index.
+
+    :returns: dict of str(appletId) to a list of dates, most recent first.
+    """
     from girderformindlogger.models.profile import Profile
-    userId = ProfileModel().getProfile(userId, reviewer)
+    from girderformindlogger.models.response_date import ResponseDate
+    userId = Profile().getProfile(userId, reviewer)
     if not isinstance(userId, dict):
-        return([])
-    userId = userId.get('userId')
-    rdl = list(set([
-        determine_date(
-            response.get("meta", {}).get(
-                "responseCompleted",
-                response.get("created")
-            )
-        ).isoformat() for response in list(ResponseItem().find(
-            query={
-                "baseParentType": 'user',
-                "baseParentId": userId,
-                "meta.applet.@id": appletId
-            },
-            sort=[("created", DESCENDING)]
-        ))
-    ]))
-    rdl.sort(reverse=True)
-    return(rdl)
+        return({str(appletId): [] for appletId in appletIds})
+    return(ResponseDate().getDates(userId.get('userId'), appletIds))
 
 
 def add_missing_dates(response_data, from_date, to_date):
@@ -446,6 +452,15 @@ def add_missing_dates(response_data, from_date, to_date):
                 response_data['responses'][activity].append({"date": current_date, "value": []})
 
 
+def dailyResponseRecords(response):
+    return [{
+        "item": item,
+        "date": response['meta'].get('subject', {}).get('userTime').isoformat(),
+        "value": response['meta']['responses'][item],
+        "version": response['meta'].get('applet', {}).get('version', '0.0.0'),
+    } for item in response['meta']['responses']]
+
+
 def add_latest_daily_response(data, responses):
     user_keys = {}
 
@@ -453,15 +468,8 @@ def add_latest_daily_response(data, responses):
         activity_id = str(response['meta']['activity']['@id'])
         # response['updated'] = response['updated'].date()  # consider time value to handle users with different timezones.
 
-        for item in response['meta']['responses']:
-            if item not in data['responses']:
-                data['responses'][item] = []
-
-            data['responses'][item].append({
-                "date": response['meta'].get('subject', {}).get('userTime').isoformat(),
-                "value": response['meta']['responses'][item],
-                "version": response['meta'].get('applet', {}).get('version', '0.0.0'),
-            })
+        for record in dailyResponseRecords(response):
+            data['responses'].setdefault(record.pop('item'), []).append(record)
 
             if str(response['_id']) not in data['dataSources'] and 'dataSource' in response['meta']:
                 key_dump = json_util.dumps(response['meta']['userPublicKey'])
@@ -475,26 +483,236 @@ def add_latest_daily_response(data, responses):
                     'data': response['meta']['dataSource']
                 }
 
-def _oneResponsePerDatePerVersion(responses, offset):
-    newResponses = {}
+
+EXPORT_BATCH_SIZE = 200
+
+
+def ndjson(record):
+    return (json.dumps(
+        record, sort_keys=True, allow_nan=False, cls=JsonEncoder
+    ) + '\n').encode('utf8')
+
+
+def streamResponseData(responses, applet, responseRecords):
+    """
+    Serialize response items as newline-delimited JSON, one record per line,
+    so an export never holds more than one batch of responses in memory.
+
+    Every record has a ``type``:
+
+    * ``key``: a user public key (``index``, ``data``), emitted before the
+      first data source that uses it.
+    * ``dataSource``: ``id`` of the response and ``data`` with its ``key``
+      index and encrypted ``data``.
+    * ``response``: whatever ``responseRecords`` builds for a response.
+    * ``item``, ``activity``: snapshots (``id``, ``data``) of old item
+      versions, emitted the first time a response uses that version.
+    * ``itemReference``: the snapshot (``data``) used for an item ``IRI``
+      at an applet ``version``; null if it is the latest one.
+
+    :param responses: Iterable of response items.
+    :param applet: The applet the responses belong to.
+    :param responseRecords: Function of a response item returning the list
+        of ``response`` records for it.
+    """
+    protocolId = applet.get('meta', {}).get('protocol', {}).get(
+        '_id', '').split('/')[-1]
+    referencesFolder = Protocol().getItemReferencesFolder(
+        protocolId) if protocolId else None
+    itemHistory = ItemHistoryIndex().getHistory(
+        referencesFolder) if referencesFolder else {}
+    history = {
+        'items': {},
+        'activities': {},
+        'itemReferences': {}
+    }
+    versions = set()
+    userKeys = {}
+
     for response in responses:
-   
-        df = pd.DataFrame(responses[response])
+        meta = response.get('meta', {})
+
+        if 'userPublicKey' in meta and 'dataSource' in meta:
+            keyDump = json_util.dumps(meta['userPublicKey'])
+            if keyDump not in userKeys:
+                userKeys[keyDump] = len(userKeys)
+                yield ndjson({
+                    'type': 'key',
+                    'index': userKeys[keyDump],
+                    'data': meta['userPublicKey']
+                })
+            yield ndjson({
+                'type': 'dataSource',
+                'id': str(response['_id']),
+                'data': {
+                    'key': userKeys[keyDump],
+                    'data': meta['dataSource']
+                }
+            })
 
-        df["datetime"] = df.date
-    
-        df["date"] = df.date + timedelta(hours=offset)
-        df["date"] = df.date.apply(determine_date)
-        df["versionValue"] = df.version.apply(convertToComparableVersion)
+        for record in responseRecords(response):
+            yield ndjson(dict(record, type='response'))
 
-        df.sort_values(by=['datetime', 'versionValue'], ascending=False, inplace=True)
-        df = df.groupby(['date', 'versionValue']).first()
+        version = meta.get('applet', {}).get('version', '0.0.0')
+        for IRI in meta.get('responses', {}):
+            if IRI not in itemHistory or (IRI, version) in versions:
+                continue
+            versions.add((IRI, version))
+
+            items = set(history['items'])
+            activities = set(history['activities'])
+            Protocol().addItemHistory(
+                history, itemHistory[IRI], IRI, [version])
+
+            for activityId in history['activities']:
+                if activityId not in activities:
+                    yield ndjson({
+                        'type': 'activity',
+                        'id': activityId,
+                        'data': history['activities'][activityId]
+                    })
+            for itemId in history['items']:
+                if itemId not in items:
+                    yield ndjson({
+                        'type': 'item',
+                        'id': itemId,
+                        'data': history['items'][itemId]
+                    })
+            if IRI in history['itemReferences'].get(version, {}):
+                yield ndjson({
+                    'type': 'itemReference',
+                    'IRI': IRI,
+                    'version': version,
+                    'data': history['itemReferences'][version][IRI]
+                })
+
+
+def _latestResponsesPipeline(query, offset):
+    """
+    Aggregation pipeline keeping the latest value of each item per local date
+    and applet version. Only responses stored as plain documents are handled;
+    encrypted ones can only be read through ``ResponseItem().find``.
+    """
+    return [
+        {'$match': dict(query, **{'meta.responses': {'$type': 'object'}})},
+        {'$sort': {'created': DESCENDING}},
+        {'$project': {
+            '_id': False,
+            'created': True,
+            'version': {'$ifNull': ['$meta.applet.version', '0.0.0']},
+            'responses': {'$objectToArray': '$meta.responses'}
+        }},
+        {'$unwind': '$responses'},
+        {'$group': {
+            '_id': {
+                'item': '$responses.k',
+                'date': {'$dateToString': {
+                    'format': '%Y-%m-%d',
+                    'date': {'$add': ['$created', int(offset * 3600000)]}
+                }},
+                'version': '$version'
+            },
+            'created': {'$first': '$created'},
+            'value': {'$first': '$responses.v'}
+        }}
+    ]
+
+
+def _keepLatestResponse(latest, item, date, version, created, value):
+    key = (date, convertToComparableVersion(version))
+    current = latest.setdefault(item, {}).get(key)
+    if current is None or created > current['created']:
+        latest[item][key] = {
+            'value': value,
+            'version': version,
+            'date': date,
+            'created': created
+        }
 
-        df.drop('datetime', axis=1, inplace=True)
 
-        df['date'] = df.index
-        df['date'] = df.date.apply(lambda data: data[0])
+def _latestResponsesFromDocuments(latest, responses, offset):
+    for response in responses:
+        created = response['created']
+        date = determine_date(created + timedelta(hours=offset))
+        version = response.get('meta', {}).get('applet', {}).get(
+            'version', '0.0.0')
+        for item, value in response.get('meta', {}).get(
+            'responses', {}
+        ).items():
+            _keepLatestResponse(latest, item, date, version, created, value)
+
+
+def _formatLatestResponses(latest):
+    return({
+        item: [
+            {
+                'value': response['value'],
+                'version': response['version'],
+                'date': response['date']
+            } for key, response in sorted(latest[item].items())
+        ] for item in latest
+    })
+
+
+def latestResponsesPerDate(metadata, informant, startDate, offset,
+                           useAggregation=True):
+    """
+    Get the latest response to each item for every local date and applet
+    version, without loading whole response documents.
+
+    The grouping runs as a MongoDB aggregation over plain responses, and in a
+    single Python pass over the remaining (encrypted) ones, or over all of
+    them if the server cannot run the pipeline.
 
-        newResponses[response] = df.to_dict(orient="records")
+    :param offset: The user's offset from UTC in hours.
+    :returns: ``(responses, dataSources)``, where ``responses`` maps each item
+        IRI to a list of ``{'value', 'version', 'date'}`` ordered by date and
+        version.
+    """
+    query = _responseQuery(metadata, informant, startDate)
+    latest = {}
+    remaining = query
+    if useAggregation:
+        try:
+            for group in ResponseItem().collection.aggregate(
+                _latestResponsesPipeline(query, offset),
+                allowDiskUse=True
+            ):
+                _keepLatestResponse(
+                    latest,
+                    group['_id']['item'],
+                    date.fromisoformat(group['_id']['date']),
+                    group['_id']['version'],
+                    group['created'],
+                    group['value']
+                )
+            remaining = dict(query, **{
+                'meta.responses': {'$not': {'$type': 'object'}}
+            })
+        except OperationFailure:
+            latest = {}
 
-    return(newResponses)
+    _latestResponsesFromDocuments(latest, ResponseItem().find(
+        query=remaining,
+        force=True,
+        fields=[
+            'created', 'meta.responses', 'meta.items',
+            'meta.responseStarted', 'meta.applet.version'
+        ]
+    ), offset)
+    responses = _formatLatestResponses(latest)
+
+    sourceIds = set()
+    for itemResponses in responses.values():
+        for response in itemResponses:
+            if isinstance(response['value'], dict) and 'src' in response['value']:
+                sourceIds.add(ObjectId(response['value']['src']))
+    dataSources = {
+        str(response['_id']): response['meta']['dataSource']
+        for response in ResponseItem().collection.find({
+            '_id': {'$in': list(sourceIds)},
+            'meta.dataSource': {'$exists': True}
+        }, {'meta.dataSource': True})
+    } if sourceIds else {}
+
+    return(responses, dataSources)
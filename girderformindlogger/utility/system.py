@@ -8,7 +8,7 @@ import threading
 import time
 
 import girderformindlogger
-from girderformindlogger import logger
+from girderformindlogger import events, logger
 from girderformindlogger.models import getDbConnection
 
 
@@ -131,6 +131,9 @@ def getStatus(mode='basic', user=None):
             True for threadId in cherrypy.tools.status.seenThreads
             if 'end' not in cherrypy.tools.status.seenThreads[threadId]])
         status['cherrypyThreadPoolSize'] = cherrypy.server.thread_pool
+        timings = events.handlerTimings()
+        if timings is not None:
+            status['eventHandlerTimings'] = timings
 
     if mode == 'slow' and isAdmin:
         _computeSlowStatus(process, status, db)
@@ -1,12 +1,19 @@
+import atexit
 import cherrypy
 import datetime
 import logging
 import six
 from six.moves import urllib
 from girderformindlogger import auditLogger
+from girderformindlogger.api import access
+from girderformindlogger.api.describe import Description, autoDescribeRoute
+from girderformindlogger.api.rest import boundHandler, getCurrentUser
 from girderformindlogger.models.model_base import Model
-from girderformindlogger.api.rest import getCurrentUser
 from girderformindlogger.plugin import GirderPlugin
+from girderformindlogger.utility import config
+
+from .writer import AuditLogWriter, DEFAULT_BATCH_SIZE, DEFAULT_BLOCK_TIMEOUT, \
+    DEFAULT_FLUSH_INTERVAL, DEFAULT_QUEUE_SIZE, DEFAULT_SAMPLE_RATE
 
 
 class Record(Model):
@@ -19,7 +26,12 @@ class Record(Model):
 
 
 class _AuditLogDatabaseHandler(logging.Handler):
+    def __init__(self, writer):
+        super(_AuditLogDatabaseHandler, self).__init__()
+        self.writer = writer
+
     def handle(self, record):
+        # Cached on the request, usually already by its handler.
         user = getCurrentUser()
 
         if record.msg == 'rest.request':
@@ -34,17 +46,58 @@ class _AuditLogDatabaseHandler(logging.Handler):
                 urllib.parse.quote(paramKey, safe='').replace('.', '%2E'): paramValue
                 for paramKey, paramValue in six.viewitems(record.details['params'])
             }
-        Record().save({
+        self.writer.put({
             'type': record.msg,
             'details': record.details,
             'ip': cherrypy.request.remote.ip,
             'userId': user and user['_id'],
             'when': datetime.datetime.utcnow()
-        }, triggerEvents=False)
+        })
+
+
+def createWriter():
+    """
+    Create the writer of audit log records from the ``[audit_logs]`` section
+    of the config. Unless ``background`` is False there, it is started.
+    """
+    settings = config.getConfig().get('audit_logs', {})
+    writer = AuditLogWriter(
+        Record().collection,
+        batchSize=settings.get('batch_size', DEFAULT_BATCH_SIZE),
+        flushInterval=settings.get('flush_interval', DEFAULT_FLUSH_INTERVAL),
+        queueSize=settings.get('queue_size', DEFAULT_QUEUE_SIZE),
+        policy=settings.get('policy', 'block'),
+        sampleRate=settings.get('sample_rate', DEFAULT_SAMPLE_RATE),
+        blockTimeout=settings.get('block_timeout', DEFAULT_BLOCK_TIMEOUT))
+    if settings.get('background', True):
+        writer.start()
+    return writer
+
+
+@access.admin
+@boundHandler
+@autoDescribeRoute(
+    Description('Get the state of the audit log writer.')
+    .notes('The depth of its queue, and the number of records written, dropped and '
+           'left out by sampling since the server started.')
+)
+def getWriterMetrics(self):
+    return _writer.metrics()
+
+
+_writer = None
 
 
 class AuditLogsPlugin(GirderPlugin):
     DISPLAY_NAME = 'Audit logging'
 
     def load(self, info):
-        auditLogger.addHandler(_AuditLogDatabaseHandler())
+        global _writer
+
+        _writer = createWriter()
+        # Write what is queued when the server, or a script, stops.
+        cherrypy.engine.subscribe('stop', _writer.stop)
+        atexit.register(_writer.stop)
+
+        auditLogger.addHandler(_AuditLogDatabaseHandler(_writer))
+        info['apiRoot'].system.route('GET', ('audit_logs',), getWriterMetrics)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Writes audit log records from a background thread, in batches, so that
+requests don't wait for a database write each.
+"""
+import random
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+from six.moves import queue
+
+from girderformindlogger import logger
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_BLOCK_TIMEOUT = 5.0
+POLICIES = ('block', 'drop', 'sample')
+
+_STOP = object()
+
+
+class AuditLogWriter(threading.Thread):
+    """
+    A bounded queue of records drained by a thread which inserts them with
+    ``insert_many``, as soon as ``batchSize`` records are queued or
+    ``flushInterval`` seconds after the first one.
+
+    When the queue is full, ``policy`` decides what happens to a new record:
+
+    * ``block``: the request waits for room, for ``blockTimeout`` seconds at
+      most before the record is dropped, so a slow or unreachable database
+      holds up requests for that long but never stalls them.
+    * ``drop``: the record is dropped.
+    * ``sample``: once the queue is half full, only ``sampleRate`` of the
+      records are kept; when it is full they are dropped.
+
+    :param collection: The collection records are inserted in.
+    """
+
+    def __init__(self, collection, batchSize=DEFAULT_BATCH_SIZE,
+                 flushInterval=DEFAULT_FLUSH_INTERVAL, queueSize=DEFAULT_QUEUE_SIZE,
+                 policy='block', sampleRate=DEFAULT_SAMPLE_RATE,
+                 blockTimeout=DEFAULT_BLOCK_TIMEOUT):
+        if policy not in POLICIES:
+            raise ValueError('Audit log policy must be one of %s.' % ', '.join(POLICIES))
+        threading.Thread.__init__(self, name='AuditLogWriter')
+        self.daemon = True
+
+        self.collection = collection
+        self.batchSize = max(1, batchSize)
+        self.flushInterval = flushInterval
+        self.policy = policy
+        self.sampleRate = sampleRate
+        self.blockTimeout = blockTimeout
+        self.queue = queue.Queue(maxsize=queueSize)
+        self._stopped = False
+
+        self._countsLock = threading.Lock()
+        self._counts = {'written': 0, 'dropped': 0, 'sampled': 0, 'failed': 0, 'batches': 0}
+
+    def put(self, record):
+        """
+        Queue a record to be written.
+
+        :returns: whether the record was queued.
+        """
+        if not self.is_alive():
+            # Not started, or stopped: write it right away.
+            self._write([record])
+            return True
+
+        if self.policy == 'sample' and self.queue.qsize() * 2 >= self.queue.maxsize > 0:
+            if random.random() >= self.sampleRate:
+                self._count('sampled')
+                return False
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.blockTimeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        if self._stopped:
+            # The thread may have drained the queue before this record.
+            self._drain()
+        return True
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            record = self.queue.get()
+            if record is _STOP:
+                break
+            batch = [record]
+            deadline = time.time() + self.flushInterval
+            while len(batch) < self.batchSize:
+                try:
+                    record = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write(batch)
+        # Write the records queued behind the stop request.
+        self._stopped = True
+        self._drain()
+
+    def stop(self, timeout=None):
+        """
+        Write the queued records and stop the thread.
+        """
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join(timeout)
+
+    def metrics(self):
+        """
+        :returns: the depth and capacity of the queue and the number of
+            records written, dropped, left out by sampling and whose write
+            failed, and of batches written.
+        """
+        with self._countsLock:
+            metrics = dict(self._counts)
+        metrics.update({
+            'queued': self.queue.qsize(),
+            'queueSize': self.queue.maxsize,
+            'policy': self.policy,
+            'running': self.is_alive()
+        })
+        return metrics
+
+    def _drain(self):
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batchSize:
+                    record = self.queue.get_nowait()
+                    if record is not _STOP:
+                        batch.append(record)
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+            if len(batch) < self.batchSize:
+                return
+
+    def _count(self, key, n=1):
+        with self._countsLock:
+            self._counts[key] += n
+
+    def _write(self, batch):
+        failed = 0
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            failed = len(e.details.get('writeErrors', []))
+            logger.error('Could not write %d audit log records: %s', failed, e.details)
+        except Exception:
+            # e.g. a record BSON can't encode; the thread must keep going.
+            failed = len(batch)
+            logger.exception('Could not write %d audit log records.', failed)
+        with self._countsLock:
+            self._counts['written'] += len(batch) - failed
+            self._counts['failed'] += failed
+            self._counts['batches'] += 1
@@ -0,0 +1,34 @@
+import copy
+import json
+import os
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', '..', 'test', 'expected', 'test_1_HBN.jsonld'
+)
+
+
+def loadProtocol(itemCount=200):
+    """
+    Load the HBN protocol fixture and grow it to ``itemCount`` items by
+    cloning its (real) items under new IRIs, spreading them over the
+    existing activities.
+    """
+    with open(FIXTURE) as fp:
+        protocol = json.load(fp)
+
+    sources = list(protocol['items'].items())
+    activities = list(protocol['activities'].values())
+    items = {}
+    for n in range(itemCount):
+        iri, item = sources[n % len(sources)]
+        clone = copy.deepcopy(item)
+        cloneIRI = '{}_{}'.format(iri, n)
+        clone['@id'] = cloneIRI
+        items[cloneIRI] = clone
+        order = activities[n % len(activities)].setdefault(
+            'reprolib:terms/order', [{'@list': []}]
+        )[0].setdefault('@list', [])
+        order.append({'@id': cloneIRI})
+    protocol['items'] = items
+    return protocol
@@ -0,0 +1,78 @@
+"""
+Compare the ``cache`` collection storage formats.
+
+Measures encode/decode throughput for every format on the HBN protocol grown
+to 200 items and, when a MongoDB URI is given, the full ``getCacheData`` read
+path (findOne + decode) against a scratch collection.
+
+    python scripts/benchmarks/cache_formats.py --items 200 \\
+        --mongo mongodb://localhost:27017/cache_benchmark
+"""
+import argparse
+import datetime
+import sys
+import time
+
+from _protocol import loadProtocol
+from bson.binary import Binary
+from girderformindlogger.models.cache import CacheFormat, decodeCacheData,  \
+    encodeCacheData
+
+FORMATS = (CacheFormat.JSON, CacheFormat.BSON, CacheFormat.ZLIB)
+
+
+def _timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def benchmarkCodec(protocol, repeat):
+    print('%-6s %12s %12s %12s' % ('format', 'size (kB)', 'encode (ms)', 'decode (ms)'))
+    for format in FORMATS:
+        storedFormat, payload = encodeCacheData(protocol, format)
+        encode = _timeit(lambda: encodeCacheData(protocol, format), repeat)
+        decode = _timeit(lambda: decodeCacheData(storedFormat, payload), repeat)
+        print('%-6s %12.1f %12.2f %12.2f' % (
+            format, len(payload) / 1024.0, encode * 1000, decode * 1000))
+
+
+def benchmarkMongo(protocol, uri, repeat):
+    import pymongo
+
+    collection = pymongo.MongoClient(uri).get_database()['cache_benchmark']
+    collection.drop()
+    print('\n%-6s %14s %12s' % ('format', 'read (ms)', 'reads/s'))
+    for format in FORMATS:
+        storedFormat, payload = encodeCacheData(protocol, format)
+        _id = collection.insert_one({
+            'updated': datetime.datetime.utcnow(),
+            'cache_format': storedFormat,
+            'cache_data': payload if storedFormat == CacheFormat.JSON else Binary(payload)
+        }).inserted_id
+
+        def read():
+            document = collection.find_one({'_id': _id})
+            decodeCacheData(document['cache_format'], document['cache_data'])
+
+        elapsed = _timeit(read, repeat)
+        print('%-6s %14.2f %12.1f' % (format, elapsed * 1000, 1 / elapsed))
+    collection.drop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--mongo', default=None, help='MongoDB URI for the read benchmark')
+    args = parser.parse_args(argv)
+
+    protocol = loadProtocol(args.items)
+    benchmarkCodec(protocol, args.repeat)
+    if args.mongo:
+        benchmarkMongo(protocol, args.mongo, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Compare the ways of keeping one response per item, date and version for
+``last7Days``.
+
+Generates a week of synthetic responses and times the previous per-item
+pandas DataFrame grouping against the single Python pass and, when a MongoDB
+URI is given, the aggregation pipeline against a projected find followed by
+the Python pass on a scratch collection.
+
+    python scripts/benchmarks/last7days.py --responses 2000 \\
+        --mongo mongodb://localhost:27017/last7days_benchmark
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+
+import pandas as pd
+from bson.objectid import ObjectId
+from girderformindlogger.utility import jsonld_expander  # noqa: F401 (import order)
+from girderformindlogger.utility.response import convertToComparableVersion, \
+    determine_date, _formatLatestResponses, _keepLatestResponse,              \
+    _latestResponsesFromDocuments, _latestResponsesPipeline, _responseQuery
+
+OFFSET = -5
+VERSIONS = ('1.0.0', '1.0.9', '1.0.10')
+
+
+def _timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def makeResponses(count, items, startDate, appletId, subjectId, userId):
+    itemIRIs = ['activity/items/item%d' % n for n in range(items)]
+    random.seed(count)
+    return [{
+        '_id': ObjectId(),
+        'baseParentType': 'user',
+        'baseParentId': userId,
+        'created': startDate + datetime.timedelta(
+            seconds=random.randrange(7 * 24 * 3600)),
+        'meta': {
+            'applet': {'@id': appletId, 'version': random.choice(VERSIONS)},
+            'subject': {'@id': subjectId},
+            'responses': {
+                itemIRI: random.randrange(10)
+                for itemIRI in random.sample(itemIRIs, max(1, items // 2))
+            }
+        }
+    } for _ in range(count)]
+
+
+def pandasPerItem(responses):
+    """The grouping ``last7Days`` used before, one DataFrame per item."""
+    byItem = {}
+    for response in responses:
+        for itemIRI, value in response['meta']['responses'].items():
+            byItem.setdefault(itemIRI, []).append({
+                'value': value,
+                'date': response['created'],
+                'version': response['meta']['applet']['version']
+            })
+    newResponses = {}
+    for itemIRI in byItem:
+        df = pd.DataFrame(byItem[itemIRI])
+        df['datetime'] = df.date
+        df['date'] = df.date + datetime.timedelta(hours=OFFSET)
+        df['date'] = df.date.apply(determine_date)
+        df['versionValue'] = df.version.apply(convertToComparableVersion)
+        df.sort_values(by=['datetime', 'versionValue'], ascending=False, inplace=True)
+        df = df.groupby(['date', 'versionValue']).first()
+        df.drop('datetime', axis=1, inplace=True)
+        df['date'] = df.index
+        df['date'] = df.date.apply(lambda data: data[0])
+        newResponses[itemIRI] = df.to_dict(orient='records')
+    return newResponses
+
+
+def singlePass(responses):
+    latest = {}
+    _latestResponsesFromDocuments(latest, responses, OFFSET)
+    return _formatLatestResponses(latest)
+
+
+def benchmarkGrouping(responses, repeat):
+    assert pandasPerItem(responses) == singlePass(responses)
+    print('%-12s %12s' % ('grouping', 'time (ms)'))
+    for name, func in (('pandas', pandasPerItem), ('single pass', singlePass)):
+        elapsed = _timeit(lambda: func(responses), repeat)
+        print('%-12s %12.2f' % (name, elapsed * 1000))
+
+
+def benchmarkMongo(responses, uri, query, repeat):
+    import pymongo
+
+    collection = pymongo.MongoClient(uri).get_database()['last7days_benchmark']
+    collection.drop()
+    collection.insert_many(responses)
+    collection.create_index('created')
+
+    def aggregation():
+        latest = {}
+        for group in collection.aggregate(
+                _latestResponsesPipeline(query, OFFSET), allowDiskUse=True):
+            _keepLatestResponse(
+                latest, group['_id']['item'],
+                datetime.date.fromisoformat(group['_id']['date']),
+                group['_id']['version'], group['created'], group['value'])
+        return _formatLatestResponses(latest)
+
+    def find():
+        return singlePass(collection.find(query, {
+            'created': True, 'meta.responses': True, 'meta.applet.version': True
+        }))
+
+    assert aggregation() == find()
+    print('\n%-12s %12s' % ('engine', 'time (ms)'))
+    for name, func in (('aggregation', aggregation), ('find', find)):
+        elapsed = _timeit(func, repeat)
+        print('%-12s %12.2f' % (name, elapsed * 1000))
+    collection.drop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--responses', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mongo', default=None, help='MongoDB URI for the engine benchmark')
+    args = parser.parse_args(argv)
+
+    appletId, subjectId, userId = ObjectId(), ObjectId(), ObjectId()
+    startDate = datetime.datetime(2020, 6, 1)
+    responses = makeResponses(
+        args.responses, args.items, startDate, appletId, subjectId, userId)
+    benchmarkGrouping(responses, args.repeat)
+    if args.mongo:
+        query = _responseQuery({
+            'applet_id': appletId,
+            'subject_id': subjectId
+        }, userId, startDate)
+        benchmarkMongo(responses, args.mongo, query, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
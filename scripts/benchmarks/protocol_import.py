@@ -0,0 +1,108 @@
+"""
+Compare the one at a time and the bulk paths of the single file protocol
+import (``loadFromSingleFile``).
+
+Generates a protocol of ``--activities`` activities holding ``--items`` items
+in total and imports it into a scratch database with each path, after one
+warm-up import that creates the collections and folders both paths reuse.
+
+    python scripts/benchmarks/protocol_import.py --activities 30 --items 600 \\
+        --mongo mongodb://localhost:27017/protocol_import_benchmark
+"""
+import argparse
+import sys
+import time
+
+CONTEXT = {
+    '@version': 1.1,
+    'reproschema': 'http://schema.repronim.org/',
+    'schema': 'http://schema.org/',
+    'skos': 'http://www.w3.org/2004/02/skos/core#',
+    'prefLabel': {'@id': 'skos:prefLabel', '@container': '@language'},
+    'description': {'@id': 'schema:description', '@container': '@language'},
+    'question': {'@id': 'schema:question', '@container': '@language'},
+    'inputType': {'@id': 'reproschema:inputType', '@type': 'xsd:string'},
+    'order': {'@id': 'reproschema:order', '@container': '@list', '@type': '@id'}
+}
+
+
+def makeDocument(activityCount, itemCount, run):
+    """A single file protocol as sent to ``createAppletFromProtocolData``."""
+    activities = {}
+    for a in range(activityCount):
+        items = {}
+        for i in range(a, itemCount, activityCount):
+            items['item%d' % i] = {
+                '@context': ['reproschema'],
+                '@id': 'item%d' % i,
+                '@type': 'reproschema:Field',
+                'prefLabel': {'en': 'Question %d' % (i % 20)},
+                'question': {'en': 'How often did thing %d happen?' % i},
+                'inputType': 'radio'
+            }
+        activities['activity%d' % a] = {
+            'data': {
+                '@context': ['reproschema'],
+                '@id': 'activity%d' % a,
+                '@type': 'reproschema:Activity',
+                'prefLabel': {'en': 'Activity %d' % a},
+                'description': {'en': 'Benchmark activity'},
+                'order': list(items)
+            },
+            'items': items
+        }
+    return {
+        'contexts': {'reproschema': CONTEXT},
+        'protocol': {
+            'data': {
+                '@context': ['reproschema'],
+                '@id': 'benchmark',
+                '@type': 'reproschema:Protocol',
+                'prefLabel': {'en': 'Benchmark protocol %d' % run},
+                'order': list(activities)
+            },
+            'activities': activities
+        }
+    }
+
+
+def importProtocol(document, user, bulk):
+    from girderformindlogger.utility.jsonld_expander import loadFromSingleFile
+
+    start = time.perf_counter()
+    loadFromSingleFile(document, user, bulk=bulk)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--activities', type=int, default=30)
+    parser.add_argument('--items', type=int, default=600)
+    parser.add_argument('--mongo', required=True,
+                        help='URI of a scratch database, it is dropped first.')
+    args = parser.parse_args()
+
+    from girderformindlogger.models import getDbConnection
+    from girderformindlogger.utility import config
+
+    config.getConfig()['database']['uri'] = args.mongo
+    database = getDbConnection().get_default_database()
+    getDbConnection().drop_database(database.name)
+
+    from girderformindlogger.utility import jsonld_expander  # noqa: F401 (import order)
+    from girderformindlogger.models.user import User
+
+    user = User().createUser(
+        'benchmark', 'password', 'Bench', 'Mark', 'benchmark@example.com')
+
+    importProtocol(makeDocument(args.activities, args.items, 0), user, True)
+    serial = importProtocol(makeDocument(args.activities, args.items, 1), user, False)
+    bulk = importProtocol(makeDocument(args.activities, args.items, 2), user, True)
+
+    sys.stdout.write('%d activities, %d items\n' % (args.activities, args.items))
+    sys.stdout.write('one at a time %8.2f s\n' % serial)
+    sys.stdout.write('bulk          %8.2f s  (x%.1f)\n' % (bulk, serial / bulk))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare the linear scan ``Resource._matchRoute`` used to do with the
+compiled route table, over the routes of the real API.
+
+Builds the API as the server does, then matches one request per registered
+route (wildcards replaced by an id) with both and checks they agree. Both
+timings include getting the route's event names, which ``handleRoute`` used
+to join on each request. Building the API instantiates the models, so it
+needs a database.
+
+    python scripts/benchmarks/route_matching.py --repeat 200 \\
+        --mongo mongodb://localhost:27017/route_matching_benchmark
+"""
+import argparse
+import sys
+import time
+
+import six
+
+ID = '5f0e3bd2e4a4ac2d8f6d8a3c'
+
+
+def linearMatch(resource, method, path):
+    """The matching loop before routes were compiled."""
+    for route, handler in resource._routes[method][len(path)]:
+        wildcards = {}
+        for routeComponent, pathComponent in six.moves.zip(route, path):
+            if routeComponent[0] == ':':
+                wildcards[routeComponent[1:]] = pathComponent
+            elif routeComponent != pathComponent:
+                break
+        else:
+            return route, handler, wildcards
+
+
+def linearHandleRoute(resource, method, path):
+    """What ``handleRoute`` did before calling the handler."""
+    route, handler, wildcards = linearMatch(resource, method, path)
+    if hasattr(resource, 'resourceName'):
+        name = resource.resourceName
+    else:
+        name = handler.__module__.rsplit('.', 1)[-1]
+    routeStr = '/'.join((name, '/'.join(route))).rstrip('/')
+    eventPrefix = '.'.join(('rest', method, routeStr))
+    return (route, handler, wildcards, (
+        '.'.join((eventPrefix, 'before')), '.'.join((eventPrefix, 'after'))))
+
+
+def requests(apiRoot):
+    """``(resource, method, path)`` of one request per registered route."""
+    for name in sorted(vars(apiRoot)):
+        resource = getattr(apiRoot, name)
+        if not hasattr(resource, '_routes'):
+            continue
+        for method, lengths in resource._routes.items():
+            for routes in lengths.values():
+                for route, handler in routes:
+                    yield resource, method, tuple(
+                        ID if component[0] == ':' else component for component in route)
+
+
+def _timeit(match, requests, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for resource, method, path in requests:
+            match(resource, method, path)
+    return (time.perf_counter() - start) / (repeat * len(requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--mongo', required=True,
+                        help='URI of a scratch database the models can create indices in.')
+    args = parser.parse_args()
+
+    from girderformindlogger.utility import config
+
+    config.getConfig()['database']['uri'] = args.mongo
+
+    from girderformindlogger.utility import jsonld_expander  # noqa: F401 (import order)
+    from girderformindlogger.api import api_main
+
+    class Root(object):
+        pass
+
+    root = Root()
+    api_main.addApiToNode(root)
+    sample = list(requests(root.api.v1))
+
+    for resource, method, path in sample:
+        expected = linearHandleRoute(resource, method, path)
+        if resource._matchCompiledRoute(method, path) != expected:
+            sys.exit('Mismatch for %s %s' % (method.upper(), '/'.join(path)))
+
+    linear = _timeit(linearHandleRoute, sample, args.repeat)
+    compiled = _timeit(
+        lambda resource, method, path: resource._matchCompiledRoute(method, path),
+        sample, args.repeat)
+
+    sys.stdout.write('%d routes\n' % len(sample))
+    sys.stdout.write('linear   %8.2f us/match\n' % (linear * 1e6))
+    sys.stdout.write('compiled %8.2f us/match  (x%.1f)\n' % (compiled * 1e6, linear / compiled))
+
+
+if __name__ == '__main__':
+    main()
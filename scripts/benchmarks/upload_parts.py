@@ -0,0 +1,126 @@
+"""
+Compare uploading a file in ordered chunks with uploading it in parts sent
+concurrently.
+
+Uploads random data through ``Upload().handleChunk`` one chunk after the
+other, then through ``Upload().handlePart`` from ``--jobs`` threads, into a
+filesystem or GridFS assetstore, and checks both files have the data's
+SHA-512. ``--latency`` adds the given seconds before storing each chunk or
+part, standing in for the round trip of the request that carried it.
+
+    python scripts/benchmarks/upload_parts.py --size 256 --jobs 8 \\
+        --latency 0.05 --mongo mongodb://localhost:27017/upload_benchmark
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+MB = 1024 * 1024
+
+
+def _assetstore(kind, root):
+    from girderformindlogger.models.assetstore import Assetstore
+
+    if kind == 'gridfs':
+        return Assetstore().createGridFsAssetstore(
+            'upload_benchmark_%d' % os.getpid(), 'upload_benchmark_gridfs')
+    return Assetstore().createFilesystemAssetstore(
+        'upload_benchmark_%d' % os.getpid(), root)
+
+
+def _chunk(data):
+    from girderformindlogger.utility import RequestBodyStream
+
+    return RequestBodyStream(six.BytesIO(data), len(data))
+
+
+def uploadChunks(user, assetstore, data, chunkSize, latency):
+    from girderformindlogger.models.upload import Upload
+
+    upload = Upload().createUpload(
+        user, 'chunks.bin', None, None, len(data), assetstore=assetstore)
+    for offset in range(0, len(data), chunkSize):
+        time.sleep(latency)
+        upload = Upload().handleChunk(upload, _chunk(data[offset:offset + chunkSize]))
+    return upload
+
+
+def uploadParts(user, assetstore, data, partSize, latency, jobs):
+    from girderformindlogger.models.upload import Upload
+
+    upload = Upload().createUpload(
+        user, 'parts.bin', None, None, len(data), assetstore=assetstore,
+        partSize=partSize)
+
+    def send(part):
+        time.sleep(latency)
+        offset = part * partSize
+        Upload().handlePart(upload, part, _chunk(data[offset:offset + partSize]))
+
+    with ThreadPoolExecutor(jobs) as executor:
+        list(executor.map(send, range((len(data) + partSize - 1) // partSize)))
+    return Upload().finalizeUpload(Upload().load(upload['_id']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=256, help='File size in MB.')
+    parser.add_argument('--part-size', type=int, default=8, help='Chunk and part size in MB.')
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds added before storing each chunk or part.')
+    parser.add_argument('--assetstore', choices=('filesystem', 'gridfs'), default='filesystem')
+    parser.add_argument('--mongo', required=True,
+                        help='URI of a scratch database for the upload documents.')
+    args = parser.parse_args()
+
+    from girderformindlogger.utility import config
+
+    config.getConfig()['database']['uri'] = args.mongo
+
+    from girderformindlogger.utility import jsonld_expander  # noqa: F401 (import order)
+    from girderformindlogger.models.assetstore import Assetstore
+    from girderformindlogger.models.file import File
+
+    data = os.urandom(args.size * MB)
+    digest = hashlib.sha512(data).hexdigest()
+    user = {'_id': None}
+    root = tempfile.mkdtemp()
+    assetstore = _assetstore(args.assetstore, root)
+    try:
+        results = []
+        for name, upload in (
+            ('chunks', lambda: uploadChunks(
+                user, assetstore, data, args.part_size * MB, args.latency)),
+            ('parts', lambda: uploadParts(
+                user, assetstore, data, args.part_size * MB, args.latency, args.jobs))
+        ):
+            start = time.perf_counter()
+            file = upload()
+            elapsed = time.perf_counter() - start
+            if file['sha512'] != digest:
+                sys.exit('%s: the stored file does not match the data' % name)
+            results.append((name, elapsed))
+            File().remove(file)
+    finally:
+        Assetstore().remove(assetstore)
+        shutil.rmtree(root, ignore_errors=True)
+
+    sys.stdout.write('%d MB in %d MB pieces, %s assetstore, %.0f ms latency\n' % (
+        args.size, args.part_size, args.assetstore, args.latency * 1000))
+    for name, elapsed in results:
+        jobs = ' (%d jobs)' % args.jobs if name == 'parts' else ''
+        sys.stdout.write('%-6s %8.2f s %8.1f MB/s%s\n' % (
+            name, elapsed, args.size / elapsed, jobs))
+
+
+if __name__ == '__main__':
+    main()
@@ -73,6 +73,9 @@ extrasReqs = {
     ],
     'mount': [
         'fusepy>=3.0'
+    ],
+    'json': [
+        'orjson'
     ]
 }
 
@@ -117,7 +120,9 @@ setup(
             'mount = girderformindlogger.cli.mount:main',
             'shell = girderformindlogger.cli.shell:main',
             'sftpd = girderformindlogger.cli.sftpd:main',
-            'build = girderformindlogger.cli.build:main'
+            'build = girderformindlogger.cli.build:main',
+            'response-dates = girderformindlogger.cli.response_dates:main',
+            'folder-ancestors = girderformindlogger.cli.folder_ancestors:main'
         ]
     }
 )
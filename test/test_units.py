@@ -22,6 +22,44 @@ testOutput = {
     ]
 }
 
+@pytest.fixture
+def db():
+    """
+    Connect the models to an empty mongomock database, as pytest_girder does
+    with --mock-db.
+    """
+    import mongomock
+    from girderformindlogger import models
+    from girderformindlogger.external import mongodb_proxy
+    from girderformindlogger.models import model_base
+
+    executableMethods = mongodb_proxy.EXECUTABLE_MONGO_METHODS
+    realMongoClient = models.pymongo.MongoClient
+    clients = dict(models._dbClients)
+    mongodb_proxy.EXECUTABLE_MONGO_METHODS = set()
+    models.pymongo.MongoClient = mongomock.MongoClient
+    models._dbClients.clear()
+    connection = models.getDbConnection(
+        uri='mongodb://localhost:27017/girder_test_units', quiet=True)
+    models._dbClients[(None, None)] = connection
+    for model in model_base._modelSingletons:
+        model.reconnect()
+
+    yield connection
+
+    connection.drop_database('girder_test_units')
+    models._dbClients.clear()
+    models._dbClients.update(clients)
+    models.pymongo.MongoClient = realMongoClient
+    mongodb_proxy.EXECUTABLE_MONGO_METHODS = executableMethods
+
+
+@pytest.fixture
+def admin():
+    from bson.objectid import ObjectId
+    return {'_id': ObjectId(), 'login': 'admin', 'admin': True}
+
+
 @pytest.mark.parametrize(
     "args",
     [(testInput, testOutput)]
@@ -29,3 +67,1009 @@ testOutput = {
 def testDereference(args):
     from girderformindlogger.utility.jsonld_expander import dereference
     assert dereference(testInput)==testOutput, 'Dereferencing failed.'
+
+
+def testLocalCacheTier():
+    from girderformindlogger.models.cache import LocalCacheTier
+    tier = LocalCacheTier(maxBytes=4096)
+    tier.set('a', 1, {'x': 'a' * 1000})
+    tier.set('b', 1, {'x': 'b' * 1000})
+    cached = tier.get('a')
+    cached['x'] = 'mutated'
+    assert tier.get('a') == {'x': 'a' * 1000}, 'Local tier leaked a reference.'
+    assert tier.get('a', 2) is None, 'Local tier served a stale version.'
+    tier.set('c', 1, {'x': 'c' * 1000})
+    tier.set('d', 1, {'x': 'd' * 1000})
+    assert tier.get('b') is None, 'Least recently used entry was not evicted.'
+    assert tier.currentBytes <= tier.maxBytes
+    generation = tier.generation
+    tier.invalidate('a')
+    tier.set('a', 1, {'x': 'stale'}, generation=generation)
+    assert tier.get('a') is None, 'Racing reader repopulated an invalidated entry.'
+    stats = tier.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 3
+
+
+@pytest.mark.parametrize("format", ['json', 'bson', 'zlib'])
+def testCacheDataFormats(format):
+    import datetime
+    from bson.objectid import ObjectId
+    from girderformindlogger.models.cache import decodeCacheData,             \
+        encodeCacheData
+    data = {
+        'applet': {
+            '_id': 'applet/{}'.format(ObjectId()),
+            'http://schema.org/about': testOutput['http://schema.org/about']
+        },
+        'updated': datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    }
+    storedFormat, payload = encodeCacheData(data, format)
+    assert storedFormat == format
+    assert decodeCacheData(storedFormat, payload) == data, (
+        'Cache data did not round trip through {}.'.format(format)
+    )
+
+
+def testCacheDataFallsBackToJSON():
+    from girderformindlogger.models.cache import decodeCacheData,             \
+        encodeCacheData
+    storedFormat, payload = encodeCacheData({1: 'non-string key'}, 'zlib')
+    assert storedFormat == 'json'
+    assert decodeCacheData(storedFormat, payload) == {'1': 'non-string key'}
+    storedFormat, payload = encodeCacheData({'wide': 2 ** 70}, 'bson')
+    assert storedFormat == 'json'
+    assert decodeCacheData(storedFormat, payload) == {'wide': 2 ** 70}
+
+
+def testResponseDate():
+    import datetime
+    from girderformindlogger.models.response_date import ResponseDate
+    created = datetime.datetime(2020, 3, 4, 12)
+    assert ResponseDate.responseDate({'created': created}) == '2020-03-04'
+    assert ResponseDate.responseDate({
+        'created': created,
+        'meta': {'responseCompleted': '2020-03-05T01:00:00'}
+    }) == '2020-03-05'
+
+
+def testResponseDatesBackfillBeforeNewResponse(db):
+    import datetime
+    from bson.objectid import ObjectId
+    from girderformindlogger.models.response_date import ResponseDate
+    from girderformindlogger.models.response_folder import ResponseItem
+
+    userId, appletId = ObjectId(), ObjectId()
+
+    def response(day):
+        return {
+            'baseParentType': 'user',
+            'baseParentId': userId,
+            'created': datetime.datetime(2020, 3, day, 12),
+            'meta': {'applet': {'@id': appletId}}
+        }
+
+    # Responses stored before the index existed.
+    ResponseItem().collection.insert_many([response(1), response(2)])
+    new = response(5)
+    ResponseItem().collection.insert_one(new)
+    ResponseDate().addResponse(new)
+
+    assert ResponseDate().getDates(userId, [appletId]) == {
+        str(appletId): ['2020-03-05', '2020-03-02', '2020-03-01']}
+    ResponseDate().addResponse(response(7))
+    assert ResponseDate().getDates(userId, [appletId])[str(appletId)][0] == '2020-03-07'
+
+
+def testStreamResponseDataYieldsJsonLines():
+    import datetime
+    import json
+    from bson.objectid import ObjectId
+    from girderformindlogger.utility.response import dailyResponseRecords, \
+        streamResponseData
+
+    key = {'n': 'é', 'e': 3}
+    responses = [{
+        '_id': ObjectId(),
+        'meta': {
+            'subject': {'userTime': datetime.datetime(2020, 3, 4, 12)},
+            'responses': {'item/{}'.format(i): [i, 'é'] for i in range(2)},
+            'applet': {'version': '1.0.0'},
+            'userPublicKey': key,
+            'dataSource': 'encrypted{}'.format(n)
+        }
+    } for n in range(2)]
+
+    chunks = list(streamResponseData(responses, {}, dailyResponseRecords))
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    lines = b''.join(chunks).decode('utf8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['type'] for record in records] == [
+        'key', 'dataSource', 'response', 'response', 'dataSource',
+        'response', 'response']
+    assert records[0]['data'] == key
+    assert records[2]['value'] == [0, 'é']
+    assert records[2]['date'] == '2020-03-04T12:00:00'
+
+
+def testFirebaseNotificationRetries():
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from girderformindlogger.utility.notification import FirebaseNotification
+
+    attempts = []
+    unavailable = set()
+
+    class StubFCM(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(
+                self.rfile.read(int(self.headers['Content-Length'])))
+            ids = payload.get('registration_ids', [payload.get('to')])
+            attempts.append(ids[0])
+            throttle = attempts.count(ids[0]) == 1 or ids[0] in unavailable
+            body = json.dumps({
+                'success': len(ids),
+                'results': [{'message_id': id} for id in ids]
+            }).encode()
+            self.send_response(503 if throttle else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), StubFCM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        service = FirebaseNotification(
+            api_key='key', concurrency=4, backoff=0.01,
+            endpoint='http://127.0.0.1:{}'.format(server.server_port))
+        service.FCM_MAX_RECIPIENTS = 2
+        ids = ['device{}'.format(i) for i in range(7)]
+        result = service.notify_multiple_devices(
+            registration_ids=ids, message_body='test')
+        assert service.send_request_stats['retries'] == 4
+
+        # Results of a payload that failed for good keep their place.
+        unavailable.add('device2')
+        service.maxRetries = 1
+        failed = service.notify_multiple_devices(
+            registration_ids=ids, message_body='test')
+    finally:
+        server.shutdown()
+
+    assert result['success'] == 7 and result['failure'] == 0
+    assert [r['message_id'] for r in result['results']] == ids
+    assert failed['success'] == 5 and failed['failure'] == 2
+    assert failed['failed_requests'] == 1
+    assert [r.get('message_id', r.get('error')) for r in failed['results']] == [
+        'device0', 'device1', 'Unavailable', 'Unavailable', 'device4',
+        'device5', 'device6']
+
+
+def testOfflineDocumentLoader(tmp_path):
+    from girderformindlogger.exceptions import ResourcePathNotFound
+    from girderformindlogger.utility.document_loader import DocumentLoader
+    fixture = tmp_path / 'example.org' / 'protocols'
+    fixture.mkdir(parents=True)
+    (fixture / 'index').write_text('{"@id": "a", /* json5 */}')
+    loader = DocumentLoader(
+        cacheDir=str(tmp_path), offline=True, useCollection=False)
+    assert loader.loadJSON('https://example.org/protocols/') == {'@id': 'a'}
+    with pytest.raises(ResourcePathNotFound):
+        loader.fetch('https://example.org/missing.jsonld')
+
+
+def testDocumentLoaderRevalidatesOnRefresh():
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from girderformindlogger.utility.document_loader import DocumentLoader
+
+    documents = {'/a': ('"1"', '{"v": 1}'), '/b': ('"1"', '{"v": 1}')}
+    requests = []
+
+    class StubOrigin(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag, body = documents[self.path]
+            requests.append((self.path, self.headers.get('If-None-Match')))
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), StubOrigin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        loader = DocumentLoader(useCollection=False)
+        assert loader.loadJSON(url + '/a') == {'v': 1}
+        loader.prefetch([url + '/a', url + '/b'])
+        assert requests == [('/a', None), ('/b', None)]
+
+        # Within the ttl only a refresh contacts the origin, once per
+        # document however often it reads it.
+        documents['/b'] = ('"2"', '{"v": 2}')
+        assert loader.loadJSON(url + '/b') == {'v': 1}
+        with loader.revalidating():
+            loader.prefetch([url + '/a', url + '/b'])
+            with loader.revalidating():
+                assert loader.loadJSON(url + '/a') == {'v': 1}
+                assert loader.loadJSON(url + '/b') == {'v': 2}
+        with loader.revalidating(False):
+            assert loader.loadJSON(url + '/a') == {'v': 1}
+    finally:
+        server.shutdown()
+
+    assert sorted(requests[2:]) == [('/a', '"1"'), ('/b', '"1"')]
+
+
+def testKeyedExecutorDeduplicates():
+    import threading
+    from girderformindlogger.utility.background import KeyedExecutor
+    executor = KeyedExecutor(maxWorkers=2)
+    release = threading.Event()
+    runs = []
+
+    def work(key):
+        runs.append(key)
+        release.wait(5)
+
+    futures = [executor.submit(('profile', i % 2), work, i % 2) for i in range(10)]
+    release.set()
+    for future in futures:
+        future.result()
+    assert sorted(runs) == [0, 1]
+    assert executor.pending() == 0
+
+
+def testAuthCacheInvalidation():
+    from girderformindlogger.utility.auth_cache import AuthCache
+    cache = AuthCache(ttl=30, maxEntries=2)
+    loads = []
+
+    def loadUser():
+        loads.append('user')
+        return {'_id': 'u1', 'firstName': 'A'}
+
+    cache.get('t1', 'token', lambda: {'_id': 't1', 'userId': 'u1'})
+    cache.get('t1', 'user', loadUser)['firstName'] = 'changed'
+    assert cache.get('t1', 'user', loadUser)['firstName'] == 'A'
+    assert loads == ['user']
+    cache.invalidateUser('u1')
+    cache.get('t1', 'user', loadUser)
+    assert loads == ['user', 'user']
+    for tokenId in ('t2', 't3'):
+        cache.get(tokenId, 'token', lambda: {'_id': tokenId, 'userId': 'u2'})
+    assert cache.stats()['entries'] == 2
+
+
+def testCompiledRoutePrecedence():
+    from girderformindlogger.api.rest import Resource, RestException
+    resource = Resource()
+    resource.resourceName = 'thing'
+
+    def handler(**kwargs):
+        pass
+    handler.description = None
+    handler.accessLevel = 'public'
+
+    # Literals in later positions are inserted before earlier wildcards.
+    resource.route('GET', ('y', ':b'), handler)
+    resource.route('GET', (':a', 'x'), handler)
+    route, _, kwargs, events = resource._matchCompiledRoute('get', ('y', 'x'))
+    assert route == (':a', 'x') and kwargs == {'a': 'y'}
+    assert events == ('rest.get.thing/:a/x.before', 'rest.get.thing/:a/x.after')
+    assert resource._matchRoute('get', ('y', 'z'))[2] == {'b': 'z'}
+
+    resource.removeRoute('GET', (':a', 'x'))
+    assert resource._matchRoute('get', ('y', 'x'))[0] == ('y', ':b')
+    with pytest.raises(RestException):
+        resource._matchRoute('get', ('z', 'x'))
+
+
+def testEventPatternsAndFastPath():
+    from girderformindlogger import events
+    calls = []
+    assert events.trigger('test.unbound.event').responses == ()
+
+    events.bind('test.pattern.*', 'pattern', lambda e: calls.append(('pattern', e.name)))
+    events.bind('test.pattern.save', 'exact', lambda e: e.addResponse('exact'))
+    events.enableHandlerTiming()
+    try:
+        event = events.trigger('test.pattern.save')
+        assert event.responses == ['exact']
+        assert calls == [('pattern', 'test.pattern.save')]
+        events.unbind('test.pattern.*', 'pattern')
+        events.trigger('test.pattern.save')
+        assert len(calls) == 1
+        assert {t['handler']: t['calls'] for t in events.handlerTimings()} == {
+            'pattern': 1, 'exact': 2}
+    finally:
+        events.enableHandlerTiming(False)
+        events.unbind('test.pattern.save', 'exact')
+    assert events.trigger('test.pattern.save').responses == ()
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson'])
+def testJsonEncoders(name):
+    import datetime
+    import json
+    from bson.objectid import ObjectId
+    from girderformindlogger.utility import json_encoding
+
+    if name == 'orjson':
+        pytest.importorskip('orjson')
+    encoder = json_encoding.createJsonEncoder(name)
+    assert encoder.name == name
+    val = {
+        'b': ObjectId('5f0e3bd2e4a4ac2d8f6d8a3c'),
+        'a': [datetime.datetime(2020, 7, 1, 12, 30, 5, 120000), {3}, 2 ** 70],
+        1: None
+    }
+    assert json.loads(encoder.encode(val).decode('utf8')) == {
+        'b': '5f0e3bd2e4a4ac2d8f6d8a3c',
+        'a': ['2020-07-01T12:30:05.120000+00:00', [3], 2 ** 70],
+        '1': None
+    }
+    blob = json_encoding.JsonBlob(b'{"z":1,"a":2}')
+    assert json_encoding.encodeJson(blob) is blob
+
+
+def testCheckETag():
+    import cherrypy
+    from cherrypy.lib.httputil import HeaderMap
+    from girderformindlogger.api.rest import checkETag, makeETag
+
+    etag = makeETag('5f0e3bd2e4a4ac2d8f6d8a3c', {'b': 1, 'a': [2]})
+    assert etag == makeETag('5f0e3bd2e4a4ac2d8f6d8a3c', {'a': [2], 'b': 1})
+    cherrypy.request.headers = HeaderMap({'If-None-Match': '"other"'})
+    cherrypy.response.headers = HeaderMap()
+    checkETag(etag)
+    assert cherrypy.response.headers['ETag'] == etag
+    cherrypy.request.headers['If-None-Match'] = '"other", W/%s' % etag
+    with pytest.raises(cherrypy.HTTPRedirect) as redirect:
+        checkETag(etag)
+    assert redirect.value.status == 304
+
+
+def testNotificationDispatcherWakesRecipient():
+    from bson.objectid import ObjectId
+    from girderformindlogger.utility.notification_dispatcher import (
+        NotificationDispatcher, recipientKey)
+
+    dispatcher = NotificationDispatcher()
+    user, other = {'_id': ObjectId()}, {'_id': ObjectId()}
+    with dispatcher.waiter(recipientKey(user)) as wakeup, \
+            dispatcher.waiter(recipientKey(other)) as otherWakeup:
+        assert dispatcher.streams() == 2
+        # Without Redis the streams of this process are woken directly.
+        dispatcher.publish({'userId': user['_id']})
+        assert wakeup.is_set()
+        assert not otherWakeup.is_set()
+    assert dispatcher.streams() == 0
+
+
+def testPartRanges():
+    from girderformindlogger.exceptions import ValidationException
+    from girderformindlogger.utility.abstract_assetstore_adapter import \
+        AbstractAssetstoreAdapter
+
+    adapter = AbstractAssetstoreAdapter({})
+    upload = {'size': 25, 'partSize': 10}
+    assert [adapter.getPartRange(upload, part) for part in range(3)] == [
+        (0, 10), (10, 10), (20, 5)]
+    for part in (-1, 3):
+        with pytest.raises(ValidationException):
+            adapter.getPartRange(upload, part)
+
+
+@pytest.mark.parametrize('offload', ['x-accel-redirect', 'X-Sendfile'])
+def testOffloadDownload(db, tmp_path, monkeypatch, offload):
+    import cherrypy
+    import os
+    from cherrypy.lib.httputil import HeaderMap
+    from girderformindlogger import events
+    from girderformindlogger.models.file import File
+    from girderformindlogger.utility import config
+    from girderformindlogger.utility.filesystem_assetstore_adapter import \
+        FilesystemAssetstoreAdapter
+
+    header = 'X-Accel-Redirect' if offload == 'x-accel-redirect' else 'X-Sendfile'
+    monkeypatch.setitem(config.getConfig(), 'server', dict(
+        config.getConfig().get('server', {}), download_offload=offload,
+        download_offload_prefix='/protected/'))
+    (tmp_path / 'ab cd').mkdir()
+    (tmp_path / 'ab cd' / 'f#1').write_bytes(b'0123456789')
+    (tmp_path / 'imported').write_bytes(b'abcdefghij')
+    adapter = FilesystemAssetstoreAdapter({'root': str(tmp_path)})
+    monkeypatch.setattr(File, 'getAssetstoreAdapter', lambda self, file: adapter)
+    stored = {'_id': 'f1', 'assetstoreId': 'a', 'name': 'f.txt', 'size': 10,
+              'mimeType': 'text/plain', 'path': os.path.join('ab cd', 'f#1')}
+    imported = dict(stored, _id='f2', imported=True, path=str(tmp_path / 'imported'))
+    completed = []
+
+    def download(file, **kwargs):
+        cherrypy.response.headers = HeaderMap()
+        body = b''.join(File().download(file, **kwargs)())
+        return body, cherrypy.response.headers
+
+    events.bind('model.file.download.complete', 'test_offload',
+                lambda event: completed.append(event.info['file']['_id']))
+    try:
+        cherrypy.request.headers = HeaderMap()
+        body, headers = download(stored)
+        assert body == b''
+        assert headers['Content-Type'] == 'text/plain'
+        assert headers['Content-Disposition'].startswith('attachment')
+        assert header in headers
+        assert not {'X-Accel-Redirect', 'X-Sendfile'} - {header} & set(headers)
+        if header == 'X-Accel-Redirect':
+            assert headers[header] == '/protected/ab%20cd/f%231'
+        else:
+            assert headers[header] == str(tmp_path / 'ab cd' / 'f#1')
+
+        # The proxy only honours the Range header, so a range given only as
+        # parameters is streamed from here.
+        body, headers = download(stored, offset=2, endByte=5)
+        assert body == b'234' and header not in headers
+        cherrypy.request.headers['Range'] = 'bytes=2-4'
+        body, headers = download(stored, offset=2, endByte=5)
+        assert body == b'' and header in headers
+
+        # Imported files are outside the location the proxy serves.
+        cherrypy.request.headers = HeaderMap()
+        body, headers = download(imported)
+        if header == 'X-Accel-Redirect':
+            assert body == b'abcdefghij' and header not in headers
+        else:
+            assert body == b'' and headers[header] == str(tmp_path / 'imported')
+    finally:
+        events.unbind('model.file.download.complete', 'test_offload')
+
+    assert completed == ['f1', 'f2']
+
+
+def testLoadAppletsSkipsMigratedApplets(db, admin, monkeypatch):
+    from girderformindlogger.models.applet import Applet
+    from girderformindlogger.models.collection import Collection
+    from girderformindlogger.models.folder import Folder
+
+    applets = Collection().createCollection('Applets', admin)
+    migrated = Folder().createFolder(
+        applets, 'migrated', parentType='collection', creator=admin)
+    stale = Folder().createFolder(
+        applets, 'stale', parentType='collection', creator=admin)
+    Folder().update({'_id': stale['_id']}, {'$unset': {'lowerName': 1}})
+
+    loaded = []
+    load = Applet.load
+
+    def countingLoad(self, id, *args, **kwargs):
+        loaded.append(id)
+        return load(self, id, *args, **kwargs)
+    monkeypatch.setattr(Applet, 'load', countingLoad)
+
+    docs = Applet().loadApplets(
+        [stale['_id'], str(migrated['_id'])], force=True)
+    assert [doc['_id'] for doc in docs] == [stale['_id'], migrated['_id']]
+    assert all(doc['_modelType'] == 'folder' for doc in docs)
+    assert loaded == [stale['_id']]
+
+
+def testFolderAncestors(db, admin):
+    from bson.objectid import ObjectId
+    from girderformindlogger.exceptions import ValidationException
+    from girderformindlogger.models.collection import Collection
+    from girderformindlogger.models.folder import Folder
+
+    def ancestors(folder):
+        return [(ancestor['type'], ancestor['_id'], ancestor.get('name'))
+                for ancestor in Folder().findOne({'_id': folder['_id']})['ancestors']]
+
+    source = Collection().createCollection('source', admin)
+    target = Collection().createCollection('target', admin)
+    a = Folder().createFolder(source, 'a', parentType='collection', creator=admin)
+    b = Folder().createFolder(a, 'b', creator=admin)
+    c = Folder().createFolder(b, 'c', creator=admin)
+    x = Folder().createFolder(target, 'x', parentType='collection', creator=admin)
+    assert ancestors(c) == [
+        ('collection', source['_id'], 'source'),
+        ('folder', a['_id'], 'a'), ('folder', b['_id'], 'b')]
+
+    with pytest.raises(ValidationException):
+        Folder().move(a, c, 'folder')
+    b = Folder().move(b, x, 'folder')
+    assert ancestors(b) == [
+        ('collection', target['_id'], 'target'), ('folder', x['_id'], 'x')]
+    assert ancestors(c) == ancestors(b) + [('folder', b['_id'], 'b')]
+
+    b['name'] = 'renamed'
+    Folder().updateFolder(b)
+    target['name'] = 'moved'
+    Collection().updateCollection(target)
+    assert ancestors(c) == [
+        ('collection', target['_id'], 'moved'),
+        ('folder', x['_id'], 'x'), ('folder', b['_id'], 'renamed')]
+    assert ancestors(a) == [('collection', source['_id'], 'source')]
+
+    expected = ancestors(c)
+    Folder().update({}, {'$unset': {'ancestors': True}})
+    orphan = Folder().collection.insert_one({
+        'name': 'orphan', 'parentId': ObjectId(), 'parentCollection': 'folder'
+    }).inserted_id
+    assert Folder().backfillAncestors() == (4, [orphan])
+    assert ancestors(c) == expected
+    assert ancestors(x) == [('collection', target['_id'], 'moved')]
+
+
+def testCreateItemsNames(db, admin):
+    from girderformindlogger.models.collection import Collection
+    from girderformindlogger.models.folder import Folder
+    from girderformindlogger.models.item import Item
+
+    collection = Collection().createCollection('items', admin)
+    folder = Folder().createFolder(
+        collection, 'folder', parentType='collection', creator=admin)
+    other = Folder().createFolder(
+        collection, 'other', parentType='collection', creator=admin)
+    Item().createItem('a', admin, folder)
+    Item().createItem('a (2)', admin, folder)
+    Folder().createFolder(folder, 'b', creator=admin)
+
+    items = Item().createItems([
+        {'name': name, 'folder': parent, 'meta': {'n': n}}
+        for n, (name, parent) in enumerate([
+            ('a', folder), ('a', folder), ('b', folder), ('c', folder),
+            ('c', folder), ('a', other), ('a.*', folder)])
+    ], admin)
+    assert [item['name'] for item in items] == [
+        'a (1)', 'a (3)', 'b (1)', 'c', 'c (1)', 'a', 'a.*']
+    assert [item['meta']['n'] for item in items] == list(range(7))
+    stored = {item['_id']: item for item in Item().find({
+        '_id': {'$in': [item['_id'] for item in items]}})}
+    assert [stored[item['_id']]['lowerName'] for item in items] == [
+        'a (1)', 'a (3)', 'b (1)', 'c', 'c (1)', 'a', 'a.*']
+    assert all(stored[item['_id']]['folderId'] == item['folderId'] and
+               stored[item['_id']]['baseParentId'] == collection['_id']
+               for item in items)
+
+
+def testInsertManyEvents(db, admin):
+    from girderformindlogger import events
+    from girderformindlogger.models.collection import Collection
+    from girderformindlogger.models.folder import Folder
+    from girderformindlogger.models.item import Item
+
+    collection = Collection().createCollection('events', admin)
+    folder = Folder().createFolder(
+        collection, 'folder', parentType='collection', creator=admin)
+    triggered = []
+
+    def skip(event):
+        triggered.append(('save', event.info['name']))
+        if event.info['name'] == 'skipped':
+            event.preventDefault()
+
+    events.bind('model.item.save', 'test.insertMany', skip)
+    events.bind('model.item.save.created', 'test.insertMany',
+                lambda event: triggered.append(('created', event.info['_id'])))
+    events.bind('model.item.save.after', 'test.insertMany',
+                lambda event: triggered.append(('after', event.info['_id'])))
+    try:
+        items = Item().createItems([
+            {'name': name, 'folder': folder}
+            for name in ('first', 'skipped', 'second')
+        ], admin)
+    finally:
+        for name in ('model.item.save', 'model.item.save.created',
+                     'model.item.save.after'):
+            events.unbind(name, 'test.insertMany')
+
+    assert [item['name'] for item in items] == ['first', 'second']
+    assert triggered == [('save', 'first'), ('save', 'skipped'), ('save', 'second')] + [
+        (event, item['_id']) for item in items for event in ('created', 'after')]
+    assert len(list(Item().find({'folderId': folder['_id']}))) == 2
+
+
+class _StubAuditLogCollection(object):
+    """
+    Records the batches inserted by an AuditLogWriter. Inserts wait for
+    ``release`` to be set, like a slow database.
+    """
+
+    def __init__(self):
+        import threading
+        self.batches = []
+        self.inserting = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_many(self, records, ordered=True):
+        self.inserting.set()
+        self.release.wait(5)
+        if any('invalid' in record for record in records):
+            from bson.errors import InvalidDocument
+            raise InvalidDocument('cannot encode object')
+        self.batches.append([record['n'] for record in records])
+
+
+def _waitFor(condition, timeout=5):
+    import time
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def testAuditLogWriterBatches():
+    writerModule = pytest.importorskip('girder_audit_logs.writer')
+    collection = _StubAuditLogCollection()
+    writer = writerModule.AuditLogWriter(
+        collection, batchSize=3, flushInterval=0.2)
+    assert writer.blockTimeout == writerModule.DEFAULT_BLOCK_TIMEOUT
+
+    writer.start()
+    for n in range(7):
+        assert writer.put({'n': n})
+    # The last record is written once the flush interval is over.
+    assert _waitFor(lambda: writer.metrics()['written'] == 7)
+    assert collection.batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+    writer.flushInterval = 60
+    writer.put({'n': 7})
+    writer.put({'n': 8})
+    writer.stop(timeout=5)
+    assert not writer.is_alive()
+    assert collection.batches[-1] == [7, 8]
+    # Once stopped, records are written right away.
+    writer.put({'n': 9})
+    assert collection.batches[-1] == [9]
+    metrics = writer.metrics()
+    assert metrics['written'] == 10 and metrics['batches'] == 5
+
+
+def testAuditLogWriterFailuresAndStop():
+    writerModule = pytest.importorskip('girder_audit_logs.writer')
+    collection = _StubAuditLogCollection()
+    writer = writerModule.AuditLogWriter(
+        collection, batchSize=2, flushInterval=0.05)
+    writer.start()
+    # A batch that can't be encoded is counted as failed.
+    writer.put({'n': -1, 'invalid': True})
+    assert _waitFor(lambda: writer.metrics()['failed'] == 1)
+    assert writer.is_alive()
+
+    collection.release.clear()
+    collection.inserting.clear()
+    writer.put({'n': 0})
+    assert collection.inserting.wait(5)
+    # Records queued behind the stop request are written too.
+    writer.queue.put(writerModule._STOP)
+    for record in ({'n': 1}, {'n': 2, 'invalid': True}, {'n': 3}):
+        writer.put(record)
+    collection.release.set()
+    writer.join(5)
+    assert not writer.is_alive()
+    assert collection.batches == [[0], [3]]
+    metrics = writer.metrics()
+    assert metrics['written'] == 2 and metrics['failed'] == 3
+
+
+@pytest.mark.parametrize('policy', ['block', 'drop', 'sample'])
+def testAuditLogWriterFullQueue(policy):
+    import time
+    writerModule = pytest.importorskip('girder_audit_logs.writer')
+    collection = _StubAuditLogCollection()
+    collection.release.clear()
+    writer = writerModule.AuditLogWriter(
+        collection, batchSize=1, queueSize=4, policy=policy, sampleRate=0,
+        blockTimeout=0.05)
+    writer.start()
+    try:
+        writer.put({'n': 0})
+        assert collection.inserting.wait(5)
+        queued = [writer.put({'n': n}) for n in range(1, 5)]
+        start = time.time()
+        assert not writer.put({'n': 5})
+        elapsed = time.time() - start
+    finally:
+        collection.release.set()
+        writer.stop(timeout=5)
+
+    metrics = writer.metrics()
+    if policy == 'sample':
+        # Once the queue is half full, records are sampled out.
+        assert queued == [True, True, False, False]
+        assert metrics['sampled'] == 3 and metrics['dropped'] == 0
+        assert metrics['written'] == 3
+    else:
+        assert queued == [True] * 4
+        assert metrics['dropped'] == 1 and metrics['written'] == 5
+    if policy == 'block':
+        assert 0.04 <= elapsed < 1
+    else:
+        assert elapsed < 0.05
+
+
+class _StubGirderServer(object):
+    """
+    Answers the requests a GirderClient sends for one file, ``f1``, and for
+    uploads in parts.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+        self.parts = {}
+
+    def __call__(self, method, path, parameters=None, data=None, jsonResp=True, **kwargs):
+        import types
+        self.requests.append((method.upper(), path, parameters))
+        if path == 'file/f1':
+            return {'_id': 'f1', 'name': 'f1', 'size': len(self.data),
+                    'created': 'c', 'updated': 'u'}
+        if path == 'file/f1/download':
+            content = self.data[(parameters or {}).get('offset', 0):]
+            return types.SimpleNamespace(iter_content=lambda chunk_size: [
+                content[i:i + chunk_size] for i in range(0, len(content), chunk_size)])
+        if path == 'file/offset':
+            return {'parts': sorted(self.parts)}
+        if path == 'file/chunk':
+            self.parts[parameters['part']] = data
+            return {}
+        if path == 'file/completion':
+            self.data = b''.join(self.parts[part] for part in sorted(self.parts))
+            return {'_id': 'f1'}
+        raise AssertionError('Unexpected request %s %s' % (method, path))
+
+
+def testTransferJournalTruncatedLine(tmp_path):
+    transfer = pytest.importorskip('girder_client.transfer')
+    path = str(tmp_path / 'journal')
+    with open(path, 'w') as fh:
+        fh.write('{"key": "a", "size": 1}\n{"key": "a", "size": 2}\n{"key": "b", "si')
+
+    journal = transfer.TransferJournal(path)
+    assert journal.get('a') == {'key': 'a', 'size': 2}
+    assert journal.get('b') is None
+    journal.set('b', size=3)
+    journal.close()
+    journal = transfer.TransferJournal(path)
+    assert journal.get('b') == {'key': 'b', 'size': 3}
+    journal.close()
+
+
+def testResumableDownload(tmp_path, monkeypatch):
+    import os
+    transfer = pytest.importorskip('girder_client.transfer')
+    import girder_client
+
+    data = os.urandom(1000)
+    server = _StubGirderServer(data)
+    gc = girder_client.GirderClient(apiUrl='http://localhost/api/v1')
+    monkeypatch.setattr(gc, 'sendRestRequest', server)
+    path = str(tmp_path / 'f1')
+    journalPath = str(tmp_path / 'journal')
+
+    # An interrupted run left the start of the file.
+    with open(path + '.part', 'wb') as fh:
+        fh.write(data[:400])
+    journal = transfer.TransferJournal(journalPath)
+    journal.set(transfer.downloadKey('f1', path), size=len(data), updated='u')
+    journal.close()
+    with gc.transfers(journal=journalPath):
+        gc.downloadFile('f1', path)
+    assert ('GET', 'file/f1/download', {'offset': 400}) in server.requests
+    assert not os.path.exists(path + '.part')
+    with open(path, 'rb') as fh:
+        assert fh.read() == data
+
+    # Completed downloads are skipped.
+    server.requests = []
+    with gc.transfers(journal=journalPath):
+        gc.downloadFile('f1', path)
+    assert server.requests == []
+
+
+def testResumableUpload(tmp_path, monkeypatch):
+    import os
+    transfer = pytest.importorskip('girder_client.transfer')
+    import girder_client
+
+    data = os.urandom(1000)
+    server = _StubGirderServer(b'')
+    gc = girder_client.GirderClient(apiUrl='http://localhost/api/v1')
+    monkeypatch.setattr(gc, 'sendRestRequest', server)
+    path = str(tmp_path / 'f1')
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    journalPath = str(tmp_path / 'journal')
+
+    # An interrupted run sent parts 0 and 2.
+    server.parts = {0: data[:300], 2: data[600:900]}
+    journal = transfer.TransferJournal(journalPath)
+    journal.set(transfer.uploadKey(path, 'folder', 'folder1'),
+                uploadId='upload1', partSize=300)
+    journal.close()
+    with gc.transfers(jobs=2, journal=journalPath):
+        gc.uploadFileToFolder('folder1', path)
+    assert sorted(
+        parameters['part'] for method, path_, parameters in server.requests
+        if path_ == 'file/chunk') == [1, 3]
+    assert server.data == data
+
+    # Completed uploads are skipped.
+    server.requests = []
+    with gc.transfers(journal=journalPath):
+        assert gc.uploadFileToFolder('folder1', path)['_id'] == 'f1'
+    assert [path_ for method, path_, parameters in server.requests] == ['file/f1']
+
+
+def testMaterializedSchedules(db):
+    import calendar
+    import copy
+    import datetime
+    from bson.objectid import ObjectId
+    from girderformindlogger.models.event_schedule import EventSchedule
+    from girderformindlogger.models.events import Events, SCHEDULE_WINDOW_DAYS
+    from girderformindlogger.models.profile import Profile
+
+    today = datetime.datetime.combine(
+        datetime.datetime.utcnow().date(), datetime.time())
+
+    def ms(day):
+        return calendar.timegm(day.timetuple()) * 1000
+
+    appletId, otherAppletId, userId = ObjectId(), ObjectId(), ObjectId()
+    stored = []
+    profileId = Profile().collection.insert_one({
+        'appletId': appletId, 'userId': userId, 'individual_events': 1
+    }).inserted_id
+    Profile().collection.insert_one({
+        'appletId': otherAppletId, 'userId': userId, 'individual_events': 0})
+    for applet, individualized, data, schedule in [
+        (appletId, False, {'eventType': ''}, {
+            'year': [today.year], 'month': [today.month - 1],
+            'dayOfMonth': [today.day], 'times': ['09:00']}),
+        (appletId, True, {'eventType': 'Weekly', 'users': [profileId]}, {
+            'dayOfWeek': [(today.weekday() + 1) % 7],
+            'start': ms(today - datetime.timedelta(days=10))}),
+        (appletId, True, {'eventType': 'Daily', 'completion': True, 'users': [profileId]}, {
+            'end': ms(today - datetime.timedelta(days=3))}),
+        (otherAppletId, False, {'eventType': 'Monthly'}, {'dayOfMonth': [1]}),
+        (otherAppletId, False, {'eventType': 'Daily'}, {
+            'start': ms(today + datetime.timedelta(days=2))})
+    ]:
+        stored.append(copy.deepcopy(Events().save({
+            'applet_id': applet, 'individualized': individualized,
+            'data': dict(data, activity_id=ObjectId()), 'schedule': schedule})))
+    for applet in (appletId, otherAppletId):
+        Events().refreshSchedules(applet)
+
+    def expected(applet, day):
+        # What getScheduleForUser computed from the events every time.
+        individualized = applet == appletId
+        return Events()._filterUserSchedule([{
+            '_id': event['_id'],
+            'data': {key: value for key, value in event['data'].items() if key != 'users'},
+            'schedule': event['schedule']
+        } for event in copy.deepcopy(stored) if event['applet_id'] == applet and
+            event['individualized'] == individualized], day)
+
+    def scheduleDays(applet, profile):
+        return EventSchedule().findOne({
+            'applet_id': applet, 'profile_id': profile})['days']
+
+    # Stored when the events changed a while ago.
+    EventSchedule().collection.update_many({}, {'$set': {'days': {'2000-01-01': []}}})
+    for offset in (-1, 0, 2, 5, 40):
+        day = today + datetime.timedelta(days=offset)
+        schedules = Events().getSchedulesForUser([appletId, otherAppletId], userId, day)
+        assert schedules == {
+            str(applet): expected(applet, day) for applet in (appletId, otherAppletId)}
+    # The window rolled forward and days outside of it were not stored.
+    for applet, profile in ((appletId, profileId), (otherAppletId, None)):
+        days = scheduleDays(applet, profile)
+        assert len(days) == SCHEDULE_WINDOW_DAYS
+        assert min(days) == (today - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def testServerFuseReads():
+    import io
+    import threading
+    pytest.importorskip('fuse')
+    from girderformindlogger import events
+    from girderformindlogger.cli.mount import PATH_MODELS, ServerFuse
+
+    class Handle(io.BytesIO):
+        def read(self, size=-1):
+            reads.append((self.tell(), size))
+            return io.BytesIO.read(self, size)
+
+    data = bytes(range(22))
+    reads = []
+    ops = ServerFuse(blockSize=4, maxReadAhead=2)
+    info = ops.openFiles[1] = {
+        'file': {'_id': 'f', 'sha512': 'abc', 'size': len(data)},
+        'handle': Handle(data), 'lock': threading.Lock(),
+        'nextOffset': 0, 'readAhead': 0}
+    try:
+        # Sequential reads read ahead, twice as far each time up to the limit.
+        assert ops.read('/f', 3, 0, 1) == data[0:3]
+        assert info['readAhead'] == 1 and reads == [(0, 8)]
+        assert ops.read('/f', 6, 3, 1) == data[3:9]
+        assert info['readAhead'] == 2 and reads[1:] == [(8, 12)]
+        # Reads from cached blocks don't touch the file.
+        assert ops.read('/f', 10, 0, 1) == data[0:10]
+        assert len(reads) == 2
+
+        # A seek stops the read-ahead; reads stop at the end of the file.
+        assert ops.read('/f', 10, 18, 1) == data[18:22]
+        assert info['readAhead'] == 0 and reads[2:] == [(20, 4)]
+        assert ops.read('/f', 10, 22, 1) == b''
+        assert ops.read('/f', 4, 19, 1) == data[19:22]
+        assert len(reads) == 3
+        assert ops.cacheStats()['blocks']['blocks'] == 6
+    finally:
+        for model in PATH_MODELS:
+            for event in ('save.after', 'remove'):
+                events.unbind('model.%s.%s' % (model, event), 'server_fuse.cache')
+
+
+def testServerFusePathCache(monkeypatch):
+    import errno
+    fuse = pytest.importorskip('fuse')
+    from girderformindlogger import events
+    from girderformindlogger.cli.mount import PATH_MODELS, ServerFuse
+    from girderformindlogger.utility import path as path_util
+
+    collection = {'_id': 'c', 'name': 'c'}
+    folder = {'_id': 'f', 'name': 'f'}
+    lookups = []
+
+    def lookUpPath(path, user=None, filter=True, force=False):
+        lookups.append(path)
+        if path != '/collection/c':
+            raise path_util.NotFoundException(path)
+        return {'model': 'collection', 'document': collection}
+
+    def lookUpToken(token, parentType, parent):
+        lookups.append(token)
+        if token != 'f':
+            raise path_util.NotFoundException(token)
+        return folder, 'folder'
+
+    monkeypatch.setattr(path_util, 'lookUpPath', lookUpPath)
+    monkeypatch.setattr(path_util, 'lookUpToken', lookUpToken)
+    ops = ServerFuse(pathTtl=60)
+    try:
+        for _ in range(3):
+            assert ops.getattr('/collection/c/f')['st_size'] == 0
+            # Paths that don't exist are cached too.
+            with pytest.raises(fuse.FuseOSError) as exc:
+                ops.getattr('/collection/c/missing')
+            assert exc.value.errno == errno.ENOENT
+        assert lookups == ['/collection/c', 'f', 'missing']
+
+        for event in ('model.folder.save.after', 'model.item.remove'):
+            events.trigger(event, {})
+            ops.getattr('/collection/c/f')
+            with pytest.raises(fuse.FuseOSError):
+                ops.getattr('/collection/c/missing')
+        assert lookups[3:] == ['/collection/c', 'f', 'missing'] * 2
+        assert ops.cacheStats()['paths']['entries'] == 3
+    finally:
+        for model in PATH_MODELS:
+            for event in ('save.after', 'remove'):
+                events.unbind('model.%s.%s' % (model, event), 'server_fuse.cache')